@@ -0,0 +1,205 @@
+"""
+Memory-mapped approximate nearest neighbour (ANN) vector store.
+
+The default SimpleVectorStore keeps every embedding as a Python list parsed
+from JSON in each worker and scores queries by brute force. This store keeps
+unit-normalized vectors in one contiguous float16/float32 .npy file that is
+memory-mapped read-only, so worker processes share the OS page cache instead
+of each holding a copy, and an IVF (inverted file) layout limits each query
+to the `nprobe` clusters closest to it.
+
+Layout of an ANN directory:
+    meta.json      kind ("flat" | "ivf"), dtype, dim, count, source hash
+    ids.npy        node id for each row of vectors.npy (fixed-width bytes, memory-mapped)
+    vectors.npy    normalized vectors; for IVF, rows are grouped by cluster
+    ivf.npz        IVF only: centroids and per-cluster row offsets
+    nodes.sqlite   binary storage format only: node text and metadata (see node_store.py)
+"""
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from node_store import NODE_STORE_FILE, write_node_store
+
+logger = logging.getLogger("ann-store")
+
+ANN_KINDS = ("flat", "ivf")
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLES_PER_LIST = 64
+SCORE_BATCH_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) for each row, in bounded-size batches."""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCORE_BATCH_ROWS):
+        batch = vectors[start:start + SCORE_BATCH_ROWS]
+        assign[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the (normalized) vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        # Re-seed empty clusters from random sample rows
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def build_ann(
+    node_ids: list,
+    vectors,
+    out_dir: Path,
+    kind: str = "ivf",
+    dtype: str = "float16",
+    nlist: int = 0,
+    source_hash: str = "",
+    nodes=None,
+):
+    """Write an ANN directory for the given node ids and embeddings.
+
+    nlist=0 picks ~sqrt(count) clusters. If nodes is given, they are written
+    to nodes.sqlite as well. The directory is replaced atomically.
+    """
+    if kind not in ANN_KINDS:
+        raise ValueError(f"Unknown ANN kind '{kind}', expected one of {ANN_KINDS}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    # An empty corpus has no dimension to infer
+    vectors = _normalize(vectors.reshape(len(node_ids), -1) if len(node_ids) else vectors.reshape(0, 0))
+    node_ids = list(node_ids)
+
+    # Per process, so a second writer never deletes this one's half-written files
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    meta = {
+        "kind": kind,
+        "dtype": dtype,
+        "dim": int(vectors.shape[1]) if len(node_ids) else 0,
+        "count": len(node_ids),
+        "source_hash": source_hash,
+        "has_nodes": nodes is not None,
+    }
+    if kind == "ivf" and len(node_ids):
+        nlist = min(nlist or max(1, int(np.sqrt(len(node_ids)))), len(node_ids))
+        centroids = _kmeans(vectors, nlist)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        vectors, node_ids = vectors[order], [node_ids[i] for i in order]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        np.savez(tmp_dir / "ivf.npz", centroids=centroids, offsets=offsets)
+        meta["nlist"] = nlist
+
+    np.save(tmp_dir / "vectors.npy", np.ascontiguousarray(vectors, dtype=dtype))
+    np.save(tmp_dir / "ids.npy", np.array([node_id.encode() for node_id in node_ids], dtype=np.bytes_))
+    if nodes is not None:
+        write_node_store(nodes, tmp_dir / NODE_STORE_FILE)
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = out_dir.with_name(f"{out_dir.name}.old-{os.getpid()}")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Wrote {meta['kind']} ANN index with {meta['count']} vectors ({dtype}) to '{out_dir}'")
+
+
+def read_meta(ann_dir: Path) -> dict:
+    """Return an ANN directory's meta.json, or {} if there is none."""
+    meta_path = ann_dir / "meta.json"
+    if not meta_path.exists():
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class AnnIndex:
+    """Read-only, memory-mapped view of an ANN directory."""
+
+    def __init__(self, ann_dir: Path):
+        self.meta = read_meta(ann_dir)
+        if not self.meta:
+            raise FileNotFoundError(f"No ANN index at '{ann_dir}'. Run `python ingest.py` to build it.")
+        self.node_ids = np.load(ann_dir / "ids.npy", mmap_mode="r")
+        self.vectors = np.load(ann_dir / "vectors.npy", mmap_mode="r")
+        self.centroids = None
+        if (ann_dir / "ivf.npz").exists():
+            with np.load(ann_dir / "ivf.npz") as ivf:
+                self.centroids = ivf["centroids"]
+                self.offsets = ivf["offsets"]
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def _score_rows(self, query: np.ndarray, start: int, end: int):
+        for batch_start in range(start, end, SCORE_BATCH_ROWS):
+            batch_end = min(batch_start + SCORE_BATCH_ROWS, end)
+            # Upcast per batch: numpy has no BLAS path for float16 matmul
+            yield batch_start, np.asarray(self.vectors[batch_start:batch_end], dtype=np.float32) @ query
+
+    def search(self, query, top_k: int, nprobe: int = 8) -> list:
+        """Return [(node_id, cosine similarity)] for the top_k nearest vectors."""
+        if not len(self.node_ids):
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32))
+        if self.centroids is not None:
+            nprobe = min(nprobe, len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            ranges = [(self.offsets[i], self.offsets[i + 1]) for i in lists]
+        else:
+            ranges = [(0, len(self.node_ids))]
+
+        rows, scores = [], []
+        for start, end in ranges:
+            for batch_start, batch_scores in self._score_rows(query, start, end):
+                rows.append(np.arange(batch_start, batch_start + len(batch_scores)))
+                scores.append(batch_scores)
+        if not rows:
+            return []
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.node_ids[rows[i]].decode(), float(scores[i])) for i in best]
+
+
+class AnnRetriever(BaseRetriever):
+    """LlamaIndex retriever over an AnnIndex, fetching node text from a docstore."""
+
+    def __init__(self, ann: AnnIndex, docstore, embed_model, top_k: int, nprobe: int = 8):
+        super().__init__()
+        self._ann = ann
+        self._docstore = docstore
+        self._embed_model = embed_model
+        self._top_k = top_k
+        self._nprobe = nprobe
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        embedding = query_bundle.embedding or self._embed_model.get_query_embedding(query_bundle.query_str)
+        hits = self._ann.search(embedding, self._top_k, self._nprobe)
+        nodes = self._docstore.get_nodes([node_id for node_id, _ in hits])
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, hits)]
@@ -0,0 +1,419 @@
+"""
+Offline end-to-end latency benchmark for the voice agent.
+
+Replays recorded WAV utterances through the real AgentSession wiring from
+voice_agent_openai.py (RAGAgent, retrieval, caches, TTS segmentation, turn
+metrics) in N concurrent simulated rooms. VAD (Silero) and retrieval are the
+real ones. STT, LLM and TTS are the deterministic fakes from bench_fakes.py,
+with configurable latency and jitter. No LiveKit server or API keys are needed.
+
+    cd backend
+    python bench_e2e.py --utterances bench-utterances/ --rooms 4 --turns 5 --out bench.json
+    python bench_e2e.py --utterances bench-utterances/ --rooms 4 --turns 5 --compare bench.json
+
+Utterances are 16-bit PCM WAV files. Each one's transcript is a .txt file with
+the same name, or else the file name. The JSON report records per-stage turn
+latency percentiles, retrieval time, provider latencies, CPU and RSS, and can
+be compared against a previous report with --compare.
+
+With --soak, rooms are added --ramp-step at a time every --step-s seconds,
+starting from --rooms, until p95 time to first agent audio exceeds --slo-ms
+(or --max-rooms is reached). Each step reports turn latency, event-loop lag,
+CPU, in-flight retrieval and the load worker_load.py would report. The last
+step within the SLO gives the rooms one core sustains and a RAG_MAX_SESSIONS
+to start from:
+
+    python bench_e2e.py --utterances bench-utterances/ --soak --max-rooms 40 --out soak.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# voice_agent_openai validates provider credentials at import; none are used here
+for _var in ("OPENROUTER_API_KEY", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET", "DEEPGRAM_API_KEY", "CARTESIA_API_KEY"):
+    os.environ.setdefault(_var, "offline-benchmark")
+os.environ.setdefault("LIVEKIT_URL", "ws://localhost:7880")
+
+from livekit.agents.voice import AgentSession  # noqa: E402
+from livekit.plugins import silero  # noqa: E402
+
+from bench_fakes import (  # noqa: E402
+    FakeLLM,
+    FakeSTT,
+    FakeTTS,
+    Latency,
+    ScriptedAudioInput,
+    SimulatedAudioOutput,
+    load_utterances,
+)
+from retrieval import TurnRetriever  # noqa: E402
+from turn_metrics import TURN_STAGES, MetricsRegistry, TurnTracker, distribution  # noqa: E402
+from voice_agent_openai import start_agent  # noqa: E402
+from worker_load import INFLIGHT, LOAD_THRESHOLD, LoopLagMonitor, combine_load  # noqa: E402
+
+logger = logging.getLogger("bench-e2e")
+
+DEFAULT_REPLY = (
+    "Sure, here is what the knowledge base says about that. "
+    "It covers the main points in a couple of short sentences, so the answer stays quick to hear."
+)
+REPLY_TIMEOUT_S = 30
+
+
+class ResourceSampler:
+    """Samples this process's CPU use and RSS while the benchmark runs."""
+
+    def __init__(self, interval_s: float = 0.25):
+        self.interval_s = interval_s
+        self.cpu_percent = []
+        self.rss_mb = []
+        self._task = None
+
+    @staticmethod
+    def rss() -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak only, KiB on Linux
+
+    async def _run(self):
+        last_wall, last_cpu = time.perf_counter(), time.process_time()
+        while True:
+            await asyncio.sleep(self.interval_s)
+            wall, cpu = time.perf_counter(), time.process_time()
+            self.cpu_percent.append((cpu - last_cpu) / (wall - last_wall) * 100)
+            self.rss_mb.append(self.rss())
+            last_wall, last_cpu = wall, cpu
+
+    def start(self):
+        self.cpu_start = time.process_time()
+        self.rss_start = self.rss()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> dict:
+        self._task.cancel()
+        return {
+            "cpu_seconds": round(time.process_time() - self.cpu_start, 2),
+            "cpu_percent": distribution(self.cpu_percent),
+            "rss_mb": {
+                "start": round(self.rss_start, 1),
+                "peak": round(max(self.rss_mb, default=self.rss_start), 1),
+                "mean": round(sum(self.rss_mb) / len(self.rss_mb), 1) if self.rss_mb else None,
+            },
+        }
+
+
+async def wait_for_reply(states: asyncio.Queue):
+    """Wait for the agent to start and then finish speaking."""
+    async def until(target):
+        while await states.get() != target:
+            pass
+
+    await asyncio.wait_for(until("speaking"), REPLY_TIMEOUT_S)
+    await asyncio.wait_for(until("listening"), REPLY_TIMEOUT_S)
+
+
+async def run_room(
+    index: int,
+    args,
+    utterances: list,
+    vad,
+    registry: MetricsRegistry,
+    stop: asyncio.Event = None,
+    trackers: list = None,
+    lag: LoopLagMonitor = None,
+) -> list:
+    """Run args.turns turns in one simulated room, or turns until stop is set."""
+    rng = random.Random(args.seed + index)
+    fake_stt = FakeSTT(Latency(args.stt_ms, args.stt_jitter_ms), rng)
+    session = AgentSession(
+        vad=vad,
+        stt=fake_stt,
+        llm=FakeLLM(Latency(args.llm_ttft_ms, args.llm_jitter_ms), args.llm_tokens_per_s, args.reply, rng),
+        tts=FakeTTS(Latency(args.tts_ttfb_ms, args.tts_jitter_ms), rng),
+    )
+    audio_in = ScriptedAudioInput()
+    session.input.audio = audio_in
+    session.output.audio = SimulatedAudioOutput()
+
+    states = asyncio.Queue()
+    session.on("agent_state_changed", lambda ev: states.put_nowait(ev.new_state))
+
+    retriever = TurnRetriever()
+    tracker = TurnTracker(f"bench-room-{index}", registry, lag)
+    if trackers is not None:
+        trackers.append(tracker)
+    try:
+        await start_agent(session, retriever, tracker)
+        turn = 0
+        while not stop.is_set() if stop is not None else turn < args.turns:
+            utterance = utterances[(index + turn) % len(utterances)]
+            while not states.empty():
+                states.get_nowait()
+            fake_stt.transcripts.put_nowait(utterance.transcript)
+            audio_in.play(utterance)
+            try:
+                await wait_for_reply(states)
+            except asyncio.TimeoutError:
+                logger.warning(f"Room {index} turn {turn}: no reply within {REPLY_TIMEOUT_S}s")
+            await asyncio.sleep(args.think_ms / 1000)
+            turn += 1
+    finally:
+        await session.aclose()
+        await retriever.aclose()
+    return tracker.completed
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run(args) -> dict:
+    utterances = load_utterances(Path(args.utterances))
+    vad = silero.vad.VAD.load()
+    # Load the index and embedding model before timing, as prewarm/first job would
+    await asyncio.to_thread(TurnRetriever().load)
+
+    registry = MetricsRegistry()
+    sampler = ResourceSampler()
+    sampler.start()
+    lag = LoopLagMonitor()
+    lag.start()
+    start = time.perf_counter()
+    turns_per_room = await asyncio.gather(
+        *(run_room(i, args, utterances, vad, registry, lag=lag) for i in range(args.rooms))
+    )
+    wall_seconds = time.perf_counter() - start
+    lag.stop()
+    resources = sampler.stop()
+
+    turns = [turn for room in turns_per_room for turn in room]
+    stages = {stage: distribution([t[stage] for t in turns if stage in t]) for stage in TURN_STAGES}
+    retrieval_ms = [t["retrieval_end"] - t["retrieval_start"] for t in turns if "retrieval_end" in t and "retrieval_start" in t]
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "rooms", "turns", "seed", "think_ms", "stt_ms", "stt_jitter_ms", "llm_ttft_ms",
+                "llm_jitter_ms", "llm_tokens_per_s", "tts_ttfb_ms", "tts_jitter_ms",
+            )
+        },
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "utterances": len(utterances),
+        "turns_completed": len(turns),
+        "turns_expected": args.rooms * args.turns,
+        "wall_seconds": round(wall_seconds, 1),
+        "turn_latency_ms": stages,
+        "retrieval_ms": distribution(retrieval_ms),
+        # Worst lag of the loop all rooms share, per turn: retrieval must not stall audio
+        "loop_lag_ms": distribution([t["loop_lag_max_ms"] for t in turns if "loop_lag_max_ms" in t]),
+        "provider_latency_ms": registry.percentiles("voice_provider_latency_ms"),
+        **resources,
+    }
+
+
+async def soak(args) -> dict:
+    """Ramp simulated rooms until turn latency breaks the SLO; returns the per-step report."""
+    from livekit.agents.utils.hw import get_cpu_monitor
+
+    utterances = load_utterances(Path(args.utterances))
+    vad = silero.vad.VAD.load()
+    await asyncio.to_thread(TurnRetriever().load)
+    cpu_count = get_cpu_monitor().cpu_count()
+
+    registry = MetricsRegistry()
+    stop = asyncio.Event()
+    trackers, rooms, steps = [], [], []
+    lag = LoopLagMonitor()
+    lag.start()
+    target = args.rooms
+    try:
+        while target <= args.max_rooms:
+            while len(rooms) < target:
+                rooms.append(asyncio.create_task(
+                    run_room(len(rooms), args, utterances, vad, registry, stop, trackers, lag)
+                ))
+            seen = {id(tracker): len(tracker.completed) for tracker in trackers}
+            lag.clear()
+            wall, cpu, busy = time.perf_counter(), time.process_time(), INFLIGHT.busy_seconds()
+            await asyncio.sleep(args.step_s)
+            elapsed = time.perf_counter() - wall
+            turns = [turn for tracker in trackers for turn in tracker.completed[seen.get(id(tracker), 0):]]
+            report = {
+                "cpu": (time.process_time() - cpu) / elapsed,
+                "inflight": (INFLIGHT.busy_seconds() - busy) / elapsed,
+                "lag_ms": lag.p95(),
+            }
+            load, signals = combine_load(len(rooms), 0.0, [report], cpu_count, max_sessions=0)
+            first_audio = distribution([t["audio_published"] for t in turns if "audio_published" in t])
+            step = {
+                "rooms": len(rooms),
+                "turns": len(turns),
+                "first_audio_ms": first_audio,
+                "lag_ms_p95": round(report["lag_ms"], 1),
+                "cpu_cores": round(report["cpu"], 3),
+                "inflight": round(report["inflight"], 3),
+                "load": round(load, 3),
+                "load_signals": {name: round(value, 3) for name, value in signals.items()},
+                "within_slo": bool(first_audio) and first_audio["p95"] <= args.slo_ms,
+            }
+            steps.append(step)
+            print(
+                f"{step['rooms']:4d} rooms: {step['turns']:4d} turns, first audio p95 "
+                f"{first_audio.get('p95', float('nan')):7.1f}ms, lag p95 {step['lag_ms_p95']:6.1f}ms, "
+                f"CPU {step['cpu_cores']:.2f} cores, load {step['load']:.2f}",
+                flush=True,
+            )
+            if not step["within_slo"]:
+                break
+            target += args.ramp_step
+    finally:
+        lag.stop()
+        stop.set()
+        await asyncio.gather(*rooms, return_exceptions=True)
+
+    safe = [step for step in steps if step["within_slo"]]
+    safe_step = safe[-1] if safe else None
+    rooms_per_core = safe_step["rooms"] / max(safe_step["cpu_cores"], 1e-3) if safe_step else 0.0
+    admission = next((step["rooms"] for step in steps if step["load"] >= LOAD_THRESHOLD), None)
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in ("rooms", "max_rooms", "ramp_step", "step_s", "slo_ms", "seed", "think_ms", "llm_ttft_ms", "tts_ttfb_ms")
+        },
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": cpu_count,
+        },
+        "steps": steps,
+        "safe_rooms": safe_step["rooms"] if safe_step else 0,
+        "rooms_per_core": round(rooms_per_core, 1),
+        # Per-core rooms on every core, leaving the CPU headroom the load threshold keeps
+        "suggested_max_sessions": int(rooms_per_core * cpu_count * LOAD_THRESHOLD),
+        "load_threshold_rooms": admission,
+    }
+
+
+def format_soak_report(report: dict) -> str:
+    lines = [
+        f"Safe limit: {report['safe_rooms']} rooms within {report['config']['slo_ms']:.0f}ms p95 first audio "
+        f"(commit {report['environment']['git_commit'] or '?'})",
+        f"  {report['rooms_per_core']} rooms per core; suggested RAG_MAX_SESSIONS={report['suggested_max_sessions']} "
+        f"on {report['environment']['cpu_count']:g} cores",
+    ]
+    if report["load_threshold_rooms"] is not None:
+        lines.append(f"  Load reached RAG_LOAD_THRESHOLD={LOAD_THRESHOLD} at {report['load_threshold_rooms']} rooms")
+    else:
+        lines.append(f"  Load stayed below RAG_LOAD_THRESHOLD={LOAD_THRESHOLD}")
+    return "\n".join(lines)
+
+
+def format_report(report: dict, baseline: dict = None) -> str:
+    def row(name, current, previous):
+        line = f"  {name:<18}"
+        for key in ("p50", "p95", "p99"):
+            value = current.get(key)
+            line += f" {key} {value:8.1f}" if value is not None else f" {key} {'-':>8}"
+            if previous and previous.get(key) and value is not None:
+                line += f" ({(value - previous[key]) / previous[key] * 100:+5.1f}%)"
+        return line
+
+    lines = [
+        f"{report['turns_completed']}/{report['turns_expected']} turns in {report['wall_seconds']}s "
+        f"across {report['config']['rooms']} rooms (commit {report['environment']['git_commit'] or '?'})",
+        "Turn latency from end of user speech (ms):",
+    ]
+    base_stages = (baseline or {}).get("turn_latency_ms", {})
+    for stage, values in report["turn_latency_ms"].items():
+        if values:
+            lines.append(row(stage, values, base_stages.get(stage)))
+    lines.append("Retrieval (ms):")
+    lines.append(row("retrieval", report["retrieval_ms"], (baseline or {}).get("retrieval_ms")))
+    if report.get("loop_lag_ms"):
+        lines.append("Worst event-loop lag per turn (ms):")
+        lines.append(row("loop lag", report["loop_lag_ms"], (baseline or {}).get("loop_lag_ms")))
+    lines.append(
+        f"CPU {report['cpu_seconds']}s (mean {report['cpu_percent'].get('mean', 0):.0f}%, "
+        f"p95 {report['cpu_percent'].get('p95') or 0:.0f}%), "
+        f"RSS start {report['rss_mb']['start']}MB peak {report['rss_mb']['peak']}MB"
+    )
+    if baseline:
+        lines.append(
+            f"Baseline: CPU {baseline['cpu_seconds']}s, RSS peak {baseline['rss_mb']['peak']}MB "
+            f"(commit {baseline['environment']['git_commit'] or '?'})"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark for the voice agent.")
+    parser.add_argument("--utterances", required=True, help="Directory of 16-bit PCM .wav utterances (+ optional .txt transcripts)")
+    parser.add_argument("--rooms", type=int, default=1, help="Concurrent simulated rooms")
+    parser.add_argument("--turns", type=int, default=5, help="User turns per room")
+    parser.add_argument("--think-ms", type=float, default=500, help="Pause after each agent reply before the next utterance")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for provider latency jitter")
+    parser.add_argument("--stt-ms", type=float, default=150, help="Fake STT delay after end of speech")
+    parser.add_argument("--stt-jitter-ms", type=float, default=30)
+    parser.add_argument("--llm-ttft-ms", type=float, default=350, help="Fake LLM time to first token")
+    parser.add_argument("--llm-jitter-ms", type=float, default=80)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=60, help="Fake LLM streaming rate (words/s)")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=120, help="Fake TTS time to first byte")
+    parser.add_argument("--tts-jitter-ms", type=float, default=30)
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="Text the fake LLM streams for every turn")
+    parser.add_argument("--soak", action="store_true", help="Ramp rooms until turn latency breaks --slo-ms")
+    parser.add_argument("--max-rooms", type=int, default=32, help="Soak: stop ramping at this many rooms")
+    parser.add_argument("--ramp-step", type=int, default=1, help="Soak: rooms added per step")
+    parser.add_argument("--step-s", type=float, default=20, help="Soak: seconds measured per step")
+    parser.add_argument("--slo-ms", type=float, default=1500, help="Soak: p95 end of speech to first agent audio")
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to show deltas against")
+    args = parser.parse_args()
+
+    # voice_agent_openai configured INFO logging at import; keep benchmark output to warnings
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.soak:
+        report = asyncio.run(soak(args))
+        print(format_soak_report(report))
+        if args.out:
+            Path(args.out).write_text(json.dumps(report, indent=2))
+            print(f"Report written to {args.out}")
+        return
+    report = asyncio.run(run(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print(format_report(report, baseline))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.out}")
+    if report["turns_completed"] < report["turns_expected"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
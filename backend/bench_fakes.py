@@ -0,0 +1,225 @@
+"""
+Deterministic local stand-ins for the voice pipeline's providers and room I/O.
+
+Used by bench_e2e.py to run the real AgentSession wiring without LiveKit,
+Deepgram, OpenRouter or Cartesia. Each fake waits a configurable latency
+(plus seeded jitter) before answering, so benchmark runs are repeatable and
+comparable across changes.
+"""
+
+import asyncio
+import random
+import time
+import uuid
+import wave
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import APIConnectOptions, llm, stt, tts
+from livekit.agents.voice import io
+
+FRAME_MS = 10
+
+
+@dataclass
+class Latency:
+    """A provider delay: mean_ms plus uniform jitter of up to +/- jitter_ms."""
+
+    mean_ms: float
+    jitter_ms: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return max(0.0, self.mean_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+
+@dataclass
+class Utterance:
+    transcript: str
+    pcm: np.ndarray  # int16 mono
+    sample_rate: int
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / self.sample_rate
+
+
+def load_utterances(directory: Path) -> list:
+    """Load *.wav files (16-bit PCM) in name order; the transcript is a sibling .txt or the file stem."""
+    utterances = []
+    for path in sorted(directory.glob("*.wav")):
+        with wave.open(str(path), "rb") as f:
+            if f.getsampwidth() != 2:
+                raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+            pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+            if f.getnchannels() > 1:
+                pcm = pcm.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)
+            sample_rate = f.getframerate()
+        text_path = path.with_suffix(".txt")
+        transcript = text_path.read_text().strip() if text_path.exists() else path.stem.replace("_", " ")
+        utterances.append(Utterance(transcript, pcm, sample_rate))
+    if not utterances:
+        raise FileNotFoundError(f"No .wav utterances in '{directory}'")
+    return utterances
+
+
+# ============================================
+# Providers
+# ============================================
+class FakeSTT(stt.STT):
+    """Non-streaming STT (AgentSession pairs it with the VAD) returning a scripted transcript per utterance."""
+
+    def __init__(self, latency: Latency, rng: random.Random):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=False, interim_results=False))
+        self.latency = latency
+        self.rng = rng
+        self.transcripts = asyncio.Queue()
+
+    async def _recognize_impl(self, buffer, *, language=None, conn_options: APIConnectOptions = None):
+        await asyncio.sleep(self.latency.sample(self.rng))
+        text = self.transcripts.get_nowait() if not self.transcripts.empty() else ""
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            alternatives=[stt.SpeechData(language="en", text=text)],
+        )
+
+
+class FakeLLMStream(llm.LLMStream):
+    async def _run(self):
+        fake = self._llm
+        await asyncio.sleep(fake.ttft.sample(fake.rng))
+        request_id = str(uuid.uuid4())
+        words = fake.reply.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(1 / fake.tokens_per_second)
+            self._event_ch.send_nowait(
+                llm.ChatChunk(id=request_id, delta=llm.ChoiceDelta(role="assistant", content=word + " "))
+            )
+
+
+class FakeLLM(llm.LLM):
+    """Streams a fixed reply after a time-to-first-token delay, at tokens_per_second."""
+
+    def __init__(self, ttft: Latency, tokens_per_second: float, reply: str, rng: random.Random):
+        super().__init__()
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply
+        self.rng = rng
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=APIConnectOptions(), **kwargs):
+        return FakeLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options)
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self, output_emitter):
+        fake = self._tts
+        output_emitter.initialize(
+            request_id=str(uuid.uuid4()),
+            sample_rate=fake.sample_rate,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        await asyncio.sleep(fake.ttfb.sample(fake.rng))
+        # Silence with the duration speech of this text would have
+        samples = int(len(self._input_text) * fake.seconds_per_char * fake.sample_rate)
+        chunk = fake.sample_rate // 10
+        for start in range(0, samples, chunk):
+            output_emitter.push(bytes(2 * min(chunk, samples - start)))
+        output_emitter.flush()
+
+
+class FakeTTS(tts.TTS):
+    """Non-streaming TTS producing silence of speech-like duration after a time-to-first-byte delay."""
+
+    def __init__(self, ttfb: Latency, rng: random.Random, sample_rate: int = 24000, seconds_per_char: float = 0.06):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=sample_rate, num_channels=1)
+        self.ttfb = ttfb
+        self.rng = rng
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text: str, *, conn_options=APIConnectOptions()):
+        return FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+# ============================================
+# Room audio
+# ============================================
+class ScriptedAudioInput(io.AudioInput):
+    """Microphone stand-in: real-time paced frames of queued utterances, silence in between."""
+
+    def __init__(self, sample_rate: int = 16000):
+        super().__init__(label="bench-input")
+        self.sample_rate = sample_rate
+        self._samples = sample_rate * FRAME_MS // 1000
+        self._queue = deque()
+        self._next_at = None
+        self.speech_ended = asyncio.Event()
+
+    def play(self, utterance: Utterance):
+        """Queue an utterance; speech_ended is set once its last frame has been sent."""
+        if utterance.sample_rate != self.sample_rate:
+            positions = np.arange(0, len(utterance.pcm), utterance.sample_rate / self.sample_rate)
+            pcm = np.interp(positions, np.arange(len(utterance.pcm)), utterance.pcm).astype(np.int16)
+        else:
+            pcm = utterance.pcm
+        self.speech_ended.clear()
+        self._queue.extend(pcm[i:i + self._samples] for i in range(0, len(pcm), self._samples))
+        self._queue.append(None)  # end marker
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        now = time.perf_counter()
+        self._next_at = max(self._next_at or now, now - 0.1) + FRAME_MS / 1000
+        await asyncio.sleep(max(0.0, self._next_at - now))
+        chunk = self._queue.popleft() if self._queue else np.zeros(self._samples, dtype=np.int16)
+        if chunk is None:
+            self.speech_ended.set()
+            chunk = np.zeros(self._samples, dtype=np.int16)
+        elif len(chunk) < self._samples:
+            chunk = np.pad(chunk, (0, self._samples - len(chunk)))
+        return rtc.AudioFrame(chunk.tobytes(), self.sample_rate, 1, self._samples)
+
+
+class SimulatedAudioOutput(io.AudioOutput):
+    """Speaker stand-in: accepts frames, 'plays' them in real time and reports playback events."""
+
+    def __init__(self):
+        super().__init__(label="bench-output", capabilities=io.AudioOutputCapabilities(pause=False))
+        self._started_at = None
+        self._duration = 0.0
+        self._finish_task = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+            self.on_playback_started(created_at=time.time())
+        self._duration += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._started_at is None:
+            return
+        remaining = self._started_at + self._duration - time.perf_counter()
+        duration = self._duration
+        self._started_at, self._duration = None, 0.0
+        self._finish_task = asyncio.create_task(self._finish(max(0.0, remaining), duration))
+
+    async def _finish(self, delay: float, duration: float):
+        await asyncio.sleep(delay)
+        self.on_playback_finished(playback_position=duration, interrupted=False)
+
+    def clear_buffer(self) -> None:
+        if self._finish_task is not None and not self._finish_task.done():
+            self._finish_task.cancel()
+            self.on_playback_finished(playback_position=0.0, interrupted=True)
+        elif self._started_at is not None:
+            # Interrupted mid-capture: close the segment so it can report as finished
+            super().flush()
+            self.on_playback_finished(
+                playback_position=time.perf_counter() - self._started_at, interrupted=True
+            )
+        self._started_at, self._duration = None, 0.0
@@ -0,0 +1,400 @@
+"""
+Offline retrieval quality and latency benchmark over the docs corpus.
+
+For every combination of embedding model, chunk size, chunk overlap, vector
+backend and retriever (dense, hybrid BM25 + dense, or hybrid + rerank), the index is built from DOCS_DIR exactly as ingest.py builds
+it (IngestPipeline + rag_index.build_index), but into a scratch directory, so
+chat-engine-storage is never touched. Each question in the evaluation set is
+then answered at every top-k, recording recall@k, MRR and query latency
+percentiles (query embedding and vector search separately).
+
+    cd backend
+    python bench_retrieval.py --eval-set retrieval_eval.jsonl --out retrieval.json
+    python bench_retrieval.py --eval-set retrieval_eval.jsonl --chunk-sizes 256,512,1024 \\
+        --backends simple,flat,ivf --retrievers dense,hybrid --top-k 1,3,5 --compare retrieval.json
+
+The evaluation set is JSON Lines, one question per line:
+
+    {"question": "How do I restart the server?", "expected": "./server_restart.sh", "file": "SERVER_COMMANDS.md"}
+
+"expected" is a passage (or list of passages) from the corpus that answers the
+question; "file" optionally restricts matches to one document, and on its own
+makes any chunk of that document relevant. A retrieved chunk is relevant when
+it contains an expected passage, or, for passages that straddle chunk
+boundaries, at least --min-overlap of it. Sweep defaults are the agent's
+configured values, so a run without sweep flags measures the production index.
+With --compare, a drop in recall@k or MRR beyond --tolerance for any
+configuration present in both reports fails the run.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from dotenv import load_dotenv
+from llama_index.core.schema import QueryBundle
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+load_dotenv()
+
+import ann_store  # noqa: E402
+import embed_cache  # noqa: E402
+import ingest_pipeline  # noqa: E402
+import rag_index  # noqa: E402
+from bm25_store import BM25Index  # noqa: E402
+from hybrid_retrieval import CrossEncoderReranker, HybridRetriever  # noqa: E402
+from node_store import NODE_STORE_FILE, SqliteNodeStore  # noqa: E402
+from retrieval import RETRIEVAL_TOP_K  # noqa: E402
+from turn_metrics import distribution  # noqa: E402
+
+logger = logging.getLogger("bench-retrieval")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def load_eval_set(path: Path) -> list:
+    """Read the JSONL evaluation set into [{"question", "expected": [...], "file"}]."""
+    questions = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            item = json.loads(line)
+            expected = item.get("expected") or []
+            if isinstance(expected, str):
+                expected = [expected]
+            if not item.get("question") or not (expected or item.get("file")):
+                raise ValueError(f"{path}:{line_no}: needs a 'question' and an 'expected' passage or 'file'")
+            questions.append(
+                {"question": item["question"], "expected": [normalize(p) for p in expected], "file": item.get("file")}
+            )
+    if not questions:
+        raise ValueError(f"No questions in '{path}'")
+    return questions
+
+
+def is_relevant(node, question: dict, min_overlap: float) -> bool:
+    if question["file"] and node.metadata.get("file_name") != Path(question["file"]).name:
+        return False
+    if not question["expected"]:
+        return True
+    text = normalize(node.get_content())
+    for passage in question["expected"]:
+        if passage in text:
+            return True
+        match = SequenceMatcher(None, passage, text, autojunk=False).find_longest_match(0, len(passage), 0, len(text))
+        if match.size >= min_overlap * len(passage):
+            return True
+    return False
+
+
+def first_relevant_rank(nodes: list, question: dict, min_overlap: float):
+    """1-based rank of the first relevant node, or None."""
+    for rank, node in enumerate(nodes, 1):
+        if is_relevant(node.node, question, min_overlap):
+            return rank
+    return None
+
+
+RETRIEVERS = ("dense", "hybrid", "rerank")
+
+
+def open_retriever(
+    index,
+    persist_dir: Path,
+    backend: str,
+    storage_format: str,
+    embed_model,
+    top_k: int,
+    kind: str = "dense",
+    reranker: CrossEncoderReranker = None,
+):
+    """A retriever over a freshly built index, as CorpusIndex._create_retriever would open it."""
+    dense_k = max(top_k, rag_index.HYBRID_CANDIDATES) if kind != "dense" else top_k
+    if backend == "simple":
+        dense, docstore = index.as_retriever(similarity_top_k=dense_k), index.docstore
+    else:
+        ann = ann_store.AnnIndex(persist_dir / rag_index.ANN_DIR_NAME)
+        if storage_format == "binary":
+            docstore = SqliteNodeStore(persist_dir / rag_index.ANN_DIR_NAME / NODE_STORE_FILE)
+        else:
+            docstore = SimpleDocumentStore.from_persist_dir(str(persist_dir))
+        dense = ann_store.AnnRetriever(ann, docstore, embed_model, dense_k, rag_index.ANN_NPROBE)
+    if kind == "dense":
+        return dense
+    return HybridRetriever(
+        dense,
+        BM25Index(persist_dir / rag_index.BM25_DIR_NAME),
+        docstore,
+        top_k,
+        rag_index.HYBRID_CANDIDATES,
+        rag_index.RRF_K,
+        reranker=reranker if kind == "rerank" else None,
+    )
+
+
+def evaluate(retriever, embeddings: list, questions: list, top_k: int, min_overlap: float) -> dict:
+    search_ms = []
+    ranks = []
+    for question, embedding in zip(questions, embeddings):
+        start = time.perf_counter()
+        nodes = retriever.retrieve(QueryBundle(query_str=question["question"], embedding=embedding))
+        search_ms.append(round((time.perf_counter() - start) * 1000, 2))
+        ranks.append(first_relevant_rank(nodes[:top_k], question, min_overlap))
+    return {
+        "recall": round(sum(rank is not None for rank in ranks) / len(ranks), 4),
+        "mrr": round(sum(1 / rank for rank in ranks if rank) / len(ranks), 4),
+        "search_ms": distribution(search_ms),
+        "misses": [q["question"] for q, rank in zip(questions, ranks) if rank is None],
+    }
+
+
+def config_key(config: dict) -> str:
+    key = (
+        f"{config['model']} chunk={config['chunk_size']}/{config['chunk_overlap']} "
+        f"{config['backend']}/{config['storage_format']} k={config['top_k']}"
+    )
+    # Dense keys predate the retriever sweep; keep them comparable with older reports
+    if config.get("retriever", "dense") != "dense":
+        key += f" {config['retriever']}"
+    return key
+
+
+def run(args) -> dict:
+    questions = load_eval_set(Path(args.eval_set))
+    scratch = Path(tempfile.mkdtemp(prefix="bench-retrieval-"))
+    results = []
+    hybrid = any(kind != "dense" for kind in args.retrievers)
+    reranker = None
+    if "rerank" in args.retrievers:
+        reranker = CrossEncoderReranker(args.rerank_model, rag_index.RERANK_CANDIDATES, args.rerank_timeout_ms)
+    try:
+        for model_name in args.models:
+            # "onnx:<model>" benchmarks the model's ONNX export (see onnx_embedding.py)
+            engine, _, name = model_name.partition(":")
+            if engine not in rag_index.EMBED_ENGINES:
+                engine, name = rag_index.EMBED_ENGINE, model_name
+            embed_model = rag_index.load_embed_model(name, engine)
+            embeddings = []
+            embed_ms = []
+            for question in questions:
+                start = time.perf_counter()
+                embeddings.append(embed_model.get_query_embedding(question["question"]))
+                embed_ms.append(round((time.perf_counter() - start) * 1000, 2))
+
+            for chunk_size in args.chunk_sizes:
+                for chunk_overlap in args.overlaps:
+                    if chunk_overlap >= chunk_size:
+                        logger.warning(f"Skipping chunk size {chunk_size} with overlap {chunk_overlap}")
+                        continue
+                    persist_dir = scratch / "index"
+                    pipeline = ingest_pipeline.IngestPipeline(
+                        embed_model,
+                        chunk_size=chunk_size,
+                        chunk_overlap=chunk_overlap,
+                        cache=embed_cache.EmbeddingCache() if args.embed_cache else None,
+                    )
+                    start = time.perf_counter()
+                    index = rag_index.build_index(
+                        Path(args.docs_dir),
+                        persist_dir,
+                        full=True,
+                        vector_backend="simple",
+                        pipeline=pipeline,
+                        bm25=hybrid,
+                    )
+                    build_seconds = round(time.perf_counter() - start, 1)
+                    chunks = len(index.docstore.docs)
+
+                    for backend in args.backends:
+                        if backend != "simple":
+                            rag_index.export_ann(persist_dir, backend, args.storage_format, index=index)
+                        storage_format = args.storage_format if backend != "simple" else "json"
+                        for kind, top_k in itertools.product(args.retrievers, args.top_k):
+                            retriever = open_retriever(
+                                index, persist_dir, backend, storage_format, embed_model, top_k, kind, reranker
+                            )
+                            config = {
+                                "model": model_name,
+                                "chunk_size": chunk_size,
+                                "chunk_overlap": chunk_overlap,
+                                "backend": backend,
+                                "storage_format": storage_format,
+                                "retriever": kind,
+                                "top_k": top_k,
+                            }
+                            timeouts = reranker.timeouts if reranker else 0
+                            result = evaluate(retriever, embeddings, questions, top_k, args.min_overlap)
+                            if kind == "rerank":
+                                result["rerank_timeouts"] = reranker.timeouts - timeouts
+                            results.append(
+                                {
+                                    "key": config_key(config),
+                                    "config": config,
+                                    "chunks": chunks,
+                                    "build_seconds": build_seconds,
+                                    "embed_ms": distribution(embed_ms),
+                                    **result,
+                                }
+                            )
+                            logger.info(
+                                f"{config_key(config)}: recall {result['recall']:.3f} mrr {result['mrr']:.3f} "
+                                f"search p95 {result['search_ms']['p95']}ms"
+                            )
+                    shutil.rmtree(persist_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        "environment": {
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "eval_set": str(args.eval_set),
+        "questions": len(questions),
+        "docs_dir": str(args.docs_dir),
+        "min_overlap": args.min_overlap,
+        "results": results,
+    }
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """Configurations whose recall or MRR fell more than tolerance below the baseline."""
+    previous = {result["key"]: result for result in baseline.get("results", [])}
+    found = []
+    for result in report["results"]:
+        before = previous.get(result["key"])
+        if before is None:
+            continue
+        for metric in ("recall", "mrr"):
+            if result[metric] < before[metric] - tolerance:
+                found.append(f"{result['key']}: {metric} {before[metric]:.3f} -> {result[metric]:.3f}")
+    return found
+
+
+def format_report(report: dict, baseline: dict = None) -> str:
+    previous = {result["key"]: result for result in (baseline or {}).get("results", [])}
+    lines = [
+        f"{report['questions']} questions over '{report['docs_dir']}' "
+        f"(commit {report['environment']['git_commit'] or '?'})",
+        f"  {'configuration':<64} {'chunks':>6} {'recall':>7} {'mrr':>7} {'embed p50':>9} "
+        f"{'search p50':>10} {'p95':>8} {'p99':>8}",
+    ]
+    for result in report["results"]:
+        search, embed = result["search_ms"], result["embed_ms"]
+        line = (
+            f"  {result['key']:<64} {result['chunks']:>6} {result['recall']:>7.3f} {result['mrr']:>7.3f} "
+            f"{embed['p50']:>9.1f} {search['p50']:>10.2f} {search['p95']:>8.2f} {search['p99']:>8.2f}"
+        )
+        before = previous.get(result["key"])
+        if before:
+            line += (
+                f"  (recall {result['recall'] - before['recall']:+.3f}, mrr {result['mrr'] - before['mrr']:+.3f}, "
+                f"search p95 {result['search_ms']['p95'] - before['search_ms']['p95']:+.2f}ms)"
+            )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def csv_list(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality (recall@k, MRR) and latency benchmark.")
+    parser.add_argument("--eval-set", required=True, help="JSONL file of {question, expected, file} items")
+    parser.add_argument("--docs-dir", type=Path, default=rag_index.DOCS_DIR, help="Corpus to index")
+    parser.add_argument("--models", type=csv_list(str), default=[rag_index.EMBED_MODEL_NAME], help="Embedding models; prefix with onnx: or torch: to pick the engine")
+    parser.add_argument("--chunk-sizes", type=csv_list(int), default=[ingest_pipeline.CHUNK_SIZE])
+    parser.add_argument("--overlaps", type=csv_list(int), default=[ingest_pipeline.CHUNK_OVERLAP])
+    parser.add_argument(
+        "--backends",
+        type=csv_list(str),
+        default=[rag_index.VECTOR_BACKEND],
+        help=f"Vector backends, from {rag_index.VECTOR_BACKENDS}",
+    )
+    parser.add_argument(
+        "--storage-format",
+        choices=rag_index.STORAGE_FORMATS,
+        default=rag_index.STORAGE_FORMAT,
+        help="Storage format for the flat/ivf backends",
+    )
+    parser.add_argument(
+        "--retrievers",
+        type=csv_list(str),
+        default=["rerank" if rag_index.RERANK_MODEL_NAME else "hybrid"] if rag_index.HYBRID_RETRIEVAL else ["dense"],
+        help=f"Retrievers, from {RETRIEVERS}: vector only, BM25 + vector fusion, fusion + cross-encoder rerank",
+    )
+    parser.add_argument("--rerank-model", default=rag_index.RERANK_MODEL_NAME or "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--rerank-timeout-ms", type=float, default=rag_index.RERANK_TIMEOUT_MS)
+    parser.add_argument("--top-k", type=csv_list(int), default=[RETRIEVAL_TOP_K])
+    parser.add_argument(
+        "--min-overlap",
+        type=float,
+        default=0.5,
+        help="Fraction of an expected passage a chunk must contain verbatim to count as relevant",
+    )
+    parser.add_argument(
+        "--no-embed-cache",
+        dest="embed_cache",
+        action="store_false",
+        default=embed_cache.EMBED_CACHE_ENABLED,
+        help="Embed every chunk instead of reusing cached embeddings",
+    )
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to compare quality and latency against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.0,
+        help="Allowed drop in recall@k or MRR versus --compare before the run fails",
+    )
+    args = parser.parse_args()
+    unknown = [backend for backend in args.backends if backend not in rag_index.VECTOR_BACKENDS]
+    if unknown:
+        parser.error(f"unknown backends {unknown}, expected {rag_index.VECTOR_BACKENDS}")
+    unknown = [kind for kind in args.retrievers if kind not in RETRIEVERS]
+    if unknown:
+        parser.error(f"unknown retrievers {unknown}, expected {RETRIEVERS}")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+    report = run(args)
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print(format_report(report, baseline))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.out}")
+    if baseline:
+        found = regressions(report, baseline, args.tolerance)
+        for line in found:
+            print(f"Quality regression: {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
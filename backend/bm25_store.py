@@ -0,0 +1,162 @@
+"""
+Persisted, memory-mapped BM25 inverted index.
+
+Dense bge-small embeddings match product names, codes and other rare tokens
+poorly; BM25 matches them exactly. Ingest writes this index next to the
+vector store and hybrid retrieval (hybrid_retrieval.py) fuses the two.
+
+Each posting stores its precomputed BM25 term weight, so a query is a sum of
+posting slices, one per query term, with no per-query length normalization.
+
+Layout of a BM25 directory:
+    meta.json      count, k1, b, average document length, source hash
+    vocab.json     term -> term id
+    offsets.npy    postings range of each term id (length vocab + 1)
+    docs.npy       document row of each posting (memory-mapped)
+    weights.npy    BM25 weight of each posting (memory-mapped)
+    ids.npy        node id of each document row (memory-mapped)
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("bm25-store")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[^\W_]+(?:[-_.][^\W_]+)*")
+_JOINERS = re.compile(r"[-_.]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my of on or "
+    "s so t that the their them then there these they this to was we what when where which who why will "
+    "with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens without stopwords.
+
+    Hyphenated or dotted codes yield their parts and the joined form, so
+    "RTX-4090" matches "rtx 4090" as well as "rtx4090".
+    """
+    tokens = []
+    for match in _TOKEN.findall(text.lower()):
+        parts = _JOINERS.split(match)
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+    return tokens
+
+
+def build_bm25(
+    node_ids: list,
+    texts: list,
+    out_dir: Path,
+    source_hash: str = "",
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+):
+    """Write a BM25 directory for the given node ids and texts; the directory is replaced atomically."""
+    counts = [Counter(tokenize(text)) for text in texts]
+    lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+    avgdl = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+
+    postings = {}  # term -> [(row, tf)]
+    for row, doc_counts in enumerate(counts):
+        for term, tf in doc_counts.items():
+            postings.setdefault(term, []).append((row, tf))
+
+    vocab = {}
+    offsets = [0]
+    docs, weights = [], []
+    for term, entries in postings.items():
+        vocab[term] = len(vocab)
+        idf = math.log(1 + (len(counts) - len(entries) + 0.5) / (len(entries) + 0.5))
+        for row, tf in entries:
+            docs.append(row)
+            weights.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[row] / avgdl)))
+        offsets.append(len(docs))
+
+    # Per process, so a second writer never deletes this one's half-written files
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    meta = {
+        "count": len(node_ids),
+        "terms": len(vocab),
+        "postings": len(docs),
+        "k1": k1,
+        "b": b,
+        "avgdl": avgdl,
+        "source_hash": source_hash,
+    }
+    np.save(tmp_dir / "offsets.npy", np.array(offsets, dtype=np.int64))
+    np.save(tmp_dir / "docs.npy", np.array(docs, dtype=np.int32))
+    np.save(tmp_dir / "weights.npy", np.array(weights, dtype=np.float32))
+    np.save(tmp_dir / "ids.npy", np.array([node_id.encode() for node_id in node_ids], dtype=np.bytes_))
+    with open(tmp_dir / "vocab.json", "w") as f:
+        json.dump(vocab, f)
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = out_dir.with_name(f"{out_dir.name}.old-{os.getpid()}")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f"Wrote BM25 index with {meta['count']} documents and {meta['terms']} terms to '{out_dir}'")
+
+
+def read_meta(bm25_dir: Path) -> dict:
+    """Return a BM25 directory's meta.json, or {} if there is none."""
+    meta_path = bm25_dir / "meta.json"
+    if not meta_path.exists():
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class BM25Index:
+    """Read-only view of a BM25 directory; postings are memory-mapped."""
+
+    def __init__(self, bm25_dir: Path):
+        self.meta = read_meta(bm25_dir)
+        if not self.meta:
+            raise FileNotFoundError(f"No BM25 index at '{bm25_dir}'. Run `python ingest.py` to build it.")
+        with open(bm25_dir / "vocab.json") as f:
+            self.vocab = json.load(f)
+        self.offsets = np.load(bm25_dir / "offsets.npy")
+        self.docs = np.load(bm25_dir / "docs.npy", mmap_mode="r")
+        self.weights = np.load(bm25_dir / "weights.npy", mmap_mode="r")
+        self.node_ids = np.load(bm25_dir / "ids.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def search(self, query: str, top_k: int) -> list:
+        """Return [(node_id, BM25 score)] for the top_k best-matching documents (only those matching a term)."""
+        term_ids = {self.vocab[term] for term in tokenize(query) if term in self.vocab}
+        if not term_ids or not len(self.node_ids):
+            return []
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # A term's postings name each document once, so fancy-index addition is safe
+            scores[self.docs[start:end]] += self.weights[start:end]
+        matched = np.flatnonzero(scores)
+        k = min(top_k, len(matched))
+        if k == 0:
+            return []
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.node_ids[i].decode(), float(scores[i])) for i in best]
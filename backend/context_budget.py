@@ -0,0 +1,204 @@
+"""
+Token-bounded prompt assembly for voice turns.
+
+Every token in the prompt adds to the LLM's time to first token, and a voice
+call can run for many turns. Two budgets keep the prompt bounded:
+
+- Retrieved context (RAG_CONTEXT_MAX_TOKENS): chunks are split into
+  sentences, sentences repeated by overlapping chunks are dropped, and if
+  the rest doesn't fit, the sentences sharing the most terms with the
+  question are kept, in their original order.
+- Conversation history (RAG_HISTORY_MAX_TOKENS): system messages and the
+  last RAG_HISTORY_KEEP_TURNS user turns stay verbatim; older messages are
+  folded, one line each, into a running summary message that is itself
+  capped at RAG_HISTORY_SUMMARY_MAX_TOKENS.
+"""
+
+import logging
+import os
+import re
+
+from llama_index.core.utils import get_tokenizer
+
+from bm25_store import tokenize
+
+logger = logging.getLogger("context-budget")
+
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "600"))
+HISTORY_MAX_TOKENS = int(os.getenv("RAG_HISTORY_MAX_TOKENS", "1500"))
+HISTORY_KEEP_TURNS = int(os.getenv("RAG_HISTORY_KEEP_TURNS", "6"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("RAG_HISTORY_SUMMARY_MAX_TOKENS", "300"))
+
+SUMMARY_MESSAGE_ID = "history_summary"
+SUMMARY_HEADER = "Summary of earlier in this call:"
+SUMMARY_LINE_MAX_TOKENS = 40
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators of a chat message
+
+# Sentence ends, and line breaks (markdown lists, headings and tables have no full stops)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """text cut to at most max_tokens tokens, at a word boundary where possible."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    while words and count_tokens(" ".join(words) + " ...") > max_tokens:
+        words.pop()
+    return " ".join(words) + " ..." if words else ""
+
+
+def split_sentences(text: str) -> list:
+    return [s for s in _SENTENCE_END.split(text.strip()) if s.strip()]
+
+
+def _join_sentences(sentences: list) -> str:
+    """Join (sentence, ends_line) pairs back into text, keeping line breaks."""
+    return "".join(
+        sentence + ("\n" if ends_line else " ") for sentence, ends_line in sentences
+    ).strip()
+
+
+def _normalize(sentence: str) -> str:
+    return _WHITESPACE.sub(" ", sentence).strip().lower()
+
+
+def assemble_context(query: str, texts: list, max_tokens: int = CONTEXT_MAX_TOKENS) -> str:
+    """Join retrieved chunk texts (best first) into at most max_tokens tokens of context.
+
+    max_tokens <= 0 only deduplicates.
+    """
+    # Sentences of each chunk, minus those an earlier chunk already has. Chunk
+    # overlap can cut a sentence in two, so fragments of a kept sentence go too.
+    chunks, seen = [], []
+    for text in texts:
+        sentences = []
+        for line in text.strip().splitlines():
+            for sentence in split_sentences(line):
+                key = _normalize(sentence)
+                if any(key in other for other in seen):
+                    continue
+                seen.append(key)
+                sentences.append([sentence.strip(), False])
+            if sentences:
+                sentences[-1][1] = True
+        if sentences:
+            chunks.append(sentences)
+
+    def join(kept):
+        return "\n\n".join(_join_sentences(sentences) for sentences in kept if sentences)
+
+    context = join(chunks)
+    if max_tokens <= 0 or count_tokens(context) <= max_tokens:
+        return context
+
+    # Keep the sentences sharing the most distinct terms with the question;
+    # ties go to the better-ranked chunk and then the earlier sentence
+    terms = set(tokenize(query))
+    ranked = sorted(
+        ((len(terms & set(tokenize(sentence))), -rank, -position, rank, position)
+         for rank, sentences in enumerate(chunks)
+         for position, (sentence, _) in enumerate(sentences)),
+        reverse=True,
+    )
+    kept, used = set(), 0
+    for *_, rank, position in ranked:
+        cost = count_tokens(chunks[rank][position][0]) + 1
+        if used + cost > max_tokens:
+            continue
+        kept.add((rank, position))
+        used += cost
+
+    def extract(rank, sentences):
+        extracted = []
+        for position, (sentence, ends_line) in enumerate(sentences):
+            if (rank, position) in kept:
+                extracted.append([sentence, ends_line])
+            elif ends_line and extracted:
+                extracted[-1][1] = True  # the line break of a dropped line end stays
+        return extracted
+
+    return join(extract(rank, sentences) for rank, sentences in enumerate(chunks))
+
+
+class HistoryBudget:
+    """Keeps an agent's chat history under a token budget, summarizing what it drops.
+
+    One per agent: the running summary accumulates the lines of every message
+    trimmed so far, so each message is summarized only once.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = HISTORY_MAX_TOKENS,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS,
+    ):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_max_tokens = summary_max_tokens
+        self._summary_lines = []
+
+    @staticmethod
+    def _tokens(item) -> int:
+        text = getattr(item, "text_content", None) or ""
+        return count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def _summarize(self, items: list):
+        for item in items:
+            if getattr(item, "type", None) != "message" or not item.text_content:
+                continue  # tool calls and their outputs are dropped without a trace
+            first = split_sentences(item.text_content)[0]
+            line = truncate_tokens(f"{item.role.capitalize()}: {first}", SUMMARY_LINE_MAX_TOKENS)
+            self._summary_lines.append(line)
+        while (
+            len(self._summary_lines) > 1
+            and count_tokens("\n".join(self._summary_lines)) > self.summary_max_tokens
+        ):
+            self._summary_lines.pop(0)
+
+    def trim(self, chat_ctx) -> bool:
+        """Trim chat_ctx in place; returns whether anything was dropped."""
+        pinned, conversation = [], []
+        for item in chat_ctx.items:
+            if item.id == SUMMARY_MESSAGE_ID:
+                continue
+            if getattr(item, "role", None) in ("system", "developer"):
+                pinned.append(item)
+            else:
+                conversation.append(item)
+
+        # The window starts at the keep_turns-th last user message, then moves
+        # forward a turn at a time while it is over budget; the last turn always stays
+        starts = [i for i, item in enumerate(conversation) if getattr(item, "role", None) == "user"]
+        starts = starts[-self.keep_turns:] if self.keep_turns > 0 else starts[-1:]
+        budget = self.max_tokens - sum(self._tokens(item) for item in pinned)
+        if self._summary_lines:
+            budget -= self.summary_max_tokens
+        start = starts[0] if starts else 0
+        for next_start in starts[1:]:
+            if sum(self._tokens(item) for item in conversation[start:]) <= budget:
+                break
+            start = next_start
+        if start == 0:
+            return False
+
+        self._summarize(conversation[:start])
+        kept = conversation[start:]
+        chat_ctx.items[:] = pinned
+        if self._summary_lines:
+            # Dated just before the oldest kept message so time-ordered inserts keep it in place
+            chat_ctx.add_message(
+                role="system",
+                content=SUMMARY_HEADER + "\n" + "\n".join(self._summary_lines),
+                id=SUMMARY_MESSAGE_ID,
+                created_at=kept[0].created_at - 1e-3,
+            )
+        chat_ctx.items.extend(kept)
+        logger.debug(f"Trimmed {start} history items, kept {len(kept)} and {len(self._summary_lines)} summary lines")
+        return True
@@ -0,0 +1,99 @@
+"""
+Persistent embedding cache for ingestion.
+
+Maps sha256(model name + engine + normalized chunk text) to its embedding
+in a SQLite file that lives outside chat-engine-storage, so it survives
+`ingest.py --full` and reinstalls. Rebuilds then only embed chunk texts that
+were never seen before. The cache is bounded by entry count; the least
+recently used entries are evicted first. The engine ("torch", or the ONNX export and its
+quantization) is part of the key because int8 vectors differ slightly from
+the torch model's, and an index must not mix the two.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger("embed-cache")
+
+CURRENT_DIR = Path(__file__).parent
+EMBED_CACHE_ENABLED = os.getenv("RAG_EMBED_CACHE", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_PATH = Path(os.getenv("RAG_EMBED_CACHE_PATH", CURRENT_DIR / "../embedding-cache/embeddings.sqlite"))
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so re-extracted but otherwise identical text hits the cache."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    def __init__(self, path: Path = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model_name: str, text: str, engine: str = "torch") -> str:
+        return hashlib.sha256(f"{model_name}\0{engine}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: vector} for the keys present, marking them recently used."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 900):
+                batch = keys[start:start + 900]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", ((now, k) for k in found))
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """Store {key: vector}, then evict least recently used entries beyond max_entries."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                ((key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), {self.evictions} evicted"
+
+    def close(self):
+        self._conn.close()
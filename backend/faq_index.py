@@ -0,0 +1,342 @@
+"""
+Fast path for predictable questions: a small FAQ index answered without the LLM.
+
+Opening hours, pricing and "what can you do" come up in call after call, and
+each still costs a full LLM round trip. Ingest builds an FAQ index next to
+the vector store from two sources:
+
+- a curated file, faq.jsonl next to the corpus's docs directory, with one
+  {"questions": [...], "answer": "..."} per line ("question" for just one), and
+- with RAG_QUESTION_LOG set, the questions callers asked most often
+  (RAG_FAQ_MIN_COUNT times or more in the last RAG_FAQ_HISTORY_DAYS days,
+  against the current index version) with the latest answer the agent gave.
+
+Curated entries win over logged ones. At the final transcript the agent
+first looks the question's content words up exactly (no embedding, before
+retrieval). That needs RAG_FAQ_MIN_TEXT_TERMS content words, since one
+word ("refund") says too little about the question; shorter questions, and
+ones made only of stopwords ("what can you do"), must match an FAQ
+question's wording exactly. The agent then compares the retrieval's query embedding with every FAQ
+question. A hit at or above RAG_FAQ_THRESHOLD is spoken as stored, from the
+TTS cache when it has the audio; anything else goes on to the LLM.
+
+Layout of an FAQ directory:
+    meta.json      count, embedding model, source hash
+    entries.json   [{"questions", "answer", "source", "count"}] and the entry of each vector row
+    vectors.npy    unit query embedding of every question (float32)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from bm25_store import tokenize
+from query_cache import normalize_transcript
+
+logger = logging.getLogger("faq-index")
+
+FAQ_ENABLED = os.getenv("RAG_FAQ", "true").lower() in ("1", "true", "yes")
+FAQ_THRESHOLD = float(os.getenv("RAG_FAQ_THRESHOLD", "0.9"))
+FAQ_MIN_TEXT_TERMS = int(os.getenv("RAG_FAQ_MIN_TEXT_TERMS", "2"))
+FAQ_MIN_COUNT = int(os.getenv("RAG_FAQ_MIN_COUNT", "3"))
+FAQ_MAX_FREQUENT = int(os.getenv("RAG_FAQ_MAX_FREQUENT", "50"))
+FAQ_HISTORY_DAYS = float(os.getenv("RAG_FAQ_HISTORY_DAYS", "14"))
+QUESTION_LOG = Path(os.getenv("RAG_QUESTION_LOG")) if os.getenv("RAG_QUESTION_LOG") else None
+
+FAQ_FILE_NAME = "faq.jsonl"
+FAQ_DIR_NAME = "faq"
+FREQUENT_VARIANTS = 3  # surface forms of a frequent question that are embedded
+
+
+def faq_file(docs_dir: Path) -> Path:
+    """The curated FAQ of the corpus whose documents are in docs_dir."""
+    return docs_dir.parent / FAQ_FILE_NAME
+
+
+def match_key(question: str) -> str:
+    """Exact-match key: the question's content words, sorted.
+
+    "What are your hours?" and "your hours, what are they" share a key.
+    Questions made only of stopwords ("what can you do") fall back to the
+    normalized transcript.
+    """
+    terms = sorted(set(tokenize(question)))
+    return " ".join(terms) if terms else normalize_transcript(question)
+
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+# ============================================
+# Question log (written by the agent)
+# ============================================
+class QuestionLog:
+    """Append-only JSON lines of answered questions, the history frequent FAQ entries come from.
+
+    Job processes append to the same file; each record is one short write.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, corpus: str, version: str, question: str, answer: str):
+        record = {"time": time.time(), "corpus": corpus, "version": version, "question": question, "answer": answer}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def read_question_log(path: Path, corpus: str, version: str, since: float) -> list:
+    """[(question, answer)] the log holds for corpus at index version, oldest first, from `since` on."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if record.get("corpus") == corpus and record.get("version") == version and record.get("time", 0) >= since:
+                records.append((record["question"], record["answer"]))
+    return records
+
+
+# ============================================
+# Build (ingest)
+# ============================================
+def read_curated(path: Path) -> list:
+    """[(questions, answer)] from a curated FAQ file; raises ValueError naming the bad line."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                questions = record.get("questions") or [record["question"]]
+                answer = record["answer"].strip()
+            except (ValueError, KeyError, AttributeError, TypeError):
+                raise ValueError(f"{path}:{number}: expected {{\"questions\": [...], \"answer\": \"...\"}}")
+            questions = [q.strip() for q in questions if isinstance(q, str) and q.strip()]
+            if questions and answer:
+                entries.append((questions, answer))
+    return entries
+
+
+def frequent_questions(records: list, min_count: int = FAQ_MIN_COUNT, limit: int = FAQ_MAX_FREQUENT) -> list:
+    """[(questions, answer, count)] for the `limit` most asked questions, asked at least min_count times.
+
+    Questions are grouped by match_key; each group keeps its most common
+    wordings and the latest answer.
+    """
+    groups = {}
+    for question, answer in records:
+        group = groups.setdefault(match_key(question), {"wordings": Counter(), "answer": None, "count": 0})
+        group["wordings"][question.strip()] += 1
+        group["answer"] = answer
+        group["count"] += 1
+    ranked = sorted(groups.values(), key=lambda group: group["count"], reverse=True)
+    return [
+        ([wording for wording, _ in group["wordings"].most_common(FREQUENT_VARIANTS)], group["answer"], group["count"])
+        for group in ranked[:limit]
+        if group["count"] >= min_count
+    ]
+
+
+def source_hash(curated_path: Path, log_path: Path, corpus: str, version: str, embed_model: str) -> str:
+    """Identifies the inputs an FAQ index is built from; the log counts by size and mtime."""
+    digest = hashlib.sha256(f"{corpus}\0{version}\0{embed_model}\0{FAQ_MIN_COUNT}\0{FAQ_MAX_FREQUENT}".encode())
+    if curated_path is not None and curated_path.exists():
+        digest.update(curated_path.read_bytes())
+    if log_path is not None and log_path.exists():
+        stat = log_path.stat()
+        digest.update(f"\0{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def read_meta(faq_dir: Path) -> dict:
+    """Return an FAQ directory's meta.json, or {} if there is none."""
+    meta_path = faq_dir / "meta.json"
+    if not meta_path.exists():
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def build_faq(
+    out_dir: Path,
+    curated_path: Path,
+    log_path: Path,
+    corpus: str,
+    version: str,
+    embed_queries,
+    embed_model: str,
+    threshold: float = FAQ_THRESHOLD,
+) -> int:
+    """Write the FAQ directory from the curated file and the question log; returns the entry count.
+
+    embed_queries embeds a list of questions the way the agent embeds
+    queries. The directory is replaced atomically.
+    """
+    entries = []
+    if curated_path is not None and curated_path.exists():
+        entries = [
+            {"questions": questions, "answer": answer, "source": "curated", "count": 0}
+            for questions, answer in read_curated(curated_path)
+        ]
+    curated_rows = sum(len(entry["questions"]) for entry in entries)
+    frequent = []
+    if log_path is not None and log_path.exists():
+        since = time.time() - FAQ_HISTORY_DAYS * 86400
+        frequent = frequent_questions(read_question_log(log_path, corpus, version, since))
+    curated_keys = {match_key(q) for entry in entries for q in entry["questions"]}
+    frequent = [item for item in frequent if not curated_keys & {match_key(q) for q in item[0]}]
+
+    questions = [q for entry in entries for q in entry["questions"]] + [q for item in frequent for q in item[0]]
+    vectors = _unit(embed_queries(questions)) if questions else np.zeros((0, 0), dtype=np.float32)
+
+    # Logged questions a curated one already answers (by meaning) are left to the curated entry
+    kept_rows, row = list(range(curated_rows)), curated_rows
+    for wordings, answer, count in frequent:
+        rows = range(row, row + len(wordings))
+        row += len(wordings)
+        if curated_rows and float((vectors[rows] @ vectors[:curated_rows].T).max()) >= threshold:
+            continue
+        entries.append({"questions": wordings, "answer": answer, "source": "frequent", "count": count})
+        kept_rows.extend(rows)
+    vectors = vectors[kept_rows]
+    row_entries = [i for i, entry in enumerate(entries) for _ in entry["questions"]]
+
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / "vectors.npy", vectors)
+    with open(tmp_dir / "entries.json", "w", encoding="utf-8") as f:
+        json.dump({"entries": entries, "rows": row_entries}, f, indent=2, ensure_ascii=False)
+    meta = {
+        "count": len(entries),
+        "curated": sum(entry["source"] == "curated" for entry in entries),
+        "frequent": sum(entry["source"] == "frequent" for entry in entries),
+        "questions": len(row_entries),
+        "embed_model": embed_model,
+        "source_hash": source_hash(curated_path, log_path, corpus, version, embed_model),
+    }
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(
+        f"Wrote FAQ index with {meta['curated']} curated and {meta['frequent']} frequent entries to '{out_dir}'"
+    )
+    return len(entries)
+
+
+def faq_stale(
+    persist_dir: Path, curated_path: Path, log_path: Path, corpus: str, version: str, embed_model: str
+) -> bool:
+    """Whether the FAQ index is missing or was built from other inputs."""
+    meta = read_meta(persist_dir / FAQ_DIR_NAME)
+    return meta.get("source_hash") != source_hash(curated_path, log_path, corpus, version, embed_model)
+
+
+# ============================================
+# Matching (agent)
+# ============================================
+class FaqIndex:
+    """Read-only view of an FAQ directory."""
+
+    def __init__(self, faq_dir: Path, threshold: float = FAQ_THRESHOLD, min_text_terms: int = FAQ_MIN_TEXT_TERMS):
+        self.meta = read_meta(faq_dir)
+        if not self.meta:
+            raise FileNotFoundError(f"No FAQ index at '{faq_dir}'. Run `python ingest.py` to build it.")
+        with open(faq_dir / "entries.json", encoding="utf-8") as f:
+            data = json.load(f)
+        self.entries = data["entries"]
+        self.rows = np.asarray(data["rows"], dtype=np.int64)
+        self.vectors = np.load(faq_dir / "vectors.npy")
+        self.threshold = threshold
+        self.min_text_terms = max(min_text_terms, 1)
+        self._by_terms = {}  # sorted content words -> entry, for questions with min_text_terms of them
+        self._by_wording = {}  # normalized transcript -> entry
+        for i, entry in enumerate(self.entries):
+            for question in entry["questions"]:
+                self._by_wording.setdefault(normalize_transcript(question), i)
+                terms = set(tokenize(question))
+                if len(terms) >= self.min_text_terms:
+                    self._by_terms.setdefault(" ".join(sorted(terms)), i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def answers(self) -> list:
+        return [entry["answer"] for entry in self.entries]
+
+    def match_text(self, query: str):
+        """Return (answer, 1.0) if query has the content words of an FAQ question, or None.
+
+        Queries with fewer than min_text_terms content words must have an FAQ
+        question's normalized wording instead.
+        """
+        terms = set(tokenize(query))
+        if len(terms) >= self.min_text_terms:
+            entry = self._by_terms.get(" ".join(sorted(terms)))
+        else:
+            entry = self._by_wording.get(normalize_transcript(query))
+        return (self.entries[entry]["answer"], 1.0) if entry is not None else None
+
+    def match_embedding(self, embedding):
+        """Return (answer, similarity) for the closest FAQ question at or above threshold, or None."""
+        if embedding is None or not len(self.rows):
+            return None
+        query = _unit([embedding])[0]
+        if query.shape[0] != self.vectors.shape[1]:
+            return None  # built with another embedding model; re-run ingest
+        scores = self.vectors @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self.entries[self.rows[best]]["answer"], float(scores[best])
+
+
+_loaded = {}  # faq dir -> (meta mtime, FaqIndex or None)
+_loaded_lock = threading.Lock()
+
+
+def load_faq(persist_dir: Path):
+    """The FAQ index of the corpus stored in persist_dir, or None if it has none (or RAG_FAQ is off).
+
+    Loaded once per process and again only after ingest rewrites it.
+    """
+    if not FAQ_ENABLED:
+        return None
+    faq_dir = persist_dir / FAQ_DIR_NAME
+    try:
+        mtime = (faq_dir / "meta.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _loaded_lock:
+        cached = _loaded.get(faq_dir)
+        if cached is None or cached[0] != mtime:
+            faq = FaqIndex(faq_dir)
+            cached = _loaded[faq_dir] = (mtime, faq if len(faq) else None)
+            if len(faq):
+                logger.info(f"Loaded FAQ index with {len(faq)} entries from '{faq_dir}'")
+        return cached[1]
@@ -0,0 +1,116 @@
+"""
+Hybrid lexical + dense retrieval with reciprocal-rank fusion and optional reranking.
+
+The dense retriever (SimpleVectorStore or ANN) and the BM25 index each return
+their top candidates; reciprocal-rank fusion merges the two rankings without
+having to calibrate their scores against each other. A small CPU
+cross-encoder can then reorder the head of the fused list. It runs under a
+strict latency cap: if it doesn't finish in time, or the previous rerank is
+still running, the fused order is used as is.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from bm25_store import BM25Index
+
+logger = logging.getLogger("hybrid-retrieval")
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60) -> list:
+    """Fuse ranked id lists into [(id, score)], best first; score = sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, 1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class CrossEncoderReranker:
+    """Reorders the top candidates by cross-encoder relevance within timeout_ms."""
+
+    def __init__(self, model_name: str, candidates: int = 8, timeout_ms: float = 60):
+        # Imported here: pulls in torch/transformers (already loaded by the embedding model)
+        from sentence_transformers import CrossEncoder
+
+        logger.info(f"Loading reranker model {model_name}...")
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.candidates = candidates
+        self.timeout_ms = timeout_ms
+        self.timeouts = 0
+        self.skipped = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._running = None
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, nodes: list) -> list:
+        """Return nodes with the first `candidates` reordered, or unchanged if the cap is missed."""
+        head = nodes[:self.candidates]
+        if len(head) < 2:
+            return nodes
+        with self._lock:
+            if self._running is not None and not self._running.done():
+                # A timed-out rerank is still scoring; queueing behind it would miss the cap too
+                self.skipped += 1
+                return nodes
+            self._running = self._executor.submit(
+                self.model.predict, [(query, n.node.get_content()) for n in head], show_progress_bar=False
+            )
+            future = self._running
+        try:
+            scores = future.result(timeout=self.timeout_ms / 1000)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Rerank exceeded {self.timeout_ms:.0f}ms, keeping fused order")
+            return nodes
+        order = sorted(range(len(head)), key=lambda i: scores[i], reverse=True)
+        return [NodeWithScore(node=head[i].node, score=float(scores[i])) for i in order] + nodes[len(head):]
+
+
+class HybridRetriever(BaseRetriever):
+    """LlamaIndex retriever fusing a dense retriever's candidates with BM25 candidates.
+
+    dense must return at least `candidates` results; nodes found only by BM25
+    are fetched from docstore.
+    """
+
+    def __init__(
+        self,
+        dense: BaseRetriever,
+        bm25: BM25Index,
+        docstore,
+        top_k: int,
+        candidates: int = 20,
+        rrf_k: int = 60,
+        reranker: CrossEncoderReranker = None,
+    ):
+        super().__init__()
+        self._dense = dense
+        self._bm25 = bm25
+        self._docstore = docstore
+        self._top_k = top_k
+        self._candidates = candidates
+        self._rrf_k = rrf_k
+        self._reranker = reranker
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list:
+        dense = self._dense.retrieve(query_bundle)
+        lexical = self._bm25.search(query_bundle.query_str, self._candidates)
+        fused = reciprocal_rank_fusion(
+            [[n.node.node_id for n in dense], [node_id for node_id, _ in lexical]], self._rrf_k
+        )
+        fused = fused[:max(self._top_k, self._reranker.candidates if self._reranker else 0)]
+
+        nodes = {n.node.node_id: n.node for n in dense}
+        missing = [node_id for node_id, _ in fused if node_id not in nodes]
+        if missing:
+            nodes.update((node.node_id, node) for node in self._docstore.get_nodes(missing, raise_error=False))
+        results = [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused if node_id in nodes]
+        if self._reranker is not None:
+            results = self._reranker.rerank(query_bundle.query_str, results)
+        return results[:self._top_k]
@@ -0,0 +1,217 @@
+"""
+Per-customer knowledge bases: corpus selection and an LRU pool of loaded indexes.
+
+With RAG_CORPORA_DIR set, every subdirectory of it is a corpus:
+
+    corpora/
+        acme/docs/...                   # source documents
+        acme/chat-engine-storage/       # its index, built by `python ingest.py --corpus acme`
+        globex/docs/...
+
+The entrypoint picks a corpus per room: a "corpus" key in the participant's
+JSON metadata wins, then the room name (the RAG_CORPUS_ROOM_PATTERN group
+"corpus", by default the part before the first "-" or "_"), then
+RAG_DEFAULT_CORPUS. "default" is the single-tenant DOCS_DIR/PERSIST_DIR
+index unless a corpus of that name exists.
+
+Indexes load on first retrieval. Once the loaded ones exceed
+RAG_INDEX_POOL_MB, the least recently used are unloaded, so one process
+(a job process or the retrieval service) can serve many corpora without
+holding them all in memory.
+
+After a re-ingest, loaded indexes are hot-reloaded: a watcher thread checks
+every RAG_INDEX_RELOAD_INTERVAL_S (or at once on SIGHUP in the retrieval
+service) for a newer index version, loads it in the background and swaps it
+in for new sessions. Sessions already running stay on the version they
+started with (rag_index.CorpusIndex).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import rag_index
+
+logger = logging.getLogger("index-pool")
+
+CORPORA_DIR = Path(os.getenv("RAG_CORPORA_DIR")) if os.getenv("RAG_CORPORA_DIR") else None
+DEFAULT_CORPUS = os.getenv("RAG_DEFAULT_CORPUS", "default")
+CORPUS_ROOM_PATTERN = re.compile(os.getenv("RAG_CORPUS_ROOM_PATTERN", r"^(?P<corpus>[A-Za-z0-9]+)[-_]"))
+INDEX_POOL_BYTES = int(float(os.getenv("RAG_INDEX_POOL_MB", "1024")) * 1024 * 1024)
+RELOAD_INTERVAL_S = float(os.getenv("RAG_INDEX_RELOAD_INTERVAL_S", "30"))
+CORPUS_DOCS_DIR = "docs"
+CORPUS_PERSIST_DIR = "chat-engine-storage"
+
+# Corpus names become directory names; anything else is refused
+_VALID_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+def corpus_names() -> list:
+    """Names of the corpora under RAG_CORPORA_DIR (those with a docs directory)."""
+    if CORPORA_DIR is None or not CORPORA_DIR.is_dir():
+        return []
+    return sorted(
+        path.name
+        for path in CORPORA_DIR.iterdir()
+        if (path / CORPUS_DOCS_DIR).is_dir() and _VALID_NAME.match(path.name)
+    )
+
+
+def corpus_dirs(name: str):
+    """(docs_dir, persist_dir) for a corpus name; raises KeyError for unknown names."""
+    if CORPORA_DIR is not None and _VALID_NAME.match(name) and (CORPORA_DIR / name / CORPUS_DOCS_DIR).is_dir():
+        return CORPORA_DIR / name / CORPUS_DOCS_DIR, CORPORA_DIR / name / CORPUS_PERSIST_DIR
+    if name == "default":
+        return rag_index.DOCS_DIR, rag_index.PERSIST_DIR
+    raise KeyError(f"Unknown corpus '{name}'")
+
+
+def select_corpus(room_name: str = "", participant_metadata: str = "") -> str:
+    """Pick the corpus for a room from participant metadata, then the room name, else the default."""
+    candidates = []
+    if participant_metadata:
+        try:
+            metadata = json.loads(participant_metadata)
+        except ValueError:
+            metadata = None
+        if isinstance(metadata, dict) and metadata.get("corpus"):
+            candidates.append(("participant metadata", str(metadata["corpus"])))
+    match = CORPUS_ROOM_PATTERN.search(room_name or "")
+    if match and match.groupdict().get("corpus"):
+        candidates.append(("room name", match.group("corpus")))
+
+    for source, name in candidates:
+        try:
+            corpus_dirs(name)
+        except KeyError:
+            if source == "participant metadata":
+                logger.warning(f"Participant asked for unknown corpus '{name}', ignoring it")
+            continue
+        logger.info(f"Using corpus '{name}' (from {source})")
+        return name
+    return DEFAULT_CORPUS
+
+
+class IndexPool:
+    """CorpusIndex per corpus name, with the loaded ones kept under a memory budget (LRU)."""
+
+    def __init__(self, max_bytes: int = INDEX_POOL_BYTES):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._corpora = {}  # name -> CorpusIndex; order is recency of use
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._wake = threading.Event()
+
+    def get(self, name: str = DEFAULT_CORPUS) -> rag_index.CorpusIndex:
+        """The CorpusIndex for name (not necessarily loaded), marked as most recently used."""
+        with self._lock:
+            corpus = self._corpora.pop(name, None)
+            if corpus is None:
+                docs_dir, persist_dir = corpus_dirs(name)
+                if persist_dir == rag_index.PERSIST_DIR:
+                    corpus = rag_index.DEFAULT_CORPUS_INDEX
+                else:
+                    corpus = rag_index.CorpusIndex(name, docs_dir, persist_dir)
+            self._corpora[name] = corpus
+            return corpus
+
+    def load(self, name: str, top_k: int) -> rag_index.CorpusIndex:
+        """Load name's index and retriever for top_k (blocking), evicting others if over budget."""
+        corpus = self.get(name)
+        corpus.get_retriever(top_k)
+        self.evict(keep=corpus)
+        return corpus
+
+    def retrieve_batch(self, items: list, cancelled=None) -> list:
+        """Retrieve for [(corpus, query, top_k, snapshot)], returning [(query embedding, nodes)] (blocking).
+
+        snapshot pins a session to an index version; None uses the corpus's current one.
+        Items for which cancelled(i) turns true are skipped and get None.
+        """
+        groups = {}
+        for i, (name, _, _, snapshot) in enumerate(items):
+            groups.setdefault((name, id(snapshot)), []).append(i)
+        results = [None] * len(items)
+        for indices in groups.values():
+            name, _, _, snapshot = items[indices[0]]
+            corpus = self.get(name)
+            batch = corpus.retrieve_batch(
+                [(items[i][1], items[i][2]) for i in indices],
+                snapshot,
+                cancelled and (lambda j, indices=indices: cancelled(indices[j])),
+            )
+            for i, result in zip(indices, batch):
+                results[i] = result
+            self.evict(keep=corpus)
+        return results
+
+    def reload_changed(self) -> int:
+        """Reload every loaded corpus with a newer index version on disk (blocking); returns how many."""
+        with self._lock:
+            corpora = [corpus for corpus in self._corpora.values() if corpus.loaded]
+        reloaded = sum(corpus.reload() for corpus in corpora)
+        if reloaded:
+            self.evict()
+        return reloaded
+
+    def request_reload(self):
+        """Have the watcher check for new index versions now instead of at its next interval."""
+        self._wake.set()
+
+    def watch(self, interval_s: float = RELOAD_INTERVAL_S):
+        """Start the reload watcher thread, once per process; interval_s <= 0 only reloads on request."""
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(
+                target=self._watch, args=(interval_s,), name="index-reload", daemon=True
+            )
+        self._watcher.start()
+
+    def _watch(self, interval_s: float):
+        while True:
+            self._wake.wait(interval_s if interval_s > 0 else None)
+            self._wake.clear()
+            try:
+                self.reload_changed()
+            except Exception:
+                logger.exception("Index reload check failed")
+
+    def evict(self, keep: rag_index.CorpusIndex = None):
+        """Unload least recently used corpora until the loaded ones fit the budget."""
+        with self._lock:
+            loaded = [corpus for corpus in self._corpora.values() if corpus.loaded]
+            total = sum(corpus.memory_bytes for corpus in loaded)
+            victims = []
+            for corpus in loaded:
+                if total <= self.max_bytes:
+                    break
+                if corpus is keep:
+                    continue
+                victims.append(corpus)
+                total -= corpus.memory_bytes
+        for corpus in victims:
+            logger.info(
+                f"Index pool over its {self.max_bytes / 2**20:.0f}MB budget, "
+                f"unloading corpus '{corpus.name}' ({corpus.memory_bytes / 2**20:.1f}MB)"
+            )
+            corpus.unload()
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": [corpus.name for corpus in self._corpora.values() if corpus.loaded],
+                "memory_mb": round(sum(corpus.memory_bytes for corpus in self._corpora.values()) / 2**20, 1),
+                "budget_mb": round(self.max_bytes / 2**20, 1),
+                "evictions": self.evictions,
+                "reloads": sum(corpus.reloads for corpus in self._corpora.values()),
+            }
+
+
+# One pool per process: the job process, or the retrieval service when one is used
+POOL = IndexPool()
@@ -0,0 +1,212 @@
+"""
+Offline ingestion for the voice agent's knowledge base.
+
+Builds (or incrementally updates) the persisted RAG index from the docs
+directory, so the agent worker only has to load it.
+
+Usage:
+    python ingest.py              # sync new/changed/deleted files
+    python ingest.py --full       # discard storage and re-embed everything
+    python ingest.py --convert --vector-backend ivf
+                                  # convert existing JSON storage to the binary format
+    python ingest.py --corpus acme   # one customer's corpus under RAG_CORPORA_DIR
+    python ingest.py --corpus all    # every corpus under RAG_CORPORA_DIR
+
+Each run also refreshes the FAQ fast-path index (faq_index.py) when the
+curated faq.jsonl, the question log or the index changed.
+"""
+
+import argparse
+import logging
+import os
+import ssl
+import sys
+import time
+import warnings
+from pathlib import Path
+
+# Suppress Pydantic warning about validate_default
+warnings.filterwarnings("ignore", message=".*validate_default.*")
+
+try:
+    import certifi
+except ImportError:
+    certifi = None
+from dotenv import load_dotenv
+
+import embed_cache
+import faq_index
+import index_pool
+import ingest_pipeline
+import rag_index
+
+# Load environment variables
+load_dotenv()
+
+# Fix SSL certificate issue on Windows (embedding model download)
+if certifi:
+    ssl._create_default_https_context = lambda: ssl.create_default_context(cafile=certifi.where())
+    os.environ['SSL_CERT_FILE'] = certifi.where()
+    os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("ingest")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the voice agent's RAG index from the docs directory.")
+    parser.add_argument("--docs-dir", type=Path, default=rag_index.DOCS_DIR, help="Directory of source documents")
+    parser.add_argument("--persist-dir", type=Path, default=rag_index.PERSIST_DIR, help="Where to persist the index")
+    parser.add_argument(
+        "--corpus",
+        help="Ingest this corpus under RAG_CORPORA_DIR (or 'all' of them) instead of --docs-dir/--persist-dir",
+    )
+    parser.add_argument(
+        "--faq-file",
+        type=Path,
+        help="Curated FAQ questions and answers (default: faq.jsonl next to the docs directory)",
+    )
+    parser.add_argument("--full", action="store_true", help="Discard existing storage and rebuild from scratch")
+    parser.add_argument(
+        "--vector-backend",
+        choices=rag_index.VECTOR_BACKENDS,
+        default=rag_index.VECTOR_BACKEND,
+        help="Also export a memory-mapped ANN index for the 'flat' or 'ivf' backends",
+    )
+    parser.add_argument(
+        "--storage-format",
+        choices=rag_index.STORAGE_FORMATS,
+        default=rag_index.STORAGE_FORMAT,
+        help="'binary' also writes node text/metadata to SQLite next to the ANN vectors",
+    )
+    parser.add_argument(
+        "--bm25",
+        action=argparse.BooleanOptionalAction,
+        default=rag_index.HYBRID_RETRIEVAL,
+        help="Also build the BM25 index used by hybrid retrieval (default: on when RAG_HYBRID=true)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=ingest_pipeline.INGEST_WORKERS,
+        help="Processes used to parse and chunk files",
+    )
+    parser.add_argument(
+        "--embed-threads",
+        type=int,
+        default=ingest_pipeline.EMBED_THREADS,
+        help="Threads running embedding batches",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=ingest_pipeline.EMBED_BATCH_SIZE,
+        help="Chunks per embedding batch",
+    )
+    parser.add_argument(
+        "--no-embed-cache",
+        dest="embed_cache",
+        action="store_false",
+        default=embed_cache.EMBED_CACHE_ENABLED,
+        help="Embed every chunk instead of reusing cached embeddings",
+    )
+    parser.add_argument(
+        "--convert",
+        action="store_true",
+        help="Convert the existing JSON storage to the binary format without re-embedding, then exit",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.corpus:
+        return ingest(args, args.docs_dir, args.persist_dir, "default")
+    names = index_pool.corpus_names() if args.corpus == "all" else [args.corpus]
+    if not names:
+        logger.error(f"No corpora found under RAG_CORPORA_DIR ({index_pool.CORPORA_DIR})")
+        return 1
+    status = 0
+    for name in names:
+        try:
+            docs_dir, persist_dir = index_pool.corpus_dirs(name)
+        except KeyError as e:
+            logger.error(e.args[0])
+            return 1
+        logger.info(f"Corpus '{name}': {docs_dir} -> {persist_dir}")
+        status = ingest(args, docs_dir, persist_dir, name) or status
+    return status
+
+
+def ingest(args, docs_dir: Path, persist_dir: Path, corpus: str) -> int:
+    start = time.perf_counter()
+    if args.convert:
+        try:
+            rag_index.convert_storage(persist_dir, args.vector_backend)
+        except (FileNotFoundError, ValueError) as e:
+            logger.error(str(e))
+            return 1
+        logger.info(f"Conversion finished in {time.perf_counter() - start:.1f}s.")
+        return 0
+
+    up_to_date = (
+        not args.full
+        and docs_dir.exists()
+        and not rag_index.docs_changed(docs_dir, persist_dir)
+        and (
+            args.vector_backend == "simple"
+            or not rag_index.ann_stale(persist_dir, args.vector_backend, args.storage_format)
+        )
+        and not (args.bm25 and rag_index.bm25_stale(persist_dir))
+    )
+    if up_to_date:
+        logger.info("Index is up to date with the docs directory.")
+        return sync_faq(args, docs_dir, persist_dir, corpus)
+    pipeline = ingest_pipeline.IngestPipeline(
+        rag_index.get_embed_model(),
+        workers=args.workers,
+        embed_threads=args.embed_threads,
+        batch_size=args.batch_size,
+        cache=embed_cache.EmbeddingCache() if args.embed_cache else None,
+    )
+    try:
+        rag_index.build_index(
+            docs_dir,
+            persist_dir,
+            full=args.full,
+            vector_backend=args.vector_backend,
+            storage_format=args.storage_format,
+            pipeline=pipeline,
+            bm25=args.bm25,
+        )
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        return 1
+    status = sync_faq(args, docs_dir, persist_dir, corpus)
+    logger.info(f"Ingestion finished in {time.perf_counter() - start:.1f}s.")
+    return status
+
+
+def sync_faq(args, docs_dir: Path, persist_dir: Path, corpus: str) -> int:
+    """Rebuild the FAQ index if its curated file, the question log or the index version changed."""
+    curated = args.faq_file or faq_index.faq_file(docs_dir)
+    log = faq_index.QUESTION_LOG
+    version = rag_index.index_version(persist_dir)
+    model = rag_index.EMBED_MODEL_NAME
+    if not faq_index.faq_stale(persist_dir, curated, log, corpus, version, model):
+        return 0
+    try:
+        faq_index.build_faq(
+            persist_dir / faq_index.FAQ_DIR_NAME, curated, log, corpus, version, rag_index.embed_queries, model
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Batched, parallel, memory-bounded ingestion pipeline.
+
+VectorStoreIndex.from_documents loads every document, parses, chunks and
+embeds on one thread with the library's default batch size. This pipeline
+instead:
+  1. streams each file as bounded sections (a range of PDF pages, or of
+     paragraphs of a text file) and parses and chunks them in a process pool,
+     with at most a few sections in flight, so parsing waits for embedding,
+  2. embeds chunks in large batches of similar-length texts (less padding
+     per forward pass) across a thread pool, skipping texts already in the
+     persistent embedding cache,
+  3. streams each embedded buffer into the index as soon as it is ready,
+and reports throughput in chunks per second. Memory used by ingestion beyond
+the index itself stays bounded however large the files or the corpus are.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import MetadataMode
+
+from embed_cache import EmbeddingCache
+
+logger = logging.getLogger("ingest-pipeline")
+
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+EMBED_THREADS = int(os.getenv("RAG_EMBED_THREADS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+# LlamaIndex's SentenceSplitter defaults, so existing indexes stay comparable
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1024"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+# Size of the sections large files are streamed in, and how many may be parsed ahead of embedding
+SECTION_BYTES = int(float(os.getenv("RAG_INGEST_SECTION_KB", "256")) * 1024)
+PDF_SECTION_PAGES = int(os.getenv("RAG_INGEST_PDF_PAGES", "16"))
+MAX_PENDING_SECTIONS = int(os.getenv("RAG_INGEST_MAX_PENDING", "0"))  # 0 = twice the workers
+
+# Formats SimpleDirectoryReader has a reader for (besides PDF), read with it in one piece;
+# listed here because importing the readers in the parent process costs ~35MB. Other files are plain text.
+STREAMED_PDF_SUFFIX = ".pdf"
+READER_SUFFIXES = frozenset(
+    ".csv .docx .epub .gif .hwp .ipynb .jpeg .jpg .mbox .mp3 .mp4 .png .ppt .pptm .pptx .webp .xls .xlsx".split()
+)
+# Kept out of embeddings and prompts, as SimpleDirectoryReader does
+EXCLUDED_METADATA_KEYS = [
+    "file_name", "file_type", "file_size", "creation_date", "last_modified_date", "last_accessed_date",
+]
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    documents: int = 0
+    chunks: int = 0
+    parse_seconds: float = 0.0
+    embed_seconds: float = 0.0
+    total_seconds: float = 0.0
+    failed: set = field(default_factory=set)  # files with a section that could not be read
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.total_seconds if self.total_seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.files} files, {self.documents} documents, {self.chunks} chunks in {self.total_seconds:.1f}s "
+            f"({self.chunks_per_second:.1f} chunks/s; parse {self.parse_seconds:.1f}s, "
+            f"embed {self.embed_seconds:.1f}s)"
+        )
+
+
+def plan_sections(path, section_bytes: int = SECTION_BYTES, pdf_pages: int = PDF_SECTION_PAGES):
+    """Yield (kind, start, end) sections covering a file, without loading it.
+
+    PDFs split into ranges of pdf_pages pages; text files into byte ranges
+    of about section_bytes ending at a blank line (or any line end, once
+    twice that long). Formats with their own reader are one section.
+    """
+    suffix = path.suffix.lower()
+    if suffix == STREAMED_PDF_SUFFIX:
+        import pypdf
+
+        pages = len(pypdf.PdfReader(path).pages)
+        for start in range(0, pages, pdf_pages):
+            yield "pdf", start, min(start + pdf_pages, pages)
+        return
+    if suffix in READER_SUFFIXES:
+        yield "reader", 0, 0
+        return
+
+    start = offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            offset += len(line)
+            size = offset - start
+            if (size >= section_bytes and not line.strip()) or size >= 2 * section_bytes:
+                yield "text", start, offset
+                start = offset
+    if offset > start or offset == 0:
+        yield "text", start, offset
+
+
+def _read_section(path: str, kind: str, start: int, end: int) -> list:
+    """Documents of one planned section, with the metadata SimpleDirectoryReader would give them."""
+    if kind == "reader":
+        return SimpleDirectoryReader(input_files=[path]).load_data()
+
+    metadata = default_file_metadata_func(path)
+    if kind == "pdf":
+        import pypdf
+
+        pdf = pypdf.PdfReader(path)
+        documents = [
+            Document(
+                text=pdf.pages[page].extract_text(),
+                metadata={"page_label": pdf.page_labels[page], **metadata},
+            )
+            for page in range(start, end)
+        ]
+    else:
+        with open(path, "rb") as f:
+            f.seek(start)
+            documents = [Document(text=f.read(end - start).decode("utf-8", errors="ignore"), metadata=metadata)]
+    for document in documents:
+        document.excluded_embed_metadata_keys.extend(EXCLUDED_METADATA_KEYS)
+        document.excluded_llm_metadata_keys.extend(EXCLUDED_METADATA_KEYS)
+    return documents
+
+
+def parse_section(
+    rel: str,
+    path: str,
+    kind: str,
+    start: int,
+    end: int,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+):
+    """Read and chunk one section of a file; returns (rel, doc_ids, nodes), doc_ids None if unreadable.
+
+    Runs in a pool process, so it must stay top-level and picklable. Only the
+    chunks come back; the section's full text is freed in the worker.
+    """
+    try:
+        documents = _read_section(path, kind, start, end)
+    except Exception as e:
+        # As SimpleDirectoryReader does with unreadable files; the file is retried on the next sync
+        logger.warning(f"Failed to read {rel} ({kind} {start}-{end}): {e}. Skipping...")
+        return rel, None, []
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    nodes = splitter.get_nodes_from_documents(documents)
+    return rel, [doc.doc_id for doc in documents], nodes
+
+
+class IngestPipeline:
+    def __init__(
+        self,
+        embed_model,
+        workers: int = INGEST_WORKERS,
+        embed_threads: int = EMBED_THREADS,
+        batch_size: int = EMBED_BATCH_SIZE,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        cache: EmbeddingCache = None,
+        section_bytes: int = SECTION_BYTES,
+        pdf_pages: int = PDF_SECTION_PAGES,
+        max_pending: int = MAX_PENDING_SECTIONS,
+    ):
+        self.embed_model = embed_model
+        self.model_name = getattr(embed_model, "model_name", type(embed_model).__name__)
+        self.engine = getattr(embed_model, "engine", "torch")
+        self.cache = cache
+        if getattr(embed_model, "embed_batch_size", batch_size) < batch_size:
+            # get_text_embedding_batch re-splits into embed_batch_size chunks (default 10)
+            embed_model.embed_batch_size = batch_size
+        self.workers = max(1, workers)
+        self.embed_threads = max(1, embed_threads)
+        self.batch_size = max(1, batch_size)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.section_bytes = section_bytes
+        self.pdf_pages = pdf_pages
+        self.max_pending = max_pending if max_pending > 0 else 2 * self.workers
+        # Embed once this many chunks are buffered: enough for every thread to get full batches
+        self.flush_size = self.batch_size * self.embed_threads * 4
+
+    def _sections(self, files: dict):
+        for rel, path in files.items():
+            try:
+                sections = list(plan_sections(path, self.section_bytes, self.pdf_pages))
+            except Exception as e:
+                logger.warning(f"Failed to read {rel}: {e}. Skipping...")
+                yield rel, None
+                continue
+            for kind, start, end in sections:
+                yield rel, str(path), kind, start, end, self.chunk_size, self.chunk_overlap
+
+    def _parse(self, files: dict):
+        """Yield (rel, doc_ids, nodes) per section, in file order.
+
+        At most max_pending sections are parsed ahead of the consumer: the
+        next one is only submitted once an earlier one has been taken.
+        """
+        sections = self._sections(files)
+        if self.workers == 1:
+            for section in sections:
+                yield parse_section(*section) if section[1] else (section[0], None, [])
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for section in sections:
+                if section[1] is None:
+                    future = Future()
+                    future.set_result((section[0], None, []))
+                else:
+                    future = pool.submit(parse_section, *section)
+                pending.append(future)
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _embed_batch(self, nodes: list):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        if self.cache is None:
+            embeddings = self.embed_model.get_text_embedding_batch(texts)
+        else:
+            keys = [EmbeddingCache.key(self.model_name, text, self.engine) for text in texts]
+            cached = self.cache.get_many(keys)
+            missing = [i for i, key in enumerate(keys) if key not in cached]
+            if missing:
+                computed = self.embed_model.get_text_embedding_batch([texts[i] for i in missing])
+                new = {keys[i]: embedding for i, embedding in zip(missing, computed)}
+                self.cache.put_many(new)
+                cached.update(new)
+            embeddings = [cached[key] for key in keys]
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+
+    def embed(self, nodes: list, pool: ThreadPoolExecutor):
+        """Embed nodes in place, batching texts of similar length together."""
+        ordered = sorted(nodes, key=lambda node: len(node.get_content(metadata_mode=MetadataMode.EMBED)))
+        batches = [ordered[i:i + self.batch_size] for i in range(0, len(ordered), self.batch_size)]
+        for _ in pool.map(self._embed_batch, batches):
+            pass
+
+    def run(self, files: dict, insert_nodes):
+        """Parse, chunk and embed files ({rel: Path}), passing embedded nodes to insert_nodes.
+
+        Returns ({rel: [ref_doc_id, ...]}, IngestStats).
+        """
+        stats = IngestStats(files=len(files))
+        ref_doc_ids = {}
+        buffer = []
+        start = time.perf_counter()
+
+        def flush():
+            embed_start = time.perf_counter()
+            self.embed(buffer, embed_pool)
+            stats.embed_seconds += time.perf_counter() - embed_start
+            insert_nodes(list(buffer))
+            stats.chunks += len(buffer)
+            logger.info(f"Embedded {stats.chunks} chunks ({stats.chunks / (time.perf_counter() - start):.1f} chunks/s)")
+            buffer.clear()
+
+        with ThreadPoolExecutor(max_workers=self.embed_threads) as embed_pool:
+            parse_start = time.perf_counter()
+            for rel, doc_ids, nodes in self._parse(files):
+                stats.parse_seconds += time.perf_counter() - parse_start
+                ref_doc_ids.setdefault(rel, [])
+                if doc_ids is None:
+                    stats.failed.add(rel)
+                else:
+                    ref_doc_ids[rel].extend(doc_ids)
+                    stats.documents += len(doc_ids)
+                buffer.extend(nodes)
+                if len(buffer) >= self.flush_size:
+                    flush()
+                parse_start = time.perf_counter()
+            if buffer:
+                flush()
+
+        stats.total_seconds = time.perf_counter() - start
+        logger.info(f"Ingested {stats.summary()}")
+        if self.cache is not None:
+            logger.info(f"Embedding cache: {self.cache.stats()}")
+        return ref_doc_ids, stats
@@ -0,0 +1,71 @@
+"""
+SQLite node store for the binary index format.
+
+Replaces the JSON docstore at query time: each node is stored as a
+zlib-compressed JSON blob keyed by node id, so a worker only materializes
+the handful of nodes a query actually retrieves instead of parsing the
+whole docstore at startup.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+NODE_STORE_FILE = "nodes.sqlite"
+SQLITE_MAX_VARIABLES = 900
+
+
+def write_node_store(nodes, path: Path):
+    """Write nodes to a new SQLite file at path, replacing any existing one atomically."""
+    tmp_path = path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE nodes (id TEXT PRIMARY KEY, ref_doc_id TEXT, data BLOB NOT NULL)")
+        conn.executemany(
+            "INSERT INTO nodes VALUES (?, ?, ?)",
+            (
+                (node.node_id, node.ref_doc_id, zlib.compress(json.dumps(doc_to_json(node)).encode()))
+                for node in nodes
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+class SqliteNodeStore:
+    """Read-only node lookup by id; provides the docstore.get_nodes() subset retrievers use."""
+
+    def __init__(self, path: Path):
+        if not path.exists():
+            raise FileNotFoundError(f"No node store at '{path}'. Run `python ingest.py` to build it.")
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def get_nodes(self, node_ids: list, raise_error: bool = True) -> list:
+        """Fetch nodes in the order of node_ids."""
+        found = {}
+        for start in range(0, len(node_ids), SQLITE_MAX_VARIABLES):
+            batch = node_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM nodes WHERE id IN ({placeholders})", batch
+                ).fetchall()
+            for node_id, data in rows:
+                found[node_id] = json_to_doc(json.loads(zlib.decompress(data)))
+        missing = [node_id for node_id in node_ids if node_id not in found]
+        if missing and raise_error:
+            raise ValueError(f"Node ids not found in node store: {missing[:5]}")
+        return [found[node_id] for node_id in node_ids if node_id in found]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,318 @@
+"""
+int8-quantized ONNX Runtime engine for the embedding model.
+
+The PyTorch HuggingFaceEmbedding makes query embedding a visible part of
+every voice turn, and importing torch dominates worker startup time and RSS.
+With RAG_EMBED_ENGINE=onnx, rag_index loads OnnxEmbedding instead. It runs a
+dynamically int8-quantized ONNX export of the same model with onnxruntime and
+the `tokenizers` library, so the worker never imports torch or transformers.
+Pooling, normalization and the query prompt are copied from the torch model
+at export, so its vectors match the ones in an existing chat-engine-storage
+index to within the parity check's threshold, and no re-ingest is needed.
+
+The export needs torch, sentence-transformers and onnx, so run it once
+wherever those are installed and copy the model directory to the workers:
+
+    cd backend
+    python onnx_embedding.py export                 # RAG_EMBED_MODEL -> ../onnx-models/<model>/
+    python onnx_embedding.py parity                 # re-run the torch vs ONNX parity check
+
+The export runs the parity check itself and records the result in
+embedding_meta.json. It fails if the lowest cosine similarity between torch and
+ONNX embeddings of the docs' chunks and the evaluation questions falls below
+RAG_ONNX_PARITY_MIN.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+logger = logging.getLogger("onnx-embedding")
+
+CURRENT_DIR = Path(__file__).parent
+ONNX_MODELS_DIR = Path(os.getenv("RAG_ONNX_MODEL_DIR", CURRENT_DIR / "../onnx-models"))
+ONNX_THREADS = int(os.getenv("RAG_ONNX_THREADS", str(min(4, os.cpu_count() or 1))))
+PARITY_MIN_COSINE = float(os.getenv("RAG_ONNX_PARITY_MIN", "0.98"))
+META_FILE = "embedding_meta.json"
+MODEL_FILE = "model_int8.onnx"
+FP32_MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+PARITY_SAMPLE_CHUNKS = 200
+
+
+def onnx_model_dir(model_name: str) -> Path:
+    """Where the ONNX export of a HuggingFace model name lives."""
+    return ONNX_MODELS_DIR / model_name.replace("/", "--")
+
+
+def read_meta(model_dir: Path) -> dict:
+    meta_path = model_dir / META_FILE
+    if not meta_path.exists():
+        raise FileNotFoundError(
+            f"No ONNX embedding model at '{model_dir}'. Run `python onnx_embedding.py export` to create it."
+        )
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """LlamaIndex embedding model running an ONNX export with onnxruntime on CPU."""
+
+    model_dir: str
+    threads: int
+    engine: str  # what produced the vectors, besides the model: part of embedding cache keys
+    _session = PrivateAttr()
+    _tokenizer = PrivateAttr()
+    _meta = PrivateAttr()
+
+    def __init__(
+        self,
+        model_dir: Path,
+        threads: int = ONNX_THREADS,
+        model_file: str = MODEL_FILE,
+        require_parity: bool = True,
+        **kwargs,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        meta = read_meta(model_dir)
+        engine = f"onnx-{meta.get('quantization', 'dynamic-int8')}" if model_file == MODEL_FILE else "onnx-fp32"
+        super().__init__(
+            model_name=meta["model_name"], model_dir=str(model_dir), threads=threads, engine=engine, **kwargs
+        )
+        if require_parity and not meta.get("parity", {}).get("passed"):
+            logger.warning(f"ONNX model at '{model_dir}' has no passing parity check; its vectors may not match the index")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            str(model_dir / model_file), options, providers=["CPUExecutionProvider"]
+        )
+        tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        tokenizer.enable_truncation(max_length=meta["max_length"])
+        tokenizer.enable_padding(pad_id=meta["pad_token_id"], pad_token=meta["pad_token"])
+        self._tokenizer = tokenizer
+        self._meta = meta
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, sentences: list, prompt_name: str = None) -> list:
+        """Embed sentences in one forward pass, with the named prompt prepended as the torch model does."""
+        prompt = self._meta["prompts"].get(prompt_name, "") if prompt_name else ""
+        encodings = self._tokenizer.encode_batch([prompt + sentence for sentence in sentences])
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        arrays = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        (hidden,) = self._session.run([self._meta["output"]], {name: arrays[name] for name in self._meta["inputs"]})
+        if self._meta["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            vectors = (hidden * mask[..., None]).sum(axis=1) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        if self._meta["normalize"]:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32).tolist()
+
+    def _get_query_embedding(self, query: str) -> list:
+        return self._embed([query], prompt_name="query")[0]
+
+    async def _aget_query_embedding(self, query: str) -> list:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list:
+        return self._embed([text], prompt_name="text")[0]
+
+    def _get_text_embeddings(self, texts: list) -> list:
+        return self._embed(texts, prompt_name="text")
+
+
+# ============================================
+# Export and parity check (need torch)
+# ============================================
+def _pooling_mode(pooling_module) -> str:
+    """Pooling mode of a sentence-transformers Pooling module ("cls", "mean", ...)."""
+    mode = getattr(pooling_module, "pooling_mode", None)  # sentence-transformers >= 5
+    if isinstance(mode, str):
+        return mode
+    if mode is None and hasattr(pooling_module, "get_pooling_mode_str"):
+        return pooling_module.get_pooling_mode_str()
+    return "+".join(mode) if mode else "unknown"
+
+
+def export(model_name: str, out_dir: Path, opset: int = 17, keep_fp32: bool = False):
+    """Export model_name's transformer to ONNX, quantize it to int8 and save the tokenizer and pooling settings."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    import rag_index
+
+    hf_model = rag_index.load_embed_model(model_name, engine="torch")
+    st = hf_model._model  # SentenceTransformer: [Transformer, Pooling, (Normalize)]
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+    pooling = _pooling_mode(st[1])
+    if pooling not in ("cls", "mean"):
+        raise ValueError(f"Unsupported pooling '{pooling}' for the ONNX engine (cls or mean)")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sample = tokenizer(["onnx export sample"], return_tensors="pt")
+    # BERT-style forward(input_ids, attention_mask, token_type_ids)
+    inputs = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    fp32_path = out_dir / FP32_MODEL_FILE
+    logger.info(f"Exporting {model_name} to ONNX (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in inputs),
+            str(fp32_path),
+            input_names=inputs,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in inputs + ["last_hidden_state"]},
+            opset_version=opset,
+        )
+    logger.info("Quantizing weights to int8...")
+    quantize_dynamic(str(fp32_path), str(out_dir / MODEL_FILE), weight_type=QuantType.QInt8)
+    if not keep_fp32:
+        for path in out_dir.glob(FP32_MODEL_FILE + "*"):  # newer exporters write weights to model.onnx.data
+            path.unlink()
+    tokenizer.save_pretrained(str(out_dir))  # writes tokenizer.json for the `tokenizers` library
+
+    meta = {
+        "model_name": model_name,
+        "pooling": pooling,
+        "normalize": bool(getattr(hf_model, "normalize", True)),
+        "max_length": int(st.max_seq_length),
+        "prompts": dict(st.prompts),
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "inputs": inputs,
+        "output": "last_hidden_state",
+        "quantization": "dynamic-int8",
+        "opset": opset,
+    }
+    with open(out_dir / META_FILE, "w") as f:
+        json.dump(meta, f, indent=2)
+    logger.info(f"Wrote ONNX embedding model to '{out_dir}'")
+    return meta
+
+
+def parity_texts(docs_dir: Path, eval_set: Path) -> tuple:
+    """(passages, questions) to compare engines on: chunks of the docs and the evaluation questions."""
+    import ingest_pipeline
+    import rag_index
+
+    passages = []
+    for rel, path in rag_index.scan_docs(docs_dir).items():
+        for section in ingest_pipeline.plan_sections(path):
+            _, _, nodes = ingest_pipeline.parse_section(rel, str(path), *section)
+            passages.extend(node.get_content() for node in nodes)
+            if len(passages) >= PARITY_SAMPLE_CHUNKS:
+                break
+        if len(passages) >= PARITY_SAMPLE_CHUNKS:
+            break
+    questions = []
+    if eval_set.exists():
+        with open(eval_set) as f:
+            questions = [json.loads(line)["question"] for line in f if line.strip()]
+    return passages[:PARITY_SAMPLE_CHUNKS], questions
+
+
+def parity_check(model_dir: Path, passages: list, questions: list, min_cosine: float = PARITY_MIN_COSINE) -> dict:
+    """Compare ONNX and torch embeddings of the same texts; records the result in the model's meta."""
+    import rag_index
+
+    meta = read_meta(model_dir)
+    torch_model = rag_index.load_embed_model(meta["model_name"], engine="torch")
+    onnx_model = OnnxEmbedding(model_dir, require_parity=False)
+
+    def both(embed_torch, embed_onnx, texts):
+        a = np.asarray(embed_torch(texts), dtype=np.float32)
+        b = np.asarray(embed_onnx(texts), dtype=np.float32)
+        a /= np.linalg.norm(a, axis=1, keepdims=True)
+        b /= np.linalg.norm(b, axis=1, keepdims=True)
+        return a, b
+
+    torch_passages, onnx_passages = both(torch_model._embed, onnx_model._embed, passages)
+    cosines = list((torch_passages * onnx_passages).sum(axis=1))
+    result = {"passages": len(passages), "questions": len(questions)}
+    if questions:
+        query = lambda model: lambda texts: model._embed(texts, prompt_name="query")  # noqa: E731
+        torch_queries, onnx_queries = both(query(torch_model), query(onnx_model), questions)
+        cosines.extend((torch_queries * onnx_queries).sum(axis=1))
+        # Same best passage for each question: ONNX queries against the torch-built index
+        torch_top = (torch_queries @ torch_passages.T).argmax(axis=1)
+        mixed_top = (onnx_queries @ torch_passages.T).argmax(axis=1)
+        result["top1_agreement"] = round(float((torch_top == mixed_top).mean()), 3)
+
+        latency = {}
+        for name, model in (("torch", torch_model), ("onnx", onnx_model)):
+            samples = []
+            for question in questions * 3:
+                start = time.perf_counter()
+                model.get_query_embedding(question)
+                samples.append((time.perf_counter() - start) * 1000)
+            latency[name] = round(float(np.median(samples)), 2)
+        result["query_ms_p50"] = latency
+
+    result["min_cosine"] = round(float(min(cosines)), 4)
+    result["mean_cosine"] = round(float(np.mean(cosines)), 4)
+    result["threshold"] = min_cosine
+    result["passed"] = result["min_cosine"] >= min_cosine
+    meta["parity"] = result
+    with open(model_dir / META_FILE, "w") as f:
+        json.dump(meta, f, indent=2)
+    return result
+
+
+def main(argv=None):
+    import rag_index
+
+    parser = argparse.ArgumentParser(description="Export and check the ONNX embedding engine.")
+    parser.add_argument("command", choices=("export", "parity"))
+    parser.add_argument("--model", default=rag_index.EMBED_MODEL_NAME, help="HuggingFace embedding model")
+    parser.add_argument("--out", type=Path, help="Model directory (default: RAG_ONNX_MODEL_DIR/<model>)")
+    parser.add_argument("--docs-dir", type=Path, default=rag_index.DOCS_DIR, help="Documents whose chunks are compared")
+    parser.add_argument(
+        "--eval-set", type=Path, default=CURRENT_DIR / "retrieval_eval.jsonl", help="Questions that are compared"
+    )
+    parser.add_argument("--min-cosine", type=float, default=PARITY_MIN_COSINE, help="Lowest acceptable cosine similarity")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--keep-fp32", action="store_true", help="Also keep the unquantized model.onnx")
+    args = parser.parse_args(argv)
+
+    model_dir = args.out or onnx_model_dir(args.model)
+    if args.command == "export":
+        export(args.model, model_dir, args.opset, args.keep_fp32)
+    result = parity_check(model_dir, *parity_texts(args.docs_dir, args.eval_set), args.min_cosine)
+    print(json.dumps(result, indent=2))
+    if not result["passed"]:
+        logger.error(f"Parity check failed: min cosine {result['min_cosine']} < {args.min_cosine}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
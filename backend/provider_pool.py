@@ -0,0 +1,202 @@
+"""
+Pooled, pre-warmed upstream connections for STT, LLM and TTS.
+
+Provider clients built per call would open new connections on the call's
+first turn. That means DNS, TCP and TLS for Deepgram, OpenRouter and
+Cartesia, which adds a few hundred milliseconds to the greeting and the
+first answer. Each job process holds one ProviderPool instead:
+
+- prewarm builds it and its TLS context (parsing the CA bundle is the slow
+  part), before any job is assigned
+- at the top of the entrypoint, start() creates one aiohttp session (Deepgram
+  and Cartesia) and one httpx pool (the OpenAI-compatible LLM client) on the
+  job's event loop. It then opens a connection to each provider and the
+  Cartesia WebSocket while the room connects and the participant joins
+- the session borrows the warmed STT, LLM and TTS, so its first requests
+  reuse those connections. Deepgram's WebSocket upgrade also goes over the
+  pooled connection
+- while the call runs, connections idle for longer than PROVIDER_KEEPALIVE_S
+  are closed. Every PROVIDER_REFRESH_S each provider is touched again, so
+  provider load balancers, which drop idle connections, never close the
+  one the next turn needs
+
+Base URLs come from the environment, so the agent can run against local
+mock servers.
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import aiohttp
+import httpx
+import openai as openai_sdk
+
+try:
+    import certifi
+except ImportError:
+    certifi = None
+
+logger = logging.getLogger("provider-pool")
+
+PROVIDER_PREWARM = os.getenv("PROVIDER_PREWARM", "true").lower() in ("1", "true", "yes")
+PROVIDER_KEEPALIVE_S = float(os.getenv("PROVIDER_KEEPALIVE_S", "120"))
+PROVIDER_REFRESH_S = float(os.getenv("PROVIDER_REFRESH_S", "30"))  # 0: warm once
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "50"))
+DEEPGRAM_BASE_URL = os.getenv("DEEPGRAM_BASE_URL", "https://api.deepgram.com/v1/listen")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+CARTESIA_BASE_URL = os.getenv("CARTESIA_BASE_URL", "https://api.cartesia.ai")
+WARM_TIMEOUT_S = 5.0
+
+
+def _origin(url: str) -> str:
+    """scheme://host[:port]/ of url, with ws(s) mapped to http(s): the connection a request to url uses."""
+    parts = urlsplit(url)
+    scheme = {"ws": "http", "wss": "https"}.get(parts.scheme, parts.scheme)
+    return f"{scheme}://{parts.netloc}/"
+
+
+def _ssl_context() -> ssl.SSLContext:
+    return ssl.create_default_context(cafile=certifi.where() if certifi else None)
+
+
+class ProviderPool:
+    """One job process's upstream clients: shared connection pools and the next session's warmed providers."""
+
+    def __init__(
+        self,
+        llm_model: str,
+        llm_api_key: str,
+        tts_model: str,
+        tts_voice: str,
+        keepalive_s: float = PROVIDER_KEEPALIVE_S,
+        refresh_s: float = PROVIDER_REFRESH_S,
+        max_connections: int = PROVIDER_MAX_CONNECTIONS,
+        http_proxy: str = None,
+    ):
+        self.llm_model = llm_model
+        self.llm_api_key = llm_api_key
+        self.tts_model = tts_model
+        self.tts_voice = tts_voice
+        self.keepalive_s = keepalive_s
+        self.refresh_s = refresh_s
+        self.max_connections = max_connections
+        self.http_proxy = http_proxy
+        self.ssl_context = _ssl_context()
+        self.http_session = None  # aiohttp: Deepgram and Cartesia
+        self.llm_client = None  # OpenAI-compatible client over one httpx pool
+        self._llm_http = None
+        self._warmed = None  # (stt, llm, tts) for the next session
+        self._providers = weakref.WeakSet()  # every provider created, closed with the pool
+        self._tts = weakref.WeakSet()  # for WebSocket refreshes
+        self._refresh_task = None
+
+    def start(self):
+        """Create the clients on the running loop and start warming them; returns at once."""
+        if self.http_session is not None:
+            return
+        self.http_session = aiohttp.ClientSession(
+            proxy=self.http_proxy,
+            connector=aiohttp.TCPConnector(
+                limit_per_host=self.max_connections,
+                keepalive_timeout=self.keepalive_s,
+                ttl_dns_cache=300,
+                ssl=self.ssl_context,
+            ),
+        )
+        # The LLM plugin's own client settings, with the pool's keep-alive
+        self._llm_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_s,
+            ),
+            proxy=self.http_proxy,
+            verify=self.ssl_context,
+        )
+        self.llm_client = openai_sdk.AsyncClient(
+            api_key=self.llm_api_key, base_url=LLM_BASE_URL, max_retries=0, http_client=self._llm_http
+        )
+        self._warmed = self._create()
+        if PROVIDER_PREWARM:
+            self._refresh_task = asyncio.create_task(self._keep_warm())
+
+    def _create(self) -> tuple:
+        from livekit.plugins import cartesia, deepgram, openai
+
+        tts = cartesia.TTS(
+            model=self.tts_model,
+            voice=self.tts_voice,
+            http_session=self.http_session,
+            base_url=CARTESIA_BASE_URL,
+        )
+        self._tts.add(tts)
+        providers = (
+            deepgram.STT(http_session=self.http_session, base_url=DEEPGRAM_BASE_URL),
+            openai.LLM(model=self.llm_model, client=self.llm_client),
+            tts,
+        )
+        self._providers.update(providers)
+        return providers
+
+    def borrow(self) -> tuple:
+        """(stt, llm, tts) for a session: the warmed ones, or new ones on the same connection pools."""
+        self.start()
+        providers, self._warmed = self._warmed, None
+        return providers or self._create()
+
+    async def _touch(self, name: str, url: str) -> float:
+        """Leave an open connection to url's host in the pool; any response will do. Returns seconds taken."""
+        start = time.perf_counter()
+        timeout = WARM_TIMEOUT_S
+        if name == "llm":
+            await self._llm_http.head(_origin(url), timeout=timeout)
+        else:
+            async with self.http_session.head(_origin(url), timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                await resp.read()
+        return time.perf_counter() - start
+
+    async def warm(self) -> dict:
+        """Connect to the STT and LLM hosts and open TTS WebSockets; returns {provider: seconds} of those reached."""
+        self.start()
+        for tts in list(self._tts):
+            tts.prewarm()  # no-op while its pool holds a connection
+        # Deepgram's WebSocket upgrade takes the pooled connection; the LLM's requests reuse it
+        targets = {"stt": DEEPGRAM_BASE_URL, "llm": LLM_BASE_URL}
+        results = await asyncio.gather(
+            *(self._touch(name, url) for name, url in targets.items()), return_exceptions=True
+        )
+        timings = {}
+        for name, result in zip(targets, results):
+            if isinstance(result, BaseException):
+                # Exception text can carry request URLs with credentials
+                logger.warning(f"Could not pre-connect to {name} provider ({type(result).__name__})")
+            else:
+                timings[name] = result
+        return timings
+
+    async def _keep_warm(self):
+        timings = await self.warm()
+        logger.info("Provider connections warmed: " + ", ".join(f"{name} {s * 1000:.0f}ms" for name, s in timings.items()))
+        while self.refresh_s > 0:
+            await asyncio.sleep(self.refresh_s)
+            await self.warm()
+
+    async def aclose(self):
+        """Close providers and connection pools (register as a shutdown callback)."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        for provider in list(self._providers):
+            await provider.aclose()
+        self._warmed = None
+        if self.llm_client is not None:
+            await self.llm_client.close()
+        if self.http_session is not None:
+            await self.http_session.close()
+        self.http_session = self.llm_client = self._llm_http = None
@@ -0,0 +1,127 @@
+"""
+Two-level cache for repeated spoken questions.
+
+Level 1 (QueryCache) maps a normalized transcript to its query embedding and
+top-k retrieval result, skipping embedding and vector search on repeats.
+Level 2 (ResponseCache, optional) stores final answers by question
+embedding and returns one for any near-duplicate question above a
+similarity threshold, skipping the LLM call entirely.
+
+Both are LRU-bounded and are cleared whenever the index version changes, so
+answers never outlive the documents they were grounded on. LiveKit runs each
+job in a fresh process, so to share hits across calls they are hosted by the
+retrieval service when RAG_RETRIEVAL_SERVICE is set.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_ENABLED = os.getenv("RAG_RESPONSE_CACHE", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RAG_RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RAG_RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RAG_RESPONSE_CACHE_TTL_S", "86400"))
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+class QueryCache:
+    """LRU of normalized transcript -> (query embedding, retrieved nodes)."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: str, version: str):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, version: str, embedding, nodes: list):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (embedding, nodes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class ResponseCache:
+    """Semantic answer cache: question embedding -> answer, with threshold, TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl_s: float = RESPONSE_CACHE_TTL_S,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        # question -> (unit embedding, answer, stored_at); order is recency of use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, embedding, version: str):
+        """Return (answer, similarity) for the closest fresh question above threshold, or None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            for question in [q for q, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl_s]:
+                del self._entries[question]
+            best, best_score = None, self.threshold
+            for question, (vector, _, _) in self._entries.items():
+                score = float(vector @ query)
+                if score >= best_score:
+                    best, best_score = question, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][1], best_score
+
+    def store(self, question: str, embedding, answer: str, version: str):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            self._check_version(version)
+            self._entries[question] = (vector, answer, time.time())
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,667 @@
+"""
+RAG index management for the voice agent.
+
+Building, syncing and loading the LlamaIndex index lives here so that the
+agent worker never pays for it at import time: `ingest.py` builds and
+persists the index offline, and the agent calls `get_index()` the first
+time a job actually needs retrieval.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+from pathlib import Path
+
+from llama_index.core import (
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+    Settings,
+)
+from llama_index.core.schema import MetadataMode, QueryBundle
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.vector_stores import SimpleVectorStore
+
+import ann_store
+import bm25_store
+from embed_cache import EMBED_CACHE_ENABLED, EmbeddingCache
+from hybrid_retrieval import CrossEncoderReranker, HybridRetriever
+from ingest_pipeline import IngestPipeline
+from node_store import NODE_STORE_FILE, SqliteNodeStore
+from query_cache import RESPONSE_CACHE_ENABLED, QueryCache, ResponseCache, normalize_transcript
+
+logger = logging.getLogger("rag-index")
+
+# Resolve paths relative to this file
+CURRENT_DIR = Path(__file__).parent
+PERSIST_DIR = CURRENT_DIR / "../chat-engine-storage"
+DOCS_DIR = CURRENT_DIR / "../docs"
+
+EMBED_MODEL_NAME = os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-en-v1.5")
+# "torch" runs the HuggingFace model; "onnx" its int8 ONNX export (onnx_embedding.py), without torch
+EMBED_ENGINES = ("torch", "onnx")
+EMBED_ENGINE = os.getenv("RAG_EMBED_ENGINE", "torch")
+
+# "simple" queries LlamaIndex's in-memory SimpleVectorStore; "flat" and "ivf"
+# query a memory-mapped export of it (see ann_store.py) written by ingest.
+VECTOR_BACKENDS = ("simple",) + ann_store.ANN_KINDS
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "simple")
+ANN_DIR_NAME = "ann"
+ANN_DTYPE = os.getenv("RAG_ANN_DTYPE", "float16")
+ANN_NLIST = int(os.getenv("RAG_ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))
+
+# "json" keeps node text in LlamaIndex's JSON docstore; "binary" also writes it
+# to ann/nodes.sqlite so workers load nothing but memory-mapped arrays and
+# fetch retrieved nodes from SQLite on demand. Requires a flat/ivf backend.
+STORAGE_FORMATS = ("json", "binary")
+STORAGE_FORMAT = os.getenv("RAG_STORAGE_FORMAT", "json")
+
+# Hybrid retrieval fuses the vector backend's top RAG_HYBRID_CANDIDATES with a
+# BM25 index (bm25/, written by ingest) by reciprocal-rank fusion. A
+# cross-encoder named by RAG_RERANK_MODEL optionally reorders the fused head.
+HYBRID_RETRIEVAL = os.getenv("RAG_HYBRID", "false").lower() in ("1", "true", "yes")
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+BM25_DIR_NAME = "bm25"
+RERANK_MODEL_NAME = os.getenv("RAG_RERANK_MODEL", "")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "8"))
+RERANK_TIMEOUT_MS = float(os.getenv("RAG_RERANK_TIMEOUT_MS", "60"))
+
+# The manifest maps each file under the docs dir (relative path) to the sha256
+# of its contents and the ref_doc_ids its documents were inserted under, so a
+# refresh only re-reads and re-embeds the files that actually changed.
+MANIFEST_FILE = "docs_manifest.json"
+
+_embed_model = None
+_reranker = None
+_lock = threading.Lock()
+
+
+# ============================================
+# Embedding Model
+# ============================================
+def get_embed_model():
+    """Load the embedding model on first use and register it with LlamaIndex."""
+    global _embed_model
+    with _lock:
+        if _embed_model is None:
+            _embed_model = load_embed_model(EMBED_MODEL_NAME)
+            Settings.embed_model = _embed_model
+    return _embed_model
+
+
+def load_embed_model(model_name: str, engine: str = EMBED_ENGINE):
+    """Load a HuggingFace embedding model by name on engine, without registering it process-wide."""
+    if engine not in EMBED_ENGINES:
+        raise ValueError(f"RAG_EMBED_ENGINE must be one of {EMBED_ENGINES}, got '{engine}'")
+    logger.info(f"Loading embedding model {model_name} ({engine})...")
+    if engine == "onnx":
+        from onnx_embedding import OnnxEmbedding, onnx_model_dir
+
+        model = OnnxEmbedding(onnx_model_dir(model_name))
+    else:
+        # Imported here: pulls in torch/transformers, which is most of the startup cost
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        model = HuggingFaceEmbedding(model_name=model_name)
+    logger.info("Embedding model loaded.")
+    return model
+
+
+def get_reranker():
+    """Load the RAG_RERANK_MODEL cross-encoder on first use; None when reranking is off."""
+    global _reranker
+    if not RERANK_MODEL_NAME:
+        return None
+    with _lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker(RERANK_MODEL_NAME, RERANK_CANDIDATES, RERANK_TIMEOUT_MS)
+    return _reranker
+
+
+def embed_queries(queries: list) -> list:
+    """Embed several queries in one forward pass where the model supports it."""
+    model = get_embed_model()
+    if hasattr(model, "_embed"):
+        # HuggingFaceEmbedding and OnnxEmbedding batch a list and apply the query prompt
+        return model._embed(list(queries), prompt_name="query")
+    return [model.get_query_embedding(query) for query in queries]
+
+
+# ============================================
+# Incremental Index Sync
+# ============================================
+def file_sha256(path: Path) -> str:
+    """Hash a file's contents in 1MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_docs(docs_dir: Path) -> dict:
+    """Return {relative posix path: Path} for every non-hidden file in docs_dir."""
+    files = {}
+    for path in sorted(docs_dir.rglob("*")):
+        rel = path.relative_to(docs_dir)
+        if path.is_file() and not any(part.startswith(".") for part in rel.parts):
+            files[rel.as_posix()] = path
+    return files
+
+
+def load_manifest(index, docs: dict, persist_dir: Path) -> dict:
+    """Load the docs manifest, bootstrapping one from the index if it predates manifests."""
+    manifest_path = persist_dir / MANIFEST_FILE
+    if manifest_path.exists():
+        with open(manifest_path) as f:
+            return json.load(f)["files"]
+    if index is None:
+        return {}
+
+    # Storage written before manifests existed: group ref docs by file name.
+    # The sha256 is unknown, so every file is treated as changed once.
+    logger.info("No docs manifest found, bootstrapping from existing index...")
+    by_name = {Path(rel).name: rel for rel in docs}
+    manifest = {}
+    for ref_doc_id, info in index.ref_doc_info.items():
+        file_name = info.metadata.get("file_name", ref_doc_id)
+        rel = by_name.get(file_name, file_name)
+        entry = manifest.setdefault(rel, {"sha256": None, "ref_doc_ids": []})
+        entry["ref_doc_ids"].append(ref_doc_id)
+    return manifest
+
+
+def save_manifest(manifest: dict, persist_dir: Path):
+    """Atomically write the docs manifest next to the persisted index."""
+    manifest_path = persist_dir / MANIFEST_FILE
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": 1, "files": manifest}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def docs_changed(docs_dir: Path = DOCS_DIR, persist_dir: Path = PERSIST_DIR) -> bool:
+    """Cheap check (hashing only, no model load) for whether a sync would change anything."""
+    manifest_path = persist_dir / MANIFEST_FILE
+    if not manifest_path.exists():
+        return True
+    with open(manifest_path) as f:
+        manifest = json.load(f)["files"]
+    docs = scan_docs(docs_dir)
+    if set(docs) != set(manifest):
+        return True
+    return any(manifest[rel]["sha256"] != file_sha256(path) for rel, path in docs.items())
+
+
+def sync_index(index, docs_dir: Path = DOCS_DIR, persist_dir: Path = PERSIST_DIR, pipeline=None):
+    """Bring the index in line with docs_dir, touching only new, changed and deleted files.
+
+    New and changed files go through the batched IngestPipeline (a default
+    one unless given). Returns the (possibly newly created) index.
+    """
+    docs = scan_docs(docs_dir)
+    manifest = load_manifest(index, docs, persist_dir)
+    hashes = {rel: file_sha256(path) for rel, path in docs.items()}
+
+    removed = [rel for rel in manifest if rel not in docs]
+    changed = [rel for rel in docs if rel in manifest and manifest[rel]["sha256"] != hashes[rel]]
+    added = [rel for rel in docs if rel not in manifest]
+    logger.info(
+        f"Docs sync: {len(added)} added, {len(changed)} changed, {len(removed)} removed, "
+        f"{len(docs) - len(added) - len(changed)} unchanged."
+    )
+    if index is not None and not (added or changed or removed):
+        return index
+
+    pipeline = pipeline or IngestPipeline(get_embed_model(), cache=EmbeddingCache() if EMBED_CACHE_ENABLED else None)
+    if index is not None:
+        for rel in removed + changed:
+            for ref_doc_id in manifest[rel]["ref_doc_ids"]:
+                index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            del manifest[rel]
+    else:
+        logger.info("Creating new index...")
+        index = VectorStoreIndex(nodes=[], embed_model=pipeline.embed_model)
+    ref_doc_ids, stats = pipeline.run({rel: docs[rel] for rel in added + changed}, index.insert_nodes)
+    for rel, ids in ref_doc_ids.items():
+        # No hash for files that were only partly read, so the next sync retries them
+        manifest[rel] = {"sha256": None if rel in stats.failed else hashes[rel], "ref_doc_ids": ids}
+
+    index.storage_context.persist(persist_dir=str(persist_dir))
+    save_manifest(manifest, persist_dir)
+    logger.info("Index persisted to storage.")
+    return index
+
+
+# ============================================
+# ANN Export
+# ============================================
+def index_version(persist_dir: Path = PERSIST_DIR) -> str:
+    """Cheap token that changes whenever ingest rewrites the index; used to invalidate caches."""
+    try:
+        stat = (persist_dir / MANIFEST_FILE).stat()
+    except FileNotFoundError:
+        return ""
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def manifest_hash(persist_dir: Path) -> str:
+    """sha256 of the docs manifest; identifies the corpus version an export was built from."""
+    manifest_path = persist_dir / MANIFEST_FILE
+    return file_sha256(manifest_path) if manifest_path.exists() else ""
+
+
+def ann_stale(
+    persist_dir: Path = PERSIST_DIR,
+    kind: str = VECTOR_BACKEND,
+    storage_format: str = STORAGE_FORMAT,
+) -> bool:
+    """Whether the ANN export is missing, of another kind or format, or older than the index."""
+    meta = ann_store.read_meta(persist_dir / ANN_DIR_NAME)
+    return (
+        meta.get("kind") != kind
+        or meta.get("source_hash") != manifest_hash(persist_dir)
+        or (storage_format == "binary" and not meta.get("has_nodes"))
+    )
+
+
+def export_ann(
+    persist_dir: Path = PERSIST_DIR,
+    kind: str = VECTOR_BACKEND,
+    storage_format: str = STORAGE_FORMAT,
+    index=None,
+):
+    """Write the index's embeddings (and, for the binary format, its nodes) to the ANN directory.
+
+    Without an index, the persisted JSON vector store and docstore are read
+    directly, so no embedding model is needed.
+    """
+    if index is not None:
+        embedding_dict = index.vector_store.data.embedding_dict
+        docstore = index.docstore
+    else:
+        embedding_dict = SimpleVectorStore.from_persist_dir(str(persist_dir)).data.embedding_dict
+        docstore = SimpleDocumentStore.from_persist_dir(str(persist_dir))
+    node_ids = list(embedding_dict)
+    ann_store.build_ann(
+        node_ids,
+        [embedding_dict[node_id] for node_id in node_ids],
+        persist_dir / ANN_DIR_NAME,
+        kind=kind,
+        dtype=ANN_DTYPE,
+        nlist=ANN_NLIST,
+        source_hash=manifest_hash(persist_dir),
+        nodes=docstore.get_nodes(node_ids) if storage_format == "binary" else None,
+    )
+
+
+def bm25_stale(persist_dir: Path = PERSIST_DIR) -> bool:
+    """Whether the BM25 index is missing or older than the index."""
+    return bm25_store.read_meta(persist_dir / BM25_DIR_NAME).get("source_hash") != manifest_hash(persist_dir)
+
+
+def export_bm25(persist_dir: Path = PERSIST_DIR, index=None):
+    """Write the BM25 index over the index's nodes (from the persisted docstore without an index)."""
+    docstore = index.docstore if index is not None else SimpleDocumentStore.from_persist_dir(str(persist_dir))
+    nodes = list(docstore.docs.values())
+    bm25_store.build_bm25(
+        [node.node_id for node in nodes],
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes],
+        persist_dir / BM25_DIR_NAME,
+        source_hash=manifest_hash(persist_dir),
+    )
+
+
+def convert_storage(
+    persist_dir: Path = PERSIST_DIR,
+    kind: str = VECTOR_BACKEND,
+):
+    """Convert an existing JSON chat-engine-storage layout to the binary format, without re-embedding."""
+    if kind not in ann_store.ANN_KINDS:
+        raise ValueError(f"The binary format needs an ANN vector backend {ann_store.ANN_KINDS}, got '{kind}'")
+    if not (persist_dir / "docstore.json").exists():
+        raise FileNotFoundError(f"No JSON index storage found at '{persist_dir}'")
+    logger.info(f"Converting '{persist_dir}' to the binary storage format...")
+    export_ann(persist_dir, kind, "binary")
+
+
+# ============================================
+# Build / Load
+# ============================================
+def load_index(persist_dir: Path = PERSIST_DIR):
+    """Load a persisted index from storage."""
+    get_embed_model()
+    logger.info(f"Loading existing index from '{persist_dir}'...")
+    storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
+    index = load_index_from_storage(storage_context)
+    logger.info("Index loaded.")
+    return index
+
+
+def build_index(
+    docs_dir: Path = DOCS_DIR,
+    persist_dir: Path = PERSIST_DIR,
+    full: bool = False,
+    vector_backend: str = VECTOR_BACKEND,
+    storage_format: str = STORAGE_FORMAT,
+    pipeline=None,
+    bm25: bool = HYBRID_RETRIEVAL,
+):
+    """Create or incrementally update the persisted index from docs_dir.
+
+    With full=True the existing storage is discarded and every file re-embedded.
+    For an ANN vector_backend the memory-mapped export is refreshed too, and
+    with bm25 the BM25 index used by hybrid retrieval.
+    """
+    if not docs_dir.exists():
+        raise FileNotFoundError(f"Docs directory not found at {docs_dir}")
+    if full and persist_dir.exists():
+        logger.info(f"Removing existing storage at '{persist_dir}' for a full rebuild...")
+        shutil.rmtree(persist_dir)
+
+    if persist_dir.exists():
+        index = load_index(persist_dir)
+    else:
+        logger.info(f"Creating new index from documents in '{docs_dir}'...")
+        index = None
+    index = sync_index(index, docs_dir, persist_dir, pipeline)
+    if vector_backend != "simple" and ann_stale(persist_dir, vector_backend, storage_format):
+        export_ann(persist_dir, vector_backend, storage_format, index=index)
+    if bm25 and bm25_stale(persist_dir):
+        export_bm25(persist_dir, index=index)
+    return index
+
+
+class IndexSnapshot:
+    """One version of a corpus's index, as loaded by this process.
+
+    Everything is loaded on first use; the loaders block, so call them from a
+    thread when on the event loop. A snapshot never changes once loaded: a
+    newer index version gets a new snapshot (CorpusIndex.reload), and the old
+    one is freed once no session holds it any more.
+    """
+
+    def __init__(self, name: str, docs_dir: Path = DOCS_DIR, persist_dir: Path = PERSIST_DIR):
+        self.name = name
+        self.docs_dir = docs_dir
+        self.persist_dir = persist_dir
+        self.version = index_version(persist_dir)
+        self.memory_bytes = 0  # estimate of what the loaded index holds, 0 when unloaded
+        self._index = None
+        self._ann = None
+        self._bm25 = None
+        self._retrievers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None or self._ann is not None
+
+    def get_index(self):
+        """Return the VectorStoreIndex, loading (or building) it on first call."""
+        with self._lock:
+            if self._index is None:
+                if self.persist_dir.exists():
+                    self._index = load_index(self.persist_dir)
+                else:
+                    logger.warning(
+                        f"No index found at '{self.persist_dir}', building it now. "
+                        "Run `python ingest.py` before starting the agent to avoid this."
+                    )
+                    self._index = build_index(self.docs_dir, self.persist_dir)
+                    self.version = index_version(self.persist_dir)
+                self.memory_bytes = self._storage_bytes()
+        return self._index
+
+    def get_ann(self):
+        """Return the (AnnIndex, docstore) pair, loading it on first call.
+
+        Embeddings stay memory-mapped and the JSON vector store is never loaded.
+        With the binary format the JSON docstore isn't either: nodes come from
+        SQLite as they are retrieved. Only ingest writes the export: while it is
+        missing or older than the manifest (ingest writes the manifest first),
+        this raises FileNotFoundError and the next call checks again.
+        """
+        with self._lock:
+            if self._ann is None:
+                if ann_stale(self.persist_dir):
+                    raise FileNotFoundError(
+                        f"ANN index at '{self.persist_dir / ANN_DIR_NAME}' is missing or out of date. "
+                        "Run `python ingest.py`, or wait for the one running to finish."
+                    )
+                ann = ann_store.AnnIndex(self.persist_dir / ANN_DIR_NAME)
+                if STORAGE_FORMAT == "binary":
+                    docstore = SqliteNodeStore(self.persist_dir / ANN_DIR_NAME / NODE_STORE_FILE)
+                else:
+                    docstore = SimpleDocumentStore.from_persist_dir(str(self.persist_dir))
+                self._ann = (ann, docstore)
+                self.memory_bytes = self._storage_bytes()
+                logger.info(f"Loaded {ann.meta['kind']} ANN index with {len(ann)} vectors for corpus '{self.name}'.")
+        return self._ann
+
+    def get_bm25(self) -> bm25_store.BM25Index:
+        """Return the BM25 index, loading it on first call; FileNotFoundError while it is missing or stale, as get_ann."""
+        with self._lock:
+            if self._bm25 is None:
+                if bm25_stale(self.persist_dir):
+                    raise FileNotFoundError(
+                        f"BM25 index at '{self.persist_dir / BM25_DIR_NAME}' is missing or out of date. "
+                        "Run `python ingest.py` with RAG_HYBRID=true, or wait for the one running to finish."
+                    )
+                self._bm25 = bm25_store.BM25Index(self.persist_dir / BM25_DIR_NAME)
+                self.memory_bytes = self._storage_bytes()
+        return self._bm25
+
+    def _storage_bytes(self) -> int:
+        """On-disk size of the files the configured backend loads: a proxy for the memory they take."""
+        if VECTOR_BACKEND == "simple":
+            paths = list(self.persist_dir.glob("*.json"))
+        else:
+            ann_dir = self.persist_dir / ANN_DIR_NAME
+            paths = [path for path in ann_dir.iterdir() if path.name != NODE_STORE_FILE]
+            if STORAGE_FORMAT != "binary":
+                paths.append(self.persist_dir / "docstore.json")
+        if self._bm25 is not None:
+            paths.extend((self.persist_dir / BM25_DIR_NAME).iterdir())
+        return sum(path.stat().st_size for path in paths if path.is_file())
+
+    @property
+    def top_ks(self) -> list:
+        return list(self._retrievers)
+
+    def get_retriever(self, top_k: int):
+        """Return the retriever over the configured vector backend for top_k."""
+        retriever = self._retrievers.get(top_k)
+        if retriever is None:
+            retriever = self._retrievers[top_k] = self._create_retriever(top_k)
+        return retriever
+
+    def _create_retriever(self, top_k: int):
+        if VECTOR_BACKEND not in VECTOR_BACKENDS:
+            raise ValueError(f"RAG_VECTOR_BACKEND must be one of {VECTOR_BACKENDS}, got '{VECTOR_BACKEND}'")
+        if STORAGE_FORMAT not in STORAGE_FORMATS:
+            raise ValueError(f"RAG_STORAGE_FORMAT must be one of {STORAGE_FORMATS}, got '{STORAGE_FORMAT}'")
+        if STORAGE_FORMAT == "binary" and VECTOR_BACKEND == "simple":
+            raise ValueError("RAG_STORAGE_FORMAT=binary requires RAG_VECTOR_BACKEND=flat or ivf")
+        # Hybrid retrieval fuses more dense candidates than it returns
+        dense_k = max(top_k, HYBRID_CANDIDATES) if HYBRID_RETRIEVAL else top_k
+        if VECTOR_BACKEND == "simple":
+            index = self.get_index()
+            dense, docstore = index.as_retriever(similarity_top_k=dense_k), index.docstore
+        else:
+            ann, docstore = self.get_ann()
+            dense = ann_store.AnnRetriever(ann, docstore, get_embed_model(), dense_k, ANN_NPROBE)
+        if not HYBRID_RETRIEVAL:
+            return dense
+        return HybridRetriever(
+            dense, self.get_bm25(), docstore, top_k, HYBRID_CANDIDATES, RRF_K, reranker=get_reranker()
+        )
+
+
+class CorpusIndex:
+    """One knowledge base (docs dir + persist dir) and the snapshot(s) of it this process has loaded.
+
+    New sessions and turns use the current snapshot. When ingest writes a new
+    index version, reload() loads it next to the current one and swaps it in;
+    sessions that pinned the old snapshot (acquire()) keep using it until they
+    end, and it is freed with the last reference. The query and answer caches
+    belong to the corpus, so hits never cross from one customer's documents to
+    another's; they only serve the current snapshot.
+    """
+
+    def __init__(self, name: str, docs_dir: Path = DOCS_DIR, persist_dir: Path = PERSIST_DIR):
+        self.name = name
+        self.docs_dir = docs_dir
+        self.persist_dir = persist_dir
+        self.reloads = 0
+        self.query_cache = QueryCache()
+        self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+        self._current = None
+        self._retired = weakref.WeakSet()  # replaced snapshots still held by a session
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def acquire(self) -> IndexSnapshot:
+        """The current snapshot (not necessarily loaded); hold it to stay on this version."""
+        with self._lock:
+            if self._current is None:
+                self._current = IndexSnapshot(self.name, self.docs_dir, self.persist_dir)
+            return self._current
+
+    @property
+    def loaded(self) -> bool:
+        current = self._current
+        return current is not None and current.loaded
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory of the current snapshot and of retired ones sessions still hold."""
+        current = self._current
+        return (current.memory_bytes if current else 0) + sum(s.memory_bytes for s in list(self._retired))
+
+    def index_version(self) -> str:
+        """Version of the current snapshot, or of the index on disk when none is loaded."""
+        current = self._current
+        return current.version if current is not None else index_version(self.persist_dir)
+
+    def get_index(self):
+        return self.acquire().get_index()
+
+    def get_ann(self):
+        return self.acquire().get_ann()
+
+    def get_bm25(self) -> bm25_store.BM25Index:
+        return self.acquire().get_bm25()
+
+    def get_retriever(self, top_k: int):
+        return self.acquire().get_retriever(top_k)
+
+    def retrieve_batch(self, items: list, snapshot: IndexSnapshot = None, cancelled=None) -> list:
+        """Retrieve for [(query, top_k)] from snapshot (default: the current one).
+
+        Returns [(query embedding, nodes)]. Queries found in the corpus's query
+        cache skip embedding and search; the rest are embedded together in one
+        batch. A snapshot that is no longer current bypasses the cache.
+        cancelled(i) is checked before embedding and before each search; a
+        cancelled query's result is None.
+        """
+        cancelled = cancelled or (lambda i: False)
+        current = self.acquire()
+        snapshot = snapshot or current
+        cached = snapshot is current
+        keys = [f"{top_k}:{normalize_transcript(query)}" for query, top_k in items]
+        results = [self.query_cache.get(key, snapshot.version) if cached else None for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None and not cancelled(i)]
+        if misses:
+            embeddings = embed_queries([items[i][0] for i in misses])
+            for i, embedding in zip(misses, embeddings):
+                if cancelled(i):
+                    continue
+                query, top_k = items[i]
+                nodes = snapshot.get_retriever(top_k).retrieve(QueryBundle(query_str=query, embedding=embedding))
+                results[i] = (embedding, nodes)
+                if cached:
+                    self.query_cache.put(keys[i], snapshot.version, embedding, nodes)
+        return results
+
+    def reload_pending(self) -> bool:
+        """Whether ingest has finished writing a newer index version than the loaded one."""
+        current = self._current
+        if current is None or not current.loaded or index_version(self.persist_dir) == current.version:
+            return False
+        # ingest writes the manifest first and the ANN/BM25 exports after it; wait for them
+        if VECTOR_BACKEND != "simple" and ann_stale(self.persist_dir):
+            return False
+        return not (HYBRID_RETRIEVAL and bm25_stale(self.persist_dir))
+
+    def reload(self) -> bool:
+        """Load the index version on disk in this thread and swap it in; returns whether it did.
+
+        The new snapshot opens the retrievers the old one had before the swap,
+        so no turn waits for it to load. On failure the current snapshot stays.
+        """
+        with self._reload_lock:
+            if not self.reload_pending():
+                return False
+            old = self._current
+            new = IndexSnapshot(self.name, self.docs_dir, self.persist_dir)
+            start = time.perf_counter()
+            try:
+                for top_k in old.top_ks or [1]:
+                    new.get_retriever(top_k)
+            except Exception:
+                logger.exception(f"Failed to load index version {new.version} of corpus '{self.name}', keeping {old.version}")
+                return False
+            with self._lock:
+                if self._current is not old:
+                    return False  # unloaded meanwhile
+                self._current = new
+                self._retired.add(old)
+                self.reloads += 1
+            weakref.finalize(old, logger.info, f"Freed index version {old.version} of corpus '{self.name}'")
+            del old
+        logger.info(
+            f"Reloaded corpus '{self.name}' at index version {new.version} in {time.perf_counter() - start:.1f}s "
+            f"({len(self._retired)} older version(s) still in use)"
+        )
+        return True
+
+    def unload(self):
+        """Drop the current snapshot and the caches; the next retrieval loads the index again.
+
+        Retrievals already running and sessions holding the snapshot keep it until they finish.
+        """
+        with self._lock:
+            if self._current is not None:
+                self._retired.add(self._current)
+            self._current = None
+            self.query_cache = QueryCache()
+            self.response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+        logger.info(f"Unloaded corpus '{self.name}'.")
+
+
+# The single-tenant knowledge base: DOCS_DIR indexed into PERSIST_DIR
+DEFAULT_CORPUS_INDEX = CorpusIndex("default")
+
+
+def get_index():
+    """Return the default corpus's index, loading it on first call.
+
+    Blocking; call it from a thread when on the event loop.
+    """
+    return DEFAULT_CORPUS_INDEX.get_index()
+
+
+def get_retriever(top_k: int):
+    """Return the default corpus's retriever for top_k.
+
+    Blocking on first call; call it from a thread when on the event loop.
+    """
+    return DEFAULT_CORPUS_INDEX.get_retriever(top_k)
@@ -0,0 +1,361 @@
+"""
+Per-turn retrieval for the voice agent.
+
+Retrieval sits on the critical path between the final transcript and the
+LLM call, so it runs under a strict latency budget: if the index can't
+answer in time, the turn goes ahead without context instead of stalling
+time-to-first-audio. Repeated questions are served from the query and
+answer caches in query_cache.py, and predictable ones from the corpus's FAQ
+index (faq_index.py).
+
+Embedding and search are CPU work that would stall the audio and VAD of
+every session on the job's event loop, so local lookups go to a bounded
+pool of RAG_RETRIEVAL_THREADS threads. Lookups issued together (the final
+transcript and speculative ones) share one embedding batch. A lookup the
+turn no longer needs, because it timed out, was superseded or the user
+barged in, is dropped before its batch starts or stops after embedding.
+"""
+
+import asyncio
+import difflib
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import rag_index
+from context_budget import CONTEXT_MAX_TOKENS, assemble_context
+from faq_index import QUESTION_LOG, QuestionLog, load_faq
+from index_pool import DEFAULT_CORPUS, POOL, corpus_dirs
+from query_cache import normalize_transcript
+from retrieval_service import RETRIEVAL_SERVICE, RetrievalBatcher, RetrievalClient
+from worker_load import INFLIGHT
+
+logger = logging.getLogger("retrieval")
+
+RETRIEVAL_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RETRIEVAL_TIMEOUT_MS = float(os.getenv("RAG_RETRIEVAL_TIMEOUT_MS", "300"))
+RETRIEVAL_THREADS = int(os.getenv("RAG_RETRIEVAL_THREADS", "2"))
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RAG_RETRIEVAL_BATCH_WINDOW_MS", "0"))
+
+_question_log = QuestionLog(QUESTION_LOG) if QUESTION_LOG else None
+
+# Local retrieval threads of this process, shared by the batchers of all its event loops
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+_batchers = weakref.WeakKeyDictionary()  # event loop -> RetrievalBatcher
+
+
+def local_batcher() -> RetrievalBatcher:
+    """This process's retrieval batcher for the running event loop."""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        # No window: a lone query starts at once, and queries queued while the threads are busy share a batch
+        batcher = _batchers[loop] = RetrievalBatcher(
+            RETRIEVAL_BATCH_WINDOW_MS, workers=RETRIEVAL_THREADS, executor=_executor
+        )
+    return batcher
+
+
+@dataclass
+class RetrievalResult:
+    query: str
+    nodes: list = field(default_factory=list)
+    latency_ms: float = 0.0
+    timed_out: bool = False
+    cancelled: bool = False
+    embedding: list = None
+
+    def context_text(self, max_tokens: int = CONTEXT_MAX_TOKENS) -> str:
+        """Retrieved node texts as one deduplicated block of at most max_tokens tokens for the prompt."""
+        return assemble_context(self.query, [n.node.get_content() for n in self.nodes], max_tokens)
+
+
+class TurnRetriever:
+    """Retrieves top-k nodes for a user turn within a latency budget.
+
+    Queries go to the shared retrieval service when RAG_RETRIEVAL_SERVICE is
+    set, otherwise to the corpus's index in this process's IndexPool.
+    """
+
+    def __init__(
+        self,
+        top_k: int = RETRIEVAL_TOP_K,
+        timeout_ms: float = RETRIEVAL_TIMEOUT_MS,
+        service_address: str = RETRIEVAL_SERVICE,
+        corpus: str = DEFAULT_CORPUS,
+    ):
+        self.top_k = top_k
+        self.timeout_ms = timeout_ms
+        self.corpus = corpus
+        self._client = RetrievalClient(service_address) if service_address else None
+        self._snapshot = None  # index version this session stays on (local retrieval)
+        self._lookups = {}  # lookups in progress -> task that awaits it
+        self._cancelled = weakref.WeakSet()  # of those, the ones cancel() stopped
+        self.faq = None
+
+    def load(self, corpus: str = None) -> tuple:
+        """Load corpus's index, the embedding model and its FAQ index (blocking) so the first turn doesn't pay for it.
+
+        Returns (faq, snapshot) for attach() and changes nothing on the
+        retriever, so a load for a corpus the session has since switched away
+        from can be discarded.
+        """
+        corpus = corpus or self.corpus
+        try:
+            # Even with the retrieval service: the FAQ index is small and matching it is local
+            faq = load_faq(corpus_dirs(corpus)[1])
+        except KeyError:
+            faq = None
+        snapshot = None
+        if self._client is None:
+            snapshot = POOL.load(corpus, self.top_k).acquire()
+            POOL.watch()
+        return faq, snapshot
+
+    def attach(self, corpus: str, loaded: tuple) -> bool:
+        """Use load(corpus)'s (faq, snapshot) unless the session now uses another corpus; returns whether it did.
+
+        The session then keeps that index version even if a newer one is hot-reloaded.
+        """
+        if corpus != self.corpus:
+            return False
+        self.faq, self._snapshot = loaded
+        return True
+
+    def match_faq(self, query: str, embedding=None):
+        """Return (answer, similarity) from the FAQ index, or None.
+
+        Without the query's embedding only an exact match of the question's
+        content words counts.
+        """
+        if self.faq is None:
+            return None
+        hit = self.faq.match_text(query)
+        if hit is None and embedding is not None:
+            hit = self.faq.match_embedding(embedding)
+        return hit
+
+    async def _retrieve(self, query: str):
+        """Return (query embedding, nodes)."""
+        if self._client is not None:
+            return await self._client.retrieve(query, self.top_k, self.corpus)
+        snapshot = self._snapshot if self._snapshot is not None and self._snapshot.name == self.corpus else None
+        return await local_batcher().retrieve(query, self.top_k, self.corpus, snapshot)
+
+    def cancel(self, keep=()):
+        """Stop waiting for lookups in progress (the user barged in); they return without context.
+
+        Lookups awaited by a task in keep go on.
+        """
+        for lookup, owner in list(self._lookups.items()):
+            if owner not in keep:
+                self._cancelled.add(lookup)
+                lookup.cancel()
+
+    async def lookup_answer(self, embedding):
+        """Return (answer, similarity) for a cached near-duplicate question, or None.
+
+        Shares the retrieval latency budget; a slow or failed lookup counts as a miss.
+        """
+        corpus = POOL.get(self.corpus) if self._client is None else None
+        if embedding is None or (corpus is not None and corpus.response_cache is None):
+            return None
+        try:
+            if self._client is not None:
+                lookup = self._client.lookup_answer(embedding, self.corpus)
+            else:
+                lookup = asyncio.to_thread(corpus.response_cache.lookup, embedding, corpus.index_version())
+            return await asyncio.wait_for(lookup, timeout=self.timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            return None
+        except Exception:
+            logger.exception("Answer cache lookup failed")
+            return None
+
+    async def store_answer(self, question: str, embedding, answer: str):
+        if embedding is None:
+            return
+        try:
+            if self._client is not None:
+                await self._client.store_answer(question, embedding, answer, self.corpus)
+            else:
+                corpus = POOL.get(self.corpus)
+                if corpus.response_cache is not None:
+                    corpus.response_cache.store(question, embedding, answer, corpus.index_version())
+        except Exception:
+            logger.exception("Failed to store answer in cache")
+
+    async def log_answer(self, question: str, answer: str):
+        """Record an answered question in the question log (RAG_QUESTION_LOG) for the FAQ index."""
+        if _question_log is None:
+            return
+        try:
+            if self._snapshot is not None and self._snapshot.name == self.corpus:
+                version = self._snapshot.version
+            else:
+                version = rag_index.index_version(corpus_dirs(self.corpus)[1])
+            await asyncio.to_thread(_question_log.append, self.corpus, version, question, answer)
+        except Exception:
+            logger.exception("Failed to log question")
+
+    async def aclose(self):
+        self._snapshot = None
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def retrieve(self, query: str, timeout_ms: float = None) -> RetrievalResult:
+        """Retrieve context for query, falling back to no context on timeout, cancel() or error.
+
+        timeout_ms defaults to the retriever's budget. A timed-out or cancelled
+        local lookup is dropped from its batch, or skips search if its batch
+        is already embedding.
+        """
+        timeout_ms = self.timeout_ms if timeout_ms is None else timeout_ms
+        result = RetrievalResult(query=query)
+        start = time.perf_counter()
+        lookup = asyncio.create_task(self._retrieve(query))
+        self._lookups[lookup] = asyncio.current_task()
+        try:
+            with INFLIGHT.track():
+                result.embedding, result.nodes = await asyncio.wait_for(lookup, timeout=timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+        except asyncio.CancelledError:
+            if lookup not in self._cancelled:
+                raise
+            result.cancelled = True
+        except FileNotFoundError as e:
+            # An index or export ingest hasn't written (yet); the next turn checks again
+            logger.warning(f"{e} Continuing without context")
+        except Exception:
+            logger.exception("Retrieval failed, continuing without context")
+        finally:
+            self._lookups.pop(lookup, None)
+        result.latency_ms = (time.perf_counter() - start) * 1000
+
+        if result.cancelled:
+            logger.info(f"Retrieval cancelled after {result.latency_ms:.1f}ms")
+        elif result.timed_out:
+            logger.warning(f"Retrieval exceeded {timeout_ms:.0f}ms budget, continuing without context")
+        else:
+            logger.info(f"Retrieved {len(result.nodes)} nodes in {result.latency_ms:.1f}ms")
+        return result
+
+
+# ============================================
+# Speculative Retrieval
+# ============================================
+SPECULATIVE_RETRIEVAL = os.getenv("RAG_SPECULATIVE", "true").lower() in ("1", "true", "yes")
+SPECULATIVE_MIN_WORDS = int(os.getenv("RAG_SPECULATIVE_MIN_WORDS", "3"))
+SPECULATIVE_MATCH_RATIO = float(os.getenv("RAG_SPECULATIVE_MATCH_RATIO", "0.85"))
+SPECULATIVE_MAX_INFLIGHT = 4
+
+
+class SpeculativeRetriever:
+    """Starts retrieval on stable interim transcripts so the final turn finds it already done.
+
+    An interim hypothesis counts as stable once all but its last word match
+    the previous hypothesis and it has at least SPECULATIVE_MIN_WORDS words.
+    Results are kept per turn, keyed by normalized text, and matched to the
+    final transcript by similarity.
+    """
+
+    def __init__(
+        self,
+        retriever: TurnRetriever,
+        min_words: int = SPECULATIVE_MIN_WORDS,
+        match_ratio: float = SPECULATIVE_MATCH_RATIO,
+    ):
+        self._retriever = retriever
+        self.min_words = min_words
+        self.match_ratio = match_ratio
+        self._previous_words = []
+        self._pending = OrderedDict()  # normalized text -> Task[RetrievalResult]
+
+    def on_transcript(self, transcript: str, is_final: bool):
+        """Feed STT transcripts (wire to AgentSession's user_input_transcribed event)."""
+        if is_final:
+            self._previous_words = []
+            return
+        words = normalize_transcript(transcript).split()
+        stable = (
+            len(words) >= self.min_words
+            and words[:-1] == self._previous_words[: len(words) - 1]
+        )
+        self._previous_words = words
+        if not stable:
+            return
+
+        text = " ".join(words)
+        if self._best_match(text)[1] >= self.match_ratio:
+            return
+        while len(self._pending) >= SPECULATIVE_MAX_INFLIGHT:
+            _, task = self._pending.popitem(last=False)
+            task.cancel()
+        self._pending[text] = asyncio.create_task(self._retriever.retrieve(transcript))
+
+    def _best_match(self, text: str):
+        best_key, best_ratio = None, 0.0
+        for key in self._pending:
+            ratio = difflib.SequenceMatcher(None, key, text).ratio()
+            if ratio > best_ratio:
+                best_key, best_ratio = key, ratio
+        return best_key, best_ratio
+
+    async def lookup_answer(self, embedding):
+        return await self._retriever.lookup_answer(embedding)
+
+    async def store_answer(self, question: str, embedding, answer: str):
+        await self._retriever.store_answer(question, embedding, answer)
+
+    def match_faq(self, query: str, embedding=None):
+        hit = self._retriever.match_faq(query, embedding)
+        if hit is not None:
+            # The turn is answered without retrieval; lookups started for it are moot
+            pending, self._pending = self._pending, OrderedDict()
+            for task in pending.values():
+                task.cancel()
+        return hit
+
+    async def log_answer(self, question: str, answer: str):
+        await self._retriever.log_answer(question, answer)
+
+    def cancel(self):
+        """Cancel the previous turn's lookups; those started for the utterance in progress go on."""
+        self._retriever.cancel(keep=set(self._pending.values()))
+
+    async def retrieve(self, query: str) -> RetrievalResult:
+        """Return speculative results matching the final transcript, or retrieve now."""
+        key, ratio = self._best_match(normalize_transcript(query))
+        pending, self._pending = self._pending, OrderedDict()
+        task = pending.pop(key, None) if ratio >= self.match_ratio else None
+        for other in pending.values():
+            other.cancel()
+
+        timeout_ms = None
+        if task is not None:
+            start = time.perf_counter()
+            result = await task
+            waited_ms = (time.perf_counter() - start) * 1000
+            if result.cancelled:
+                return result  # the user barged in
+            if not result.timed_out:
+                logger.info(
+                    f"Speculative retrieval hit (similarity {ratio:.2f}), "
+                    f"waited {waited_ms:.1f}ms of {result.latency_ms:.1f}ms"
+                )
+                result.latency_ms = waited_ms
+                return result
+            # The turn has already spent part of its budget waiting; retry only within the rest
+            timeout_ms = self._retriever.timeout_ms - waited_ms
+            if timeout_ms <= 0:
+                result.latency_ms = waited_ms
+                return result
+        result = await self._retriever.retrieve(query, timeout_ms)
+        if timeout_ms is not None:
+            result.latency_ms += waited_ms
+        return result
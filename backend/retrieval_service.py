@@ -0,0 +1,365 @@
+"""
+Shared retrieval service: one embedding model and index pool per host.
+
+Every LiveKit job runs in its own process, and each process loading its own
+copy of the embedding model and index is what made memory grow with the
+number of concurrent rooms. Run this service once per host instead:
+
+    python retrieval_service.py
+
+and set RAG_RETRIEVAL_SERVICE in the agent's environment. Job processes then
+send queries over a local socket; concurrent queries are embedded together in
+one batch and results come back as node text, score and metadata. The service
+holds the per-corpus indexes and their query and answer caches
+(index_pool.py, query_cache.py), so hits are shared across calls.
+
+Each connection (one per session) stays on the index version it first
+retrieved from. A re-ingested index is picked up by the reload watcher, or at
+once with `kill -HUP <pid>`, and serves connections opened after the swap.
+
+Protocol: newline-delimited JSON over a Unix socket ("unix:///path" or a bare
+path) or TCP ("tcp://host:port"). "corpus" is optional in every request and
+defaults to RAG_DEFAULT_CORPUS.
+    request:  {"id": 1, "query": "...", "top_k": 3, "corpus": "acme"}
+    response: {"id": 1, "nodes": [{"id", "text", "score", "metadata"}], "embedding": [...], "latency_ms": 4.2}
+              {"id": 1, "error": "..."}
+    request:  {"id": 2, "op": "lookup_answer", "embedding": [...], "corpus": "acme"}
+    response: {"id": 2, "answer": "..." | null, "similarity": 0.97}
+    request:  {"id": 3, "op": "store_answer", "question": "...", "embedding": [...], "answer": "...", "corpus": "acme"}
+    response: {"id": 3}
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+logger = logging.getLogger("retrieval-service")
+
+DEFAULT_ADDRESS = "unix:///tmp/voice-rag-retrieval.sock"
+RETRIEVAL_SERVICE = os.getenv("RAG_RETRIEVAL_SERVICE", "")
+BATCH_WINDOW_MS = float(os.getenv("RAG_SERVICE_BATCH_WINDOW_MS", "3"))
+BATCH_MAX_SIZE = int(os.getenv("RAG_SERVICE_BATCH_MAX", "32"))
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+def parse_address(address: str):
+    """Return ("tcp", (host, port)) or ("unix", path) for a service address."""
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    if address.startswith("unix://"):
+        address = address[len("unix://"):]
+    return "unix", address
+
+
+# ============================================
+# Server
+# ============================================
+class RetrievalBatcher:
+    """Micro-batches concurrent queries into one embedding call on a bounded thread pool.
+
+    Once a worker thread is free, the first waiting query opens a batch, and
+    queries arriving within the batch window or already queued join it, up to
+    max_batch. While every worker is busy, queries queue up and go out together
+    in the next batch. A query whose caller stops waiting (timeout, a new turn,
+    barge-in) is dropped if its batch hasn't started, and skips vector search
+    and node fetching if it has.
+    """
+
+    def __init__(
+        self,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        max_batch: int = BATCH_MAX_SIZE,
+        workers: int = 1,
+        executor: ThreadPoolExecutor = None,
+    ):
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._free_workers = asyncio.Semaphore(workers)
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+        self._batches = set()
+        self._task = None
+
+    def _retrieve_batch(self, items: list, cancelled) -> list:
+        from index_pool import POOL
+
+        return POOL.retrieve_batch(items, cancelled)
+
+    async def _next_batch(self) -> list:
+        """The first waiting query, then whatever arrives within the window or is already queued."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batch_window_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return [item for item in batch if not item[4].cancelled()]
+
+    async def run(self):
+        """Batching loop: form a batch whenever a worker thread is free."""
+        while True:
+            await self._free_workers.acquire()
+            try:
+                batch = await self._next_batch()
+            except BaseException:
+                self._free_workers.release()
+                raise
+            if not batch:
+                self._free_workers.release()
+                continue
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: list):
+        futures = [item[4] for item in batch]
+        try:
+            # The worker thread only reads each future's state
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._retrieve_batch, [item[:4] for item in batch], lambda i: futures[i].cancelled()
+            )
+        except Exception as e:
+            logger.exception("Batch retrieval failed")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._free_workers.release()
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def start(self) -> asyncio.Task:
+        """Run the batching loop on the running event loop (once); returns its task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def retrieve(self, query: str, top_k: int, corpus: str, snapshot=None):
+        """Return (query embedding, nodes) for query against corpus (at snapshot's index version if given)."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((corpus, query, top_k, snapshot, future))
+        return await future
+
+
+class RetrievalService(RetrievalBatcher):
+    """Serves the batcher over a socket, with the answer cache operations."""
+
+    async def _answer_op(self, request: dict) -> dict:
+        from index_pool import DEFAULT_CORPUS, POOL
+
+        corpus = POOL.get(request.get("corpus") or DEFAULT_CORPUS)
+        if corpus.response_cache is None:
+            return {"answer": None}
+        version = corpus.index_version()
+        if request["op"] == "lookup_answer":
+            hit = corpus.response_cache.lookup(request["embedding"], version)
+            return {"answer": hit[0], "similarity": hit[1]} if hit else {"answer": None}
+        corpus.response_cache.store(request["question"], request["embedding"], request["answer"], version)
+        return {}
+
+    async def _handle_request(self, request: dict, writer, write_lock, leases: dict):
+        start = time.perf_counter()
+        try:
+            op = request.get("op", "retrieve")
+            if op in ("lookup_answer", "store_answer"):
+                response = {"id": request.get("id"), **await self._answer_op(request)}
+            elif op != "retrieve":
+                raise ValueError(f"Unknown op '{op}'")
+            else:
+                response = await self._retrieve_response(request, start, leases)
+        except Exception as e:
+            response = {"id": request.get("id"), "error": str(e)}
+        async with write_lock:
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+    async def _retrieve_response(self, request: dict, start: float, leases: dict) -> dict:
+        from index_pool import DEFAULT_CORPUS, POOL
+
+        corpus = request.get("corpus") or DEFAULT_CORPUS
+        if corpus not in leases:
+            # The connection's first query pins the corpus's current index version
+            leases[corpus] = POOL.get(corpus).acquire()
+        embedding, nodes = await self.retrieve(
+            request["query"], int(request.get("top_k", 3)), corpus, leases[corpus]
+        )
+        return {
+            "id": request.get("id"),
+            "nodes": [
+                {
+                    "id": n.node.node_id,
+                    "text": n.node.get_content(),
+                    "score": n.score,
+                    "metadata": n.node.metadata,
+                }
+                for n in nodes
+            ],
+            "embedding": [float(x) for x in embedding],
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    async def handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        leases = {}  # corpus -> IndexSnapshot this connection is on
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._handle_request(json.loads(line), writer, write_lock, leases))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a malformed line, or one longer than STREAM_LIMIT (LimitOverrunError)
+            logger.warning(f"Dropping client connection: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+async def serve(address: str):
+    import rag_index
+    from index_pool import DEFAULT_CORPUS, POOL
+
+    # Load the model and default index up front; other corpora load on first query
+    await asyncio.to_thread(POOL.load, DEFAULT_CORPUS, 1)
+    await asyncio.to_thread(rag_index.embed_queries, ["warm up"])
+    POOL.watch()
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, POOL.request_reload)
+
+    service = RetrievalService()
+    kind, target = parse_address(address)
+    if kind == "tcp":
+        server = await asyncio.start_server(service.handle_connection, *target, limit=STREAM_LIMIT)
+    else:
+        if os.path.exists(target):
+            os.unlink(target)
+        server = await asyncio.start_unix_server(service.handle_connection, target, limit=STREAM_LIMIT)
+    logger.info(f"Retrieval service listening on {address}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), service.start())
+
+
+# ============================================
+# Client
+# ============================================
+class RetrievalClient:
+    """Job-side client; one connection per session, requests multiplexed by id."""
+
+    def __init__(self, address: str = RETRIEVAL_SERVICE):
+        self.address = address
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            kind, target = parse_address(self.address)
+            if kind == "tcp":
+                self._reader, self._writer = await asyncio.open_connection(*target, limit=STREAM_LIMIT)
+            else:
+                self._reader, self._writer = await asyncio.open_unix_connection(target, limit=STREAM_LIMIT)
+            self._reader_task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        try:
+            while line := await self._reader.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Retrieval service connection closed"))
+            self._pending.clear()
+            self._writer.close()
+
+    async def _request(self, payload: dict) -> dict:
+        await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(json.dumps({"id": request_id, **payload}).encode() + b"\n")
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def retrieve(self, query: str, top_k: int, corpus: str = None):
+        """Return (query embedding, NodeWithScore results) for query from the shared service."""
+        response = await self._request({"query": query, "top_k": top_k, "corpus": corpus})
+        nodes = [
+            NodeWithScore(node=TextNode(id_=n["id"], text=n["text"], metadata=n["metadata"]), score=n["score"])
+            for n in response["nodes"]
+        ]
+        return response.get("embedding"), nodes
+
+    async def lookup_answer(self, embedding, corpus: str = None):
+        """Return (answer, similarity) for a cached near-duplicate question, or None."""
+        response = await self._request(
+            {"op": "lookup_answer", "embedding": [float(x) for x in embedding], "corpus": corpus}
+        )
+        if response.get("answer") is None:
+            return None
+        return response["answer"], response["similarity"]
+
+    async def store_answer(self, question: str, embedding, answer: str, corpus: str = None):
+        await self._request(
+            {
+                "op": "store_answer",
+                "question": question,
+                "embedding": [float(x) for x in embedding],
+                "answer": answer,
+                "corpus": corpus,
+            }
+        )
+
+    async def aclose(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(serve(RETRIEVAL_SERVICE or DEFAULT_ADDRESS))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,99 @@
+"""
+Streaming stage between the LLM and TTS.
+
+LLM tokens are buffered into speakable segments, complete sentences or for
+the first segment the first clause, of at least SEGMENT_MIN_CHARS, and each
+segment is cleaned of markup and emoji and handed to TTS as soon as it is
+complete. Time-to-first-audio then depends on the first clause rather than
+the whole answer.
+"""
+
+import logging
+import os
+import re
+
+logger = logging.getLogger("speech-segmenter")
+
+SEGMENT_MIN_CHARS = int(os.getenv("TTS_SEGMENT_MIN_CHARS", "20"))
+SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "200"))
+
+# Boundaries must be followed by whitespace, so numbers like "3.5" never split
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]”’]*(?=\s)")
+# A period after these is not a sentence end when a lowercase word follows ("at 9 a.m. and",
+# "e.g. the"); titles and initials never end one ("Dr. Smith", "J. R. Smith")
+_ABBREVIATION = re.compile(r"\b(?:(?:[A-Za-z]\.)*[A-Za-z]|etc|vs|approx|St|Jr|Sr)$", re.IGNORECASE)
+_TITLE = re.compile(r"(?<!\S)(?:Mr|Mrs|Ms|Dr|Prof|[A-Z])$")
+_NEXT_WORD = re.compile(r"\s+(\S)")
+_CLAUSE_END = re.compile(r"(?:[,;:]|\s[-–—])(?=\s)")
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U0001FC00-\U0001FFFF\u2600-\u27BF\u2B00-\u2BFF\uFE0E\uFE0F\u200D\u20E3]"
+)
+_MARKUP = re.compile(r"[*_#`~|<>\[\]{}^\\]")
+_SPACES = re.compile(r"[ \t]+")
+_SPACE_BEFORE_PUNCT = re.compile(r"[ \t]+([,.!?;:])")
+
+
+def clean_for_speech(text: str) -> str:
+    """Drop emoji and markdown characters the TTS would read out or stumble on."""
+    text = _MARKUP.sub("", _EMOJI.sub("", text))
+    return _SPACE_BEFORE_PUNCT.sub(r"\1", _SPACES.sub(" ", text))
+
+
+def _is_sentence_end(buffer: str, match) -> bool:
+    """Whether a _SENTENCE_END match ends a sentence rather than an abbreviation."""
+    if not match.group().startswith(".") or match.group().startswith(".."):
+        return True
+    before = buffer[: match.start()]
+    if _TITLE.search(before):
+        return False
+    if not _ABBREVIATION.search(before):
+        return True
+    # Undecided until the next word arrives
+    following = _NEXT_WORD.match(buffer, match.end())
+    return following is not None and (following.group(1).isupper() or following.group(1).isdigit())
+
+
+def _split_point(buffer: str, first: bool, min_chars: int, max_chars: int):
+    """Index to cut buffer at, or None to wait for more text."""
+    for match in _SENTENCE_END.finditer(buffer):
+        if match.end() >= min_chars and _is_sentence_end(buffer, match):
+            return match.end()
+    if first or len(buffer) >= max_chars:
+        clauses = [m.end() for m in _CLAUSE_END.finditer(buffer) if m.end() >= min_chars]
+        if clauses:
+            # The first clause gets audio started; later, long sentences are cut as late as possible
+            return clauses[0] if first else clauses[-1]
+    if len(buffer) >= max_chars:
+        space = buffer.rfind(" ", min_chars)
+        return space if space > 0 else len(buffer)
+    return None
+
+
+async def segment_speech(
+    text,
+    min_chars: int = SEGMENT_MIN_CHARS,
+    max_chars: int = SEGMENT_MAX_CHARS,
+    times=None,
+):
+    """Turn an async stream of LLM text chunks into cleaned, speakable segments.
+
+    times, if given, gets mark("llm_first_token") and mark("first_segment") calls (a TurnTracker).
+    """
+    buffer = ""
+    first = True
+    async for chunk in text:
+        if times:
+            times.mark("llm_first_token")
+        buffer += chunk
+        while (cut := _split_point(buffer, first, min_chars, max_chars)) is not None:
+            segment, buffer = clean_for_speech(buffer[:cut]).strip(), buffer[cut:].lstrip()
+            if segment:
+                if times:
+                    times.mark("first_segment")
+                first = False
+                yield segment + " "
+    segment = clean_for_speech(buffer).strip()
+    if segment:
+        if times:
+            times.mark("first_segment")
+        yield segment
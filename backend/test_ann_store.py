@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from ann_store import AnnIndex, build_ann
+from rag_index import ANN_DIR_NAME, MANIFEST_FILE, ann_stale, manifest_hash
+
+COUNT, DIM = 500, 16
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(COUNT, DIM)).astype(np.float32)
+    queries = rng.normal(size=(20, DIM)).astype(np.float32)
+    return [f"node-{i}" for i in range(COUNT)], vectors, queries
+
+
+def _exact_top_k(vectors, query, top_k: int) -> list:
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = unit @ (query / np.linalg.norm(query))
+    return [f"node-{i}" for i in np.argsort(-scores)[:top_k]], np.sort(scores)[::-1][:top_k]
+
+
+def test_flat_matches_exact_cosine_top_k(tmp_path, data):
+    node_ids, vectors, queries = data
+    build_ann(node_ids, vectors, tmp_path / "ann", kind="flat", dtype="float32")
+    ann = AnnIndex(tmp_path / "ann")
+    assert len(ann) == COUNT and ann.centroids is None
+    for query in queries:
+        expected_ids, expected_scores = _exact_top_k(vectors, query, 5)
+        hits = ann.search(query, 5)
+        assert [node_id for node_id, _ in hits] == expected_ids
+        assert [score for _, score in hits] == pytest.approx(expected_scores, abs=1e-5)
+
+
+def test_ivf_probing_every_list_matches_flat(tmp_path, data):
+    node_ids, vectors, queries = data
+    build_ann(node_ids, vectors, tmp_path / "flat", kind="flat", dtype="float32")
+    build_ann(node_ids, vectors, tmp_path / "ivf", kind="ivf", dtype="float32", nlist=8)
+    flat, ivf = AnnIndex(tmp_path / "flat"), AnnIndex(tmp_path / "ivf")
+    assert ivf.meta["nlist"] == len(ivf.centroids) == 8
+    for query in queries:
+        assert [node_id for node_id, _ in ivf.search(query, 10, nprobe=8)] == [
+            node_id for node_id, _ in flat.search(query, 10)
+        ]
+        # Fewer lists score a subset of the rows
+        assert len(ivf.search(query, COUNT, nprobe=1)) < COUNT
+
+
+def test_top_k_beyond_count(tmp_path, data):
+    node_ids, vectors, queries = data
+    build_ann(node_ids[:3], vectors[:3], tmp_path / "ann", kind="ivf", dtype="float16")
+    assert len(AnnIndex(tmp_path / "ann").search(queries[0], 10)) == 3
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf"])
+def test_empty_index(tmp_path, kind):
+    build_ann([], [], tmp_path / "ann", kind=kind)
+    ann = AnnIndex(tmp_path / "ann")
+    assert len(ann) == 0
+    assert ann.search(np.ones(DIM, dtype=np.float32), 5) == []
+
+
+def test_missing_index(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        AnnIndex(tmp_path / "ann")
+
+
+def test_unknown_kind(tmp_path):
+    with pytest.raises(ValueError):
+        build_ann([], [], tmp_path / "ann", kind="hnsw")
+
+
+def test_rebuild_leaves_no_staging_dirs(tmp_path, data):
+    node_ids, vectors, _ = data
+    build_ann(node_ids[:10], vectors[:10], tmp_path / "ann", kind="flat")
+    build_ann(node_ids[:20], vectors[:20], tmp_path / "ann", kind="flat")
+    assert [path.name for path in tmp_path.iterdir()] == ["ann"]
+    assert len(AnnIndex(tmp_path / "ann")) == 20
+
+
+def test_ann_stale_follows_the_manifest(tmp_path, data):
+    node_ids, vectors, _ = data
+    manifest = tmp_path / MANIFEST_FILE
+    manifest.write_text('{"version": 1, "files": {}}')
+    assert ann_stale(tmp_path, kind="flat", storage_format="json")  # no export yet
+
+    build_ann(node_ids[:10], vectors[:10], tmp_path / ANN_DIR_NAME, kind="flat", source_hash=manifest_hash(tmp_path))
+    assert not ann_stale(tmp_path, kind="flat", storage_format="json")
+    assert ann_stale(tmp_path, kind="ivf", storage_format="json")
+    assert ann_stale(tmp_path, kind="flat", storage_format="binary")  # written without nodes
+
+    manifest.write_text('{"version": 1, "files": {"hours.txt": {}}}')
+    assert ann_stale(tmp_path, kind="flat", storage_format="json")
@@ -0,0 +1,103 @@
+from livekit.agents import ChatContext
+
+from context_budget import SUMMARY_HEADER, SUMMARY_MESSAGE_ID, HistoryBudget, assemble_context, count_tokens
+
+
+def test_assemble_context_empty():
+    assert assemble_context("refunds", []) == ""
+    assert assemble_context("refunds", ["", "  \n "]) == ""
+
+
+def test_assemble_context_drops_repeated_sentences():
+    texts = ["Refunds take 5 days. Shipping is free.", "Shipping is free. Returns need a receipt."]
+    assert assemble_context("refunds", texts, max_tokens=0) == (
+        "Refunds take 5 days. Shipping is free.\n\nReturns need a receipt."
+    )
+
+
+def test_assemble_context_drops_fragments_of_kept_sentences():
+    texts = ["Orders ship within two business days.", "within two business days."]
+    assert assemble_context("shipping", texts, max_tokens=0) == "Orders ship within two business days."
+
+
+def test_assemble_context_keeps_line_breaks():
+    assert assemble_context("hours", ["# Hours\n- Monday to Friday\n- Nine to five"], max_tokens=0) == (
+        "# Hours\n- Monday to Friday\n- Nine to five"
+    )
+
+
+def test_assemble_context_within_budget_is_unchanged():
+    text = "Refunds take 5 days. Shipping is free."
+    assert assemble_context("refunds", [text], max_tokens=count_tokens(text)) == text
+
+
+def test_assemble_context_keeps_sentences_matching_the_query():
+    texts = ["The office has a cafeteria. Refunds are issued within five days. Parking is on level two."]
+    context = assemble_context("how long do refunds take", texts, max_tokens=10)
+    assert context == "Refunds are issued within five days."
+    assert count_tokens(context) <= 10
+
+
+def test_assemble_context_keeps_original_order():
+    texts = ["Refunds need a receipt. The cafeteria opens at noon. Refunds take five days."]
+    context = assemble_context("refunds", texts, max_tokens=14)
+    assert context == "Refunds need a receipt. Refunds take five days."
+
+
+def _chat(turns: int, start: float = 1000.0) -> ChatContext:
+    chat_ctx = ChatContext()
+    chat_ctx.add_message(role="system", content="You are a helpful assistant.", created_at=start)
+    for i in range(turns):
+        at = start + 10 * (i + 1)
+        chat_ctx.add_message(role="user", content=f"Question {i} about refunds and shipping?", created_at=at)
+        chat_ctx.add_message(role="assistant", content=f"Answer {i}. More detail follows here.", created_at=at + 5)
+    return chat_ctx
+
+
+def _texts(chat_ctx: ChatContext) -> list:
+    return [item.text_content for item in chat_ctx.items]
+
+
+def test_history_under_budget_is_untouched():
+    chat_ctx = _chat(3)
+    before = _texts(chat_ctx)
+    assert not HistoryBudget(max_tokens=1000, keep_turns=6).trim(chat_ctx)
+    assert _texts(chat_ctx) == before
+
+
+def test_history_keeps_last_turns_and_summarizes_the_rest():
+    chat_ctx = _chat(5)
+    assert HistoryBudget(max_tokens=1000, keep_turns=2, summary_max_tokens=100).trim(chat_ctx)
+    items = chat_ctx.items
+    assert items[0].role == "system" and items[0].text_content == "You are a helpful assistant."
+    assert items[1].id == SUMMARY_MESSAGE_ID
+    assert items[1].text_content.startswith(SUMMARY_HEADER)
+    assert "User: Question 0 about refunds and shipping?" in items[1].text_content
+    assert "Assistant: Answer 2." in items[1].text_content
+    assert _texts(chat_ctx)[2:] == [
+        "Question 3 about refunds and shipping?",
+        "Answer 3. More detail follows here.",
+        "Question 4 about refunds and shipping?",
+        "Answer 4. More detail follows here.",
+    ]
+
+
+def test_history_over_token_budget_drops_more_turns():
+    chat_ctx = _chat(5)
+    assert HistoryBudget(max_tokens=40, keep_turns=6, summary_max_tokens=100).trim(chat_ctx)
+    # Only the last turn fits, and the last turn always stays
+    assert _texts(chat_ctx)[-2:] == ["Question 4 about refunds and shipping?", "Answer 4. More detail follows here."]
+    assert [item.role for item in chat_ctx.items].count("user") == 1
+
+
+def test_history_summary_is_capped_and_not_repeated():
+    budget = HistoryBudget(max_tokens=1000, keep_turns=1, summary_max_tokens=20)
+    chat_ctx = _chat(6)
+    budget.trim(chat_ctx)
+    summary = next(item for item in chat_ctx.items if item.id == SUMMARY_MESSAGE_ID).text_content
+    assert count_tokens(summary.removeprefix(SUMMARY_HEADER + "\n")) <= 20
+    assert "Answer 4." in summary and "Question 0" not in summary
+
+    # A second trim with nothing new to drop leaves the summary as it was
+    assert not budget.trim(chat_ctx)
+    assert [item.id for item in chat_ctx.items].count(SUMMARY_MESSAGE_ID) == 1
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+from faq_index import FaqIndex, build_faq, frequent_questions, match_key
+
+CURATED = [
+    {"questions": ["What are your opening hours on Sunday?", "When are you open?"], "answer": "Noon to six."},
+    {"questions": ["How much does shipping cost?"], "answer": "Shipping is free."},
+    {"question": "What can you do?", "answer": "I answer questions about your order."},
+]
+
+
+def _embed(questions):
+    # One axis per distinct wording, so only a question's own vector scores 1.0
+    vectors = np.zeros((len(questions), 8), dtype=np.float32)
+    for i, question in enumerate(questions):
+        vectors[i, i % 8] = 1.0
+    return vectors
+
+
+@pytest.fixture
+def faq_dir(tmp_path):
+    curated = tmp_path / "faq.jsonl"
+    curated.write_text("\n".join(json.dumps(entry) for entry in CURATED) + "\n", encoding="utf-8")
+    build_faq(tmp_path / "faq", curated, None, "default", "v1", _embed, "test-model")
+    return tmp_path / "faq"
+
+
+@pytest.fixture
+def faq(faq_dir):
+    return FaqIndex(faq_dir, threshold=0.9, min_text_terms=2)
+
+
+def test_match_key_sorts_content_words():
+    assert match_key("How much does shipping cost?") == match_key("shipping cost, how much")
+
+
+def test_match_key_falls_back_to_normalized_transcript():
+    assert match_key("What can you do?") == "what can you do"
+
+
+def test_match_text_on_content_words(faq):
+    assert faq.match_text("Sunday opening hours, what are they?") == ("Noon to six.", 1.0)
+    assert faq.match_text("shipping cost how much") == ("Shipping is free.", 1.0)
+
+
+def test_match_text_needs_min_terms(faq):
+    # "When are you open?" has one content word; only its exact wording matches
+    assert faq.match_text("When are you open") == ("Noon to six.", 1.0)
+    assert faq.match_text("open") is None
+    assert faq.match_text("You open when?") is None
+
+
+def test_match_text_stopwords_only(faq):
+    assert faq.match_text("what can you DO") == ("I answer questions about your order.", 1.0)
+    assert faq.match_text("what can you") is None
+    assert faq.match_text("") is None
+
+
+def test_match_text_extra_words_miss(faq):
+    assert faq.match_text("How much does express shipping cost?") is None
+
+
+def test_match_embedding_threshold(faq, faq_dir):
+    query = np.zeros(8, dtype=np.float32)
+    query[1] = 1.0  # "When are you open?"
+    assert faq.match_embedding(query) == ("Noon to six.", 1.0)
+    # At the threshold is a match
+    assert FaqIndex(faq_dir, threshold=1.0).match_embedding(query) == ("Noon to six.", 1.0)
+
+    query[2] = 1.0  # halfway to "How much does shipping cost?": cosine 0.707 to each
+    assert faq.match_embedding(query) is None
+    assert FaqIndex(faq_dir, threshold=0.7).match_embedding(query) is not None
+
+
+def test_match_embedding_other_dimensions(faq):
+    assert faq.match_embedding(np.ones(4, dtype=np.float32)) is None
+    assert faq.match_embedding(None) is None
+
+
+def test_frequent_questions_groups_by_key():
+    records = [
+        ("How much does shipping cost?", "old"),
+        ("shipping cost how much", "new"),
+        ("How much does shipping cost?", "newest"),
+        ("Do you ship abroad?", "yes"),
+    ]
+    [(wordings, answer, count)] = frequent_questions(records, min_count=3)
+    assert (wordings[0], answer, count) == ("How much does shipping cost?", "newest", 3)
+    assert len(frequent_questions(records, min_count=1)) == 2
@@ -0,0 +1,75 @@
+import pytest
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from bm25_store import BM25Index, build_bm25
+from hybrid_retrieval import HybridRetriever, reciprocal_rank_fusion
+
+TEXTS = {
+    "hours": "The office is open from nine to five on weekdays.",
+    "refunds": "Refunds are issued within five days of receiving the return.",
+    "shipping": "Shipping is free for orders over fifty dollars.",
+    "rtx": "The RTX-4090 card ships with a three year warranty.",
+}
+
+
+def test_rrf_empty():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_rrf_single_ranking_keeps_order():
+    fused = reciprocal_rank_fusion([["a", "b", "c"]], k=60)
+    assert [node_id for node_id, _ in fused] == ["a", "b", "c"]
+    assert fused[0][1] == pytest.approx(1 / 61)
+
+
+def test_rrf_rewards_agreement():
+    # "b" is second in both lists, which beats first in one list only
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "e"]], k=60))
+    assert fused["b"] == pytest.approx(2 / 62)
+    assert max(fused, key=fused.get) == "b"
+
+
+def test_rrf_k_flattens_rank_differences():
+    sharp = dict(reciprocal_rank_fusion([["a", "b"]], k=1))
+    flat = dict(reciprocal_rank_fusion([["a", "b"]], k=1000))
+    assert sharp["a"] / sharp["b"] > flat["a"] / flat["b"]
+
+
+class _FixedRetriever(BaseRetriever):
+    def __init__(self, nodes: list):
+        super().__init__()
+        self._nodes = nodes
+
+    def _retrieve(self, query_bundle) -> list:
+        return [NodeWithScore(node=node, score=1.0 - i / 10) for i, node in enumerate(self._nodes)]
+
+
+@pytest.fixture
+def nodes():
+    return {node_id: TextNode(id_=node_id, text=text) for node_id, text in TEXTS.items()}
+
+
+@pytest.fixture
+def bm25(tmp_path):
+    build_bm25(list(TEXTS), list(TEXTS.values()), tmp_path / "bm25")
+    return BM25Index(tmp_path / "bm25")
+
+
+def test_hybrid_fetches_lexical_only_nodes_from_docstore(nodes, bm25):
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(list(nodes.values()))
+    dense = _FixedRetriever([nodes["hours"], nodes["shipping"]])
+    retriever = HybridRetriever(dense, bm25, docstore, top_k=3, candidates=4)
+    results = retriever.retrieve("rtx 4090 warranty")
+    assert [n.node.node_id for n in results] == ["hours", "rtx", "shipping"]
+
+
+def test_hybrid_top_k_and_missing_docstore_nodes(nodes, bm25):
+    dense = _FixedRetriever([nodes["shipping"], nodes["hours"]])
+    # BM25's best match is not in the (empty) docstore: it is skipped, not an error
+    retriever = HybridRetriever(dense, bm25, SimpleDocumentStore(), top_k=1, candidates=4)
+    results = retriever.retrieve("refunds issued")
+    assert [n.node.node_id for n in results] == ["shipping"]
@@ -0,0 +1,68 @@
+import pypdf
+import pytest
+
+from ingest_pipeline import READER_SUFFIXES, _read_section, plan_sections
+
+
+def _pdf(path, pages: int):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+@pytest.mark.parametrize(
+    "pages, pdf_pages, expected",
+    [
+        (1, 16, [(0, 1)]),
+        (16, 16, [(0, 16)]),
+        (17, 16, [(0, 16), (16, 17)]),
+        (10, 4, [(0, 4), (4, 8), (8, 10)]),
+        (3, 1, [(0, 1), (1, 2), (2, 3)]),
+    ],
+)
+def test_pdf_page_ranges(tmp_path, pages, pdf_pages, expected):
+    path = _pdf(tmp_path / "manual.PDF", pages)
+    assert list(plan_sections(path, pdf_pages=pdf_pages)) == [("pdf", start, end) for start, end in expected]
+
+
+def test_pdf_section_reads_its_pages(tmp_path):
+    path = _pdf(tmp_path / "manual.pdf", 5)
+    documents = _read_section(str(path), "pdf", 2, 4)
+    assert [document.metadata["page_label"] for document in documents] == ["3", "4"]
+    assert documents[0].metadata["file_name"] == "manual.pdf"
+
+
+def test_empty_text_file_is_one_section(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert list(plan_sections(path)) == [("text", 0, 0)]
+
+
+def test_text_sections_end_at_blank_lines(tmp_path):
+    path = tmp_path / "notes.md"
+    paragraph = b"x" * 60 + b"\n"
+    path.write_bytes(paragraph + b"\n" + paragraph + b"\n" + paragraph)
+    sections = list(plan_sections(path, section_bytes=50))
+    assert sections == [("text", 0, 62), ("text", 62, 124), ("text", 124, 185)]
+    assert [_read_section(str(path), kind, start, end)[0].text.strip() for kind, start, end in sections] == [
+        "x" * 60
+    ] * 3
+
+
+def test_text_sections_cut_at_any_line_past_twice_the_size(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"line of text\n" * 20)  # 13 bytes a line, no blank lines
+    sections = list(plan_sections(path, section_bytes=50))
+    assert sections[0] == ("text", 0, 104)
+    assert sections[-1][2] == 260
+    assert all(end - start <= 104 for _, start, end in sections)
+
+
+def test_other_formats_are_one_section(tmp_path):
+    suffix = sorted(READER_SUFFIXES)[0]
+    path = tmp_path / f"doc{suffix}"
+    path.write_bytes(b"")
+    assert list(plan_sections(path)) == [("reader", 0, 0)]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import query_cache
+from query_cache import QueryCache, ResponseCache, normalize_transcript
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(query_cache.time, "time", clock)
+    return clock
+
+
+def test_normalize_transcript():
+    assert normalize_transcript("  What are your HOURS?!  ") == "what are your hours"
+    assert normalize_transcript("") == ""
+
+
+def test_query_cache_hit_and_miss():
+    cache = QueryCache(max_entries=2)
+    assert cache.get("hours", "v1") is None
+    cache.put("hours", "v1", [1.0], ["node"])
+    assert cache.get("hours", "v1") == ([1.0], ["node"])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_query_cache_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", "v1", [1.0], [])
+    cache.put("b", "v1", [2.0], [])
+    cache.get("a", "v1")  # "b" is now least recently used
+    cache.put("c", "v1", [3.0], [])
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") is not None and cache.get("c", "v1") is not None
+
+
+def test_query_cache_cleared_on_new_version():
+    cache = QueryCache()
+    cache.put("hours", "v1", [1.0], [])
+    assert cache.get("hours", "v2") is None
+    assert cache.get("hours", "v1") is None
+
+
+def test_response_cache_threshold_boundary(clock):
+    cache = ResponseCache(threshold=0.8, ttl_s=60)
+    cache.store("What are your hours?", [1.0, 0.0], "Nine to five.", "v1")
+    # cosine 0.8 exactly: at the threshold is a hit
+    answer, score = cache.lookup([0.8, 0.6], "v1")
+    assert answer == "Nine to five." and score == pytest.approx(0.8)
+    # just below
+    assert cache.lookup(_unit(0.79, 0.6131), "v1") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_response_cache_returns_closest(clock):
+    cache = ResponseCache(threshold=0.5, ttl_s=60)
+    cache.store("hours", [1.0, 0.0], "Nine to five.", "v1")
+    cache.store("prices", [0.0, 1.0], "Ten dollars.", "v1")
+    assert cache.lookup([0.2, 0.9], "v1")[0] == "Ten dollars."
+
+
+def test_response_cache_expiry(clock):
+    cache = ResponseCache(threshold=0.9, ttl_s=60)
+    cache.store("hours", [1.0, 0.0], "Nine to five.", "v1")
+    clock.now += 60
+    assert cache.lookup([1.0, 0.0], "v1") is not None  # exactly ttl_s old is still fresh
+    clock.now += 1
+    assert cache.lookup([1.0, 0.0], "v1") is None
+    assert len(cache._entries) == 0
+
+
+def test_response_cache_lru_eviction(clock):
+    cache = ResponseCache(max_entries=2, threshold=0.9, ttl_s=60)
+    cache.store("a", [1.0, 0.0, 0.0], "A", "v1")
+    cache.store("b", [0.0, 1.0, 0.0], "B", "v1")
+    cache.lookup([1.0, 0.0, 0.0], "v1")  # "b" is now least recently used
+    cache.store("c", [0.0, 0.0, 1.0], "C", "v1")
+    assert cache.lookup([0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "v1")[0] == "A"
+
+
+def test_response_cache_cleared_on_new_version(clock):
+    cache = ResponseCache(threshold=0.9)
+    cache.store("hours", [1.0, 0.0], "Nine to five.", "v1")
+    assert cache.lookup([1.0, 0.0], "v2") is None
+    assert cache.lookup([1.0, 0.0], "v1") is None
+
+
+def test_response_cache_empty(clock):
+    assert ResponseCache().lookup([1.0, 0.0], "v1") is None
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+from llama_index.core import MockEmbedding
+
+from ingest_pipeline import IngestPipeline
+from rag_index import MANIFEST_FILE, docs_changed, load_manifest, sync_index
+
+
+class _RecordingPipeline(IngestPipeline):
+    """IngestPipeline that remembers which files each run was given."""
+
+    def __init__(self):
+        super().__init__(MockEmbedding(embed_dim=8), workers=1, embed_threads=1)
+        self.runs = []
+
+    def run(self, files: dict, insert_nodes):
+        self.runs.append(sorted(files))
+        return super().run(files, insert_nodes)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs_dir, persist_dir = tmp_path / "docs", tmp_path / "storage"
+    docs_dir.mkdir()
+    (docs_dir / "hours.txt").write_text("The office is open from nine to five.")
+    (docs_dir / "refunds.md").write_text("Refunds are issued within five days.")
+    (docs_dir / "guides").mkdir()
+    (docs_dir / "guides" / "shipping.txt").write_text("Shipping is free over fifty dollars.")
+    (docs_dir / ".hidden.txt").write_text("Never indexed.")
+    return docs_dir, persist_dir
+
+
+def _manifest(persist_dir) -> dict:
+    with open(persist_dir / MANIFEST_FILE) as f:
+        return json.load(f)["files"]
+
+
+def _indexed_files(index) -> dict:
+    """{file name: [node text]} from the docstore, and a check that every node has a vector."""
+    texts = {}
+    for node in index.docstore.docs.values():
+        texts.setdefault(node.metadata["file_name"], []).append(node.get_content())
+    assert set(index.vector_store.data.embedding_dict) == set(index.docstore.docs)
+    return texts
+
+
+def test_sync_adds_changes_and_deletes(corpus):
+    docs_dir, persist_dir = corpus
+    pipeline = _RecordingPipeline()
+    index = sync_index(None, docs_dir, persist_dir, pipeline)
+    assert sorted(_manifest(persist_dir)) == ["guides/shipping.txt", "hours.txt", "refunds.md"]
+    assert sorted(_indexed_files(index)) == ["hours.txt", "refunds.md", "shipping.txt"]
+    assert not docs_changed(docs_dir, persist_dir)
+
+    # Nothing changed: no pipeline run
+    assert sync_index(index, docs_dir, persist_dir, pipeline) is index
+    assert len(pipeline.runs) == 1
+
+    before = _manifest(persist_dir)
+    (docs_dir / "hours.txt").write_text("The office is open from ten to six.")
+    (docs_dir / "refunds.md").unlink()
+    (docs_dir / "warranty.txt").write_text("Every card has a three year warranty.")
+    assert docs_changed(docs_dir, persist_dir)
+    index = sync_index(index, docs_dir, persist_dir, pipeline)
+
+    assert pipeline.runs[-1] == ["hours.txt", "warranty.txt"]
+    manifest = _manifest(persist_dir)
+    assert sorted(manifest) == ["guides/shipping.txt", "hours.txt", "warranty.txt"]
+    assert manifest["guides/shipping.txt"] == before["guides/shipping.txt"]
+    assert manifest["hours.txt"]["sha256"] != before["hours.txt"]["sha256"]
+    assert set(manifest["hours.txt"]["ref_doc_ids"]).isdisjoint(before["hours.txt"]["ref_doc_ids"])
+
+    files = _indexed_files(index)
+    assert sorted(files) == ["hours.txt", "shipping.txt", "warranty.txt"]
+    assert files["hours.txt"] == ["The office is open from ten to six."]
+    ref_doc_ids = {node.ref_doc_id for node in index.docstore.docs.values()}
+    assert ref_doc_ids == {ref for entry in manifest.values() for ref in entry["ref_doc_ids"]}
+
+
+def test_unreadable_file_is_retried(corpus):
+    docs_dir, persist_dir = corpus
+    (docs_dir / "broken.pdf").write_bytes(b"not a pdf")
+    pipeline = _RecordingPipeline()
+    index = sync_index(None, docs_dir, persist_dir, pipeline)
+
+    manifest = _manifest(persist_dir)
+    assert manifest["broken.pdf"] == {"sha256": None, "ref_doc_ids": []}
+    assert manifest["hours.txt"]["sha256"] is not None
+    assert docs_changed(docs_dir, persist_dir)
+
+    # Unchanged on disk, but retried: its hash was never recorded
+    sync_index(index, docs_dir, persist_dir, pipeline)
+    assert pipeline.runs[-1] == ["broken.pdf"]
+    assert _manifest(persist_dir)["broken.pdf"]["sha256"] is None
+
+
+def test_load_manifest_without_index(tmp_path):
+    assert load_manifest(None, {}, tmp_path) == {}
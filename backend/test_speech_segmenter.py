@@ -0,0 +1,84 @@
+import asyncio
+
+from speech_segmenter import clean_for_speech, segment_speech
+
+
+async def _chunks(text: str, size: int):
+    for i in range(0, len(text), size):
+        yield text[i : i + size]
+
+
+def segments(text: str, size: int = 3, min_chars: int = 10, max_chars: int = 200) -> list:
+    async def collect():
+        return [s async for s in segment_speech(_chunks(text, size), min_chars, max_chars)]
+
+    return [s.strip() for s in asyncio.run(collect())]
+
+
+def test_splits_on_sentence_ends():
+    assert segments("The office is open today. It closes early on Friday!") == [
+        "The office is open today.",
+        "It closes early on Friday!",
+    ]
+
+
+def test_empty_input():
+    assert segments("") == []
+
+
+def test_decimal_is_not_a_boundary():
+    assert segments("The fee is 3.5 percent of the total.") == ["The fee is 3.5 percent of the total."]
+
+
+def test_times_of_day_are_not_boundaries():
+    text = "We open at 9 a.m. and close at 5 p.m. every day."
+    assert segments(text) == [text]
+
+
+def test_latin_abbreviations_are_not_boundaries():
+    text = "Bring a document, e.g. a passport, or i.e. anything with a photo."
+    assert segments(text) == ["Bring a document,", "e.g. a passport, or i.e. anything with a photo."]
+
+
+def test_titles_are_not_boundaries():
+    assert segments("Your advisor is Dr. Smith from billing. She will call you.") == [
+        "Your advisor is Dr. Smith from billing.",
+        "She will call you.",
+    ]
+
+
+def test_abbreviation_ending_a_sentence():
+    assert segments("We close at 5 p.m. Weekends are different.") == [
+        "We close at 5 p.m.",
+        "Weekends are different.",
+    ]
+
+
+def test_single_letter_initials():
+    text = "The form was signed by J. R. Smith yesterday."
+    assert segments(text) == [text]
+
+
+def test_abbreviation_at_end_of_stream():
+    assert segments("Call us before 5 p.m.") == ["Call us before 5 p.m."]
+
+
+def test_first_segment_cut_at_a_clause():
+    assert segments("Sure, here is what you need to know about refunds.", min_chars=5)[0] == "Sure,"
+
+
+def test_min_chars_boundary():
+    # A sentence end is taken once it reaches exactly min_chars
+    assert segments("Yes indeed. That works.", min_chars=11) == ["Yes indeed.", "That works."]
+    assert segments("Yes indeed. That works.", min_chars=12) == ["Yes indeed. That works."]
+
+
+def test_clean_for_speech():
+    assert clean_for_speech("**Refunds** take 5 days 🙂 .") == "Refunds take 5 days."
+
+
+def test_dotted_initialism_ending_a_sentence():
+    assert segments("We ship across the U.S. Returns are free.") == [
+        "We ship across the U.S.",
+        "Returns are free.",
+    ]
@@ -0,0 +1,48 @@
+import json
+import os
+
+import turn_metrics
+from turn_metrics import MetricsRegistry, collect, percentile
+
+
+def _publish(directory, pid: int, registry: MetricsRegistry, at: float):
+    directory.mkdir(exist_ok=True)
+    (directory / f"{pid}.json").write_text(json.dumps({"time": at, "histograms": registry.snapshot()}))
+
+
+def _count(registry: MetricsRegistry) -> int:
+    return sum(count for *_, count, _ in registry.snapshot())
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+
+
+def test_merge_adds_counts():
+    a, b = MetricsRegistry(), MetricsRegistry()
+    a.observe("voice_turn_stage_ms", "stt_final", "room", 40)
+    b.observe("voice_turn_stage_ms", "stt_final", "room", 400)
+    a.merge(b.snapshot())
+    [(_, _, _, counts, count, total)] = a.snapshot()
+    assert (count, total) == (2, 440)
+    assert counts[:3] == [0, 1, 1]  # le 25, 50, 100
+
+
+def test_collect_never_decreases(tmp_path, monkeypatch):
+    monkeypatch.setattr(turn_metrics.time, "time", lambda: 10_000.0)
+    retired = MetricsRegistry()
+    first, second = MetricsRegistry(), MetricsRegistry()
+    first.observe("voice_turn_stage_ms", "stt_final", "voice-assistant-room", 100)
+    second.observe("voice_turn_stage_ms", "stt_final", "voice-assistant-room", 200)
+
+    # Back-to-back jobs in the same room; the first one's file has expired
+    _publish(tmp_path, 1, first, at=10_000.0 - turn_metrics.METRICS_RETENTION_S - 1)
+    _publish(tmp_path, 2, second, at=10_000.0)
+    assert _count(collect(tmp_path, retired)) == 2
+    assert sorted(os.listdir(tmp_path)) == ["2.json"]
+    assert _count(collect(tmp_path, retired)) == 2
+
+    rendered = collect(tmp_path, retired).render(worker="7")
+    assert 'voice_turn_stage_ms_count{stage="stt_final",room="voice-assistant-room",worker="7"} 2' in rendered
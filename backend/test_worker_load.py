@@ -0,0 +1,54 @@
+import pytest
+
+from worker_load import LoopLagMonitor, combine_load
+
+
+def _report(cpu: float = 0.0, inflight: float = 0.0, lag_ms: float = 0.0) -> dict:
+    return {"pid": 1, "time": 0, "cpu": cpu, "inflight": inflight, "lag_ms": lag_ms}
+
+
+def test_idle_worker():
+    load, components = combine_load(0, 0.0, [], cpu_count=4, max_sessions=0)
+    assert load == 0.0
+    assert components == {"cpu": 0.0, "lag": 0.0, "inflight": 0.0}
+
+
+def test_host_cpu_or_sessions_cpu_whichever_is_higher():
+    reports = [_report(cpu=1.0), _report(cpu=1.0)]  # two cores busy out of four
+    assert combine_load(2, 0.1, reports, cpu_count=4)[1]["cpu"] == pytest.approx(0.5)
+    assert combine_load(2, 0.9, reports, cpu_count=4)[1]["cpu"] == pytest.approx(0.9)
+
+
+def test_each_limit_reaches_the_threshold():
+    threshold = 0.7
+    assert combine_load(8, 0.0, [], 4, threshold, max_sessions=8)[0] == pytest.approx(threshold)
+    assert combine_load(1, 0.0, [_report(lag_ms=50)], 4, threshold, lag_ms=50)[0] == pytest.approx(threshold)
+    reports = [_report(inflight=4), _report(inflight=4)]
+    assert combine_load(2, 0.0, reports, 4, threshold, inflight_per_core=2)[0] == pytest.approx(threshold)
+
+
+def test_worst_session_lag_counts():
+    _, components = combine_load(2, 0.0, [_report(lag_ms=10), _report(lag_ms=40)], 4, 0.7, lag_ms=50)
+    assert components["lag"] == pytest.approx(40 / 50 * 0.7)
+
+
+def test_highest_signal_wins_and_load_is_capped():
+    load, components = combine_load(3, 0.2, [_report(lag_ms=25)], 4, 0.7, max_sessions=4, lag_ms=50)
+    assert load == pytest.approx(components["sessions"]) == pytest.approx(3 / 4 * 0.7)
+    assert combine_load(1, 0.0, [_report(lag_ms=500)], 4, 0.7, lag_ms=50)[0] == 1.0
+
+
+def test_no_session_limit():
+    assert "sessions" not in combine_load(100, 0.0, [], 4, max_sessions=0)[1]
+
+
+def test_loop_lag_max_since():
+    monitor = LoopLagMonitor()
+    for at, lag in ((1.0, 5.0), (2.0, 30.0), (3.0, 10.0)):
+        monitor._times.append(at)
+        monitor.samples.append(lag)
+    assert monitor.max_since(2.0) == 30.0
+    assert monitor.max_since(2.5) == 10.0
+    assert monitor.max_since(4.0) == 0.0
+    monitor.clear()
+    assert monitor.p95() == 0.0
@@ -0,0 +1,163 @@
+"""
+Pre-synthesized TTS audio cache.
+
+Fixed utterances such as the greeting, and answers replayed from the answer
+cache, are synthesized once per host and stored on disk as 16-bit PCM WAV
+files keyed by (TTS model, voice, text). Text is cleaned for speech as the
+agent's tts_node cleans it, so replayed LLM answers never send markdown or
+emoji to the TTS and sound the same with the cache on or off. Job processes
+preload known utterances into memory in prewarm and play them with
+session.say(text, audio=...), so playback starts without a TTS round trip.
+A miss is synthesized as usual while its frames are collected, and the
+complete audio is written to disk for the next call. Disk usage is bounded;
+the least recently played files are removed first.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import wave
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from livekit import rtc
+
+from speech_segmenter import clean_for_speech
+
+logger = logging.getLogger("tts-cache")
+
+CURRENT_DIR = Path(__file__).parent
+TTS_CACHE_ENABLED = os.getenv("RAG_TTS_CACHE", "true").lower() in ("1", "true", "yes")
+TTS_CACHE_DIR = Path(os.getenv("RAG_TTS_CACHE_DIR", CURRENT_DIR / "../tts-cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("RAG_TTS_CACHE_MAX_MB", "200")) * 1024 * 1024
+TTS_CACHE_MEMORY_ENTRIES = int(os.getenv("RAG_TTS_CACHE_MEMORY_ENTRIES", "64"))
+FRAME_MS = 20
+
+
+@dataclass
+class CachedAudio:
+    pcm: bytes
+    sample_rate: int
+    num_channels: int
+
+    def frames(self, frame_ms: int = FRAME_MS):
+        """Split the audio into frames of frame_ms for playback."""
+        bytes_per_sample = 2 * self.num_channels
+        step = self.sample_rate * frame_ms // 1000 * bytes_per_sample
+        for start in range(0, len(self.pcm), step):
+            chunk = self.pcm[start:start + step]
+            yield rtc.AudioFrame(chunk, self.sample_rate, self.num_channels, len(chunk) // bytes_per_sample)
+
+
+class TTSAudioCache:
+    def __init__(
+        self,
+        model: str,
+        voice: str,
+        directory: Path = TTS_CACHE_DIR,
+        max_bytes: int = TTS_CACHE_MAX_BYTES,
+        memory_entries: int = TTS_CACHE_MEMORY_ENTRIES,
+    ):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        self.voice = voice
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # key -> CachedAudio
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        text = " ".join(clean_for_speech(text).split())
+        return hashlib.sha256(f"{self.model}\0{self.voice}\0{text}".encode()).hexdigest()
+
+    def _remember(self, key: str, audio: CachedAudio):
+        with self._lock:
+            self._memory[key] = audio
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+            return audio
+
+    def get(self, text: str):
+        """Return CachedAudio for text from memory or disk, or None."""
+        key = self.key(text)
+        audio = self._get_memory(key)
+        if audio is not None:
+            return audio
+        path = self.directory / f"{key}.wav"
+        try:
+            with wave.open(str(path), "rb") as f:
+                audio = CachedAudio(f.readframes(f.getnframes()), f.getframerate(), f.getnchannels())
+            os.utime(path)  # mark as recently played for eviction
+        except (FileNotFoundError, wave.Error, EOFError):
+            return None
+        self._remember(key, audio)
+        return audio
+
+    def preload(self, texts: list) -> int:
+        """Load cached audio for texts into memory (blocking; call from prewarm). Returns the number found."""
+        return sum(self.get(text) is not None for text in texts)
+
+    def put(self, text: str, audio: CachedAudio):
+        key = self.key(text)
+        path = self.directory / f"{key}.wav"
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with wave.open(str(tmp_path), "wb") as f:
+            f.setnchannels(audio.num_channels)
+            f.setsampwidth(2)
+            f.setframerate(audio.sample_rate)
+            f.writeframes(audio.pcm)
+        os.replace(tmp_path, path)
+        self._remember(key, audio)
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for path in self.directory.glob("*.wav"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    async def audio(self, tts, text: str):
+        """Yield frames for text: cached audio if present, otherwise live TTS that is cached once complete.
+
+        If playback stops early (an interruption), the partial audio is not stored.
+        """
+        text = clean_for_speech(text).strip()
+        # Preloaded audio is served without leaving the event loop
+        cached = self._get_memory(self.key(text)) or await asyncio.to_thread(self.get, text)
+        if cached is not None:
+            for frame in cached.frames():
+                yield frame
+            return
+
+        pcm = bytearray()
+        audio_format = None
+        async with tts.synthesize(text) as stream:
+            async for ev in stream:
+                audio_format = (ev.frame.sample_rate, ev.frame.num_channels)
+                pcm.extend(ev.frame.data.tobytes())
+                yield ev.frame
+        if audio_format and pcm:
+            try:
+                await asyncio.to_thread(self.put, text, CachedAudio(bytes(pcm), *audio_format))
+            except OSError:
+                logger.exception("Failed to write TTS audio to cache")
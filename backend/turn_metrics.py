@@ -0,0 +1,409 @@
+"""
+Per-turn latency instrumentation for the voice pipeline.
+
+A TurnTracker follows one session and timestamps each stage of a turn
+relative to the end of the user's speech (VAD): final STT transcript,
+retrieval start/end, first LLM token, first TTS audio and the first agent
+audio published to the room. With an event-loop lag monitor it also
+records the worst loop lag during the turn, which shows whether retrieval
+or anything else stalled the loop that carries the session's audio. Every
+completed turn is
+  - logged as one JSON line on the "turn-metrics" logger, and
+  - added to in-process histograms labelled by stage, room and worker.
+
+LiveKit runs each job in its own process. A MetricsPublisher in each job
+process writes the process's histograms to a small JSON file in
+METRICS_DIR every METRICS_PUBLISH_INTERVAL_S, and the worker process serves
+all of them merged, in Prometheus text format, at
+http://127.0.0.1:METRICS_PORT/metrics: one endpoint per worker however many
+jobs it runs. The worker label is the worker process's pid, which its job
+processes inherit as METRICS_WORKER_ID. The JSON lines cover every process;
+aggregate them with
+
+    python turn_metrics.py report agent.log
+
+to get p50/p95/p99 per stage, per room and per worker.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+logger = logging.getLogger("turn-metrics")
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PUBLISH_INTERVAL_S = float(os.getenv("METRICS_PUBLISH_INTERVAL_S", "5"))
+METRICS_RETENTION_S = 300  # after this long unchanged, a job process's file is folded into the worker's totals
+LATENCY_BUCKETS_MS = (25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+SAMPLE_WINDOW = 2048
+
+# Stages in pipeline order, timed from the end of user speech
+TURN_STAGES = (
+    "stt_final",
+    "retrieval_start",
+    "retrieval_end",
+    "llm_first_token",
+    "first_segment",
+    "tts_first_audio",
+    "audio_published",
+)
+
+
+def worker_id() -> str:
+    """The worker label: the worker process's pid, set by serve_metrics before job processes start."""
+    return os.getenv("METRICS_WORKER_ID") or str(os.getpid())
+
+
+def metrics_dir() -> Path:
+    """Directory job processes publish their histograms to (METRICS_DIR); serve_metrics sets a per-worker one."""
+    return Path(os.getenv("METRICS_DIR") or Path(tempfile.gettempdir()) / "voice-agent-metrics")
+
+
+def percentile(values: list, q: float):
+    """Nearest-rank percentile of values (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def distribution(values: list) -> dict:
+    """p50/p95/p99, mean and count of values, or {} if there are none."""
+    if not values:
+        return {}
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 1),
+        "n": len(values),
+    }
+
+
+class LatencyHistogram:
+    """Cumulative Prometheus histogram plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value_ms: float):
+        for i, bound in enumerate(self.buckets):
+            if value_ms <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value_ms
+        self.samples.append(value_ms)
+
+
+class MetricsRegistry:
+    """Histogram families keyed by label values; rendered in Prometheus text format."""
+
+    FAMILIES = {
+        "voice_turn_stage_ms": ("stage", "Time from end of user speech to each pipeline stage, in ms"),
+        "voice_provider_latency_ms": ("metric", "Latency reported by the STT/LLM/TTS providers, in ms"),
+        "voice_event_loop_lag_ms": ("scope", "Worst event-loop lag during each turn, in ms"),
+    }
+
+    def __init__(self):
+        self._histograms = defaultdict(LatencyHistogram)  # (family, label, room) -> LatencyHistogram
+
+    def observe(self, family: str, label: str, room: str, value_ms: float):
+        self._histograms[(family, label, room)].observe(value_ms)
+
+    def snapshot(self) -> list:
+        """[[family, label, room, bucket counts, count, sum]] of every histogram, for merge()."""
+        return [
+            [family, label, room, list(histogram.counts), histogram.count, histogram.sum]
+            for (family, label, room), histogram in self._histograms.items()
+        ]
+
+    def merge(self, snapshot: list):
+        """Add another registry's snapshot() to these histograms (percentile samples are not carried)."""
+        for family, label, room, counts, count, total in snapshot:
+            histogram = self._histograms[(family, label, room)]
+            if len(counts) != len(histogram.counts):
+                continue  # written with other buckets
+            histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+            histogram.count += count
+            histogram.sum += total
+
+    def percentiles(self, family: str, room: str = None) -> dict:
+        """{label: {p50, p95, p99}} for a family, optionally for one room only."""
+        merged = defaultdict(list)
+        for (fam, label, hist_room), histogram in self._histograms.items():
+            if fam == family and room in (None, hist_room):
+                merged[label].extend(histogram.samples)
+        return {label: {f"p{q}": percentile(values, q) for q in (50, 95, 99)} for label, values in merged.items()}
+
+    def render(self, worker: str = None) -> str:
+        worker = _escape(worker or worker_id())
+        lines = []
+        for family, (label_name, help_text) in self.FAMILIES.items():
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} histogram")
+            for (fam, label, room), histogram in sorted(self._histograms.items()):
+                if fam != family:
+                    continue
+                labels = f'{label_name}="{label}",room="{_escape(room)}",worker="{worker}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{family}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{family}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{family}_sum{{{labels}}} {histogram.sum:.3f}")
+                lines.append(f"{family}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+
+class TurnTracker:
+    """Timestamps the stages of each turn in one session.
+
+    A turn opens when the user stops speaking and closes when the agent
+    starts speaking. Marks outside an open turn (the greeting) are ignored.
+    """
+
+    def __init__(self, room: str, registry: MetricsRegistry = REGISTRY, lag=None):
+        self.room = room
+        self.registry = registry
+        self.lag = lag  # worker_load.LoopLagMonitor of the session's event loop
+        self.turns = 0
+        self.completed = []  # stage offsets (ms) of each finished turn
+        self._speech_end = None
+        self._stages = {}
+
+    def start_turn(self):
+        self._speech_end = time.perf_counter()
+        self._stages = {}
+
+    def mark(self, stage: str):
+        if self._speech_end is not None:
+            self._stages.setdefault(stage, time.perf_counter())
+
+    def finish_turn(self):
+        if self._speech_end is None:
+            return
+        self.mark("audio_published")
+        offsets = {stage: round((at - self._speech_end) * 1000, 1) for stage, at in self._stages.items()}
+        for stage, offset_ms in offsets.items():
+            self.registry.observe("voice_turn_stage_ms", stage, self.room, offset_ms)
+        if self.lag is not None:
+            offsets["loop_lag_max_ms"] = round(self.lag.max_since(self._speech_end), 1)
+            self.registry.observe("voice_event_loop_lag_ms", "turn", self.room, offsets["loop_lag_max_ms"])
+        self._speech_end = None
+        self.turns += 1
+        self.completed.append(offsets)
+        logger.info(
+            json.dumps({"event": "turn", "room": self.room, "worker": worker_id(), "turn": self.turns, **offsets})
+        )
+
+    def on_provider_metrics(self, metrics):
+        """Record provider-reported latencies (wire to AgentSession's metrics_collected event)."""
+        for attr, name in (
+            ("ttft", "llm_ttft"),
+            ("ttfb", "tts_ttfb"),
+            ("end_of_utterance_delay", "eou_delay"),
+            ("transcription_delay", "stt_transcription_delay"),
+        ):
+            value = getattr(metrics, attr, None)
+            if value is not None and value >= 0:
+                self.registry.observe("voice_provider_latency_ms", name, self.room, value * 1000)
+
+    def on_user_state(self, ev):
+        if ev.old_state == "speaking" and ev.new_state != "speaking":
+            self.start_turn()
+
+    def on_agent_state(self, ev):
+        if ev.new_state == "speaking":
+            self.finish_turn()
+
+    async def aclose(self):
+        """Log this room's per-stage percentiles as one JSON line (register as a shutdown callback)."""
+        if self.turns:
+            summary = self.registry.percentiles("voice_turn_stage_ms", room=self.room)
+            logger.info(
+                json.dumps(
+                    {"event": "session", "room": self.room, "worker": worker_id(), "turns": self.turns, "stages": summary}
+                )
+            )
+
+
+# ============================================
+# Metrics endpoint
+# ============================================
+class MetricsPublisher:
+    """Writes this job process's histograms to METRICS_DIR, where the worker's endpoint reads them."""
+
+    def __init__(
+        self,
+        registry: MetricsRegistry = REGISTRY,
+        directory: Path = None,
+        interval_s: float = METRICS_PUBLISH_INTERVAL_S,
+    ):
+        self.registry = registry
+        self.path = (directory or metrics_dir()) / f"{os.getpid()}.json"
+        self.interval_s = interval_s
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            await self.publish()
+
+    async def publish(self):
+        # Snapshot on the event loop, which is where histograms are updated
+        data = {"time": time.time(), "histograms": self.registry.snapshot()}
+        try:
+            await asyncio.to_thread(self._write, data)
+        except OSError:
+            logger.exception("Failed to publish metrics")
+
+    def _write(self, data: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        """Publish every interval; a no-op with METRICS_PORT=0."""
+        if METRICS_PORT > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Publish once more and stop (register as a shutdown callback); the file outlives the job briefly."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.publish()
+
+
+# Worker side: histograms of job processes whose files have expired. Series are labelled by room,
+# not job, so a room used by job after job shares them; exported counts must never go down.
+_RETIRED = MetricsRegistry()
+
+
+def collect(directory: Path = None, retired: MetricsRegistry = _RETIRED) -> MetricsRegistry:
+    """The histograms of every job process that published to directory, plus those retired so far.
+
+    A file unchanged for METRICS_RETENTION_S (its process has exited) is
+    added to retired and removed.
+    """
+    registry = MetricsRegistry()
+    registry.merge(retired.snapshot())
+    now = time.time()
+    for path in (directory or metrics_dir()).glob("*.json"):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # being replaced or removed
+        registry.merge(data["histograms"])
+        if now - data.get("time", 0) > METRICS_RETENTION_S:
+            retired.merge(data["histograms"])
+            path.unlink(missing_ok=True)
+    return registry
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else ""
+        if path.split("?")[0] == "/metrics":
+            status, body = "200 OK", collect().render()
+        else:
+            status, body = "404 Not Found", "not found\n"
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _serve(port: int):
+    try:
+        server = await asyncio.start_server(_handle_http, METRICS_HOST, port)
+    except OSError as e:
+        logger.warning(f"Cannot serve metrics on port {port} ({e}), endpoint disabled")
+        return
+    logger.info(f"Metrics endpoint on http://{METRICS_HOST}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+def serve_metrics(port: int = METRICS_PORT):
+    """Serve the worker's merged /metrics from a background thread; call in the worker process before it starts jobs.
+
+    A no-op with METRICS_PORT=0.
+    """
+    if port <= 0:
+        return
+    # Job processes inherit these: one directory and one worker label per worker on the host
+    os.environ.setdefault("METRICS_WORKER_ID", str(os.getpid()))
+    if not os.getenv("METRICS_DIR"):
+        os.environ["METRICS_DIR"] = str(Path(tempfile.gettempdir()) / f"voice-agent-metrics-{os.getpid()}")
+    threading.Thread(target=asyncio.run, args=(_serve(port),), daemon=True, name="metrics-endpoint").start()
+
+
+# ============================================
+# Log report
+# ============================================
+_JSON_IN_LINE = re.compile(r"\{.*\}\s*$")
+
+
+def report(paths: list) -> str:
+    """Percentiles per stage overall, per room and per worker from turn-metrics JSON log lines."""
+    by_group = defaultdict(lambda: defaultdict(list))
+    for path in paths:
+        with open(path, errors="replace") as f:
+            for line in f:
+                if "turn-metrics" not in line or '"event": "turn"' not in line:
+                    continue
+                match = _JSON_IN_LINE.search(line)
+                if not match:
+                    continue
+                turn = json.loads(match.group())
+                for stage in TURN_STAGES + ("loop_lag_max_ms",):
+                    if stage in turn:
+                        for group in ("all", f"room {turn['room']}", f"worker {turn['worker']}"):
+                            by_group[group][stage].append(turn[stage])
+
+    lines = []
+    for group, stages in by_group.items():
+        lines.append(f"{group} ({len(stages.get('audio_published', []))} turns)")
+        for stage in TURN_STAGES + ("loop_lag_max_ms",):
+            values = stages.get(stage)
+            if values:
+                p50, p95, p99 = (percentile(values, q) for q in (50, 95, 99))
+                lines.append(f"  {stage:<16} p50 {p50:8.1f}ms  p95 {p95:8.1f}ms  p99 {p99:8.1f}ms  (n={len(values)})")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "report":
+        print("usage: python turn_metrics.py report LOGFILE [LOGFILE ...]")
+        sys.exit(1)
+    print(report(sys.argv[2:]))
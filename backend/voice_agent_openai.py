@@ -1,9 +1,9 @@
+import asyncio
 import logging
 import os
 import ssl
 import sys
 import warnings
-from pathlib import Path
 
 # Suppress Pydantic warning about validate_default
 warnings.filterwarnings("ignore", message=".*validate_default.*")
@@ -14,22 +14,25 @@ except ImportError:
     certifi = None
 from dotenv import load_dotenv
 
-from livekit.agents import JobContext, JobProcess, WorkerOptions, cli
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, utils
 from livekit.agents.job import AutoSubscribe
-from livekit.agents.llm import ChatContext
+from livekit.agents.llm import ChatContext, ChatMessage, StopResponse
 # from livekit.agents.pipeline import VoicePipelineAgent # Removed in 1.0
-from livekit.plugins import cartesia, deepgram, silero, openai
-
-from llama_index.llms.openai_like import OpenAILike
-from llama_index.core import (
-    SimpleDirectoryReader,
-    StorageContext,
-    VectorStoreIndex,
-    load_index_from_storage,
-    Settings,
-)
-from llama_index.core.chat_engine.types import ChatMode
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+# LiveKit Agents 1.2+ uses Agent + AgentSession
+from livekit.agents.voice import Agent as VoiceAgent, AgentSession
+from livekit.plugins import silero
+
+import rag_index
+from context_budget import HistoryBudget
+from faq_index import QUESTION_LOG
+from index_pool import select_corpus
+from provider_pool import ProviderPool
+from query_cache import RESPONSE_CACHE_ENABLED
+from retrieval import SPECULATIVE_RETRIEVAL, SpeculativeRetriever, TurnRetriever
+from speech_segmenter import segment_speech
+from tts_cache import TTS_CACHE_ENABLED, TTS_CACHE_MEMORY_ENTRIES, TTSAudioCache
+from turn_metrics import MetricsPublisher, TurnTracker, serve_metrics
+from worker_load import LOAD_THRESHOLD, SessionLoadReporter, WorkerLoad
 
 # Load environment variables
 load_dotenv()
@@ -108,11 +111,11 @@ validate_env_vars()
 # --- Configuration ---
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 CARTESIA_VOICE_ID = os.getenv("CARTESIA_VOICE_ID", "bf0a246a-8642-498a-9950-80c35e9276b5")
+TTS_MODEL = "sonic-2"
+LLM_MODEL = "openai/gpt-4o-mini"
+GREETING = "Hey there! How can I help you today?"
 
-# Resolve paths relative to this file
-CURRENT_DIR = Path(__file__).parent
-PERSIST_DIR = CURRENT_DIR / "../chat-engine-storage"
-DOCS_DIR = CURRENT_DIR / "../docs"
+DOCS_DIR = rag_index.DOCS_DIR
 
 # Validate docs directory exists
 if not DOCS_DIR.exists():
@@ -120,104 +123,262 @@ if not DOCS_DIR.exists():
     DOCS_DIR.mkdir(parents=True, exist_ok=True)
 
 
-# Configure Models
-logger.info("Loading embedding model...")
-embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
-logger.info("Embedding model loaded.")
-llm = OpenAILike(
-    model="openai/gpt-4o-mini",
-    api_base="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY,
-    is_chat_model=True,
-)
-Settings.llm = llm
-Settings.embed_model = embed_model
-
-# check if storage already exists
-if not PERSIST_DIR.exists():
-    logger.info(f"Creating new index from documents in '{DOCS_DIR}'...")
-    # load the documents and create the index
-    if not DOCS_DIR.exists():
-        logger.error(f"Docs directory not found at {DOCS_DIR}")
-        sys.exit(1)
-        
-    documents = SimpleDirectoryReader(str(DOCS_DIR)).load_data()
-    logger.info(f"Loaded {len(documents)} documents.")
-    index = VectorStoreIndex.from_documents(documents)
-    logger.info("Index created.")
-    # store it for later
-    index.storage_context.persist(persist_dir=str(PERSIST_DIR))
-    logger.info("Index persisted to storage.")
-else:
-    logger.info("Loading existing index from storage...")
-    # load the existing index
-    storage_context = StorageContext.from_defaults(persist_dir=str(PERSIST_DIR))
-    index = load_index_from_storage(storage_context)
-    logger.info("Index loaded.")
+# The embedding model and each corpus's index are loaded lazily by the IndexPool
+# (index_pool.py), the first time a job needs retrieval, not at import.
+
+
+class RAGAgent(VoiceAgent):
+    """Voice agent that grounds each user turn with context retrieved from the index."""
+
+    def __init__(self, retriever, tracker: TurnTracker, tts_cache: TTSAudioCache = None, **kwargs):
+        super().__init__(**kwargs)
+        self._retriever = retriever
+        self._tracker = tracker
+        self._tts_cache = tts_cache
+        self._pending_answer = None  # (question, embedding) awaiting the LLM's reply
+        self._history = HistoryBudget()
+
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        self._pending_answer = None
+        if self._history.trim(turn_ctx):
+            # Older turns are summarized in this turn's prompt and in the kept history alike
+            await self.update_chat_ctx(turn_ctx)
+        query = new_message.text_content
+        if not query:
+            return
+        hit = self._retriever.match_faq(query)
+        if hit:
+            self._answer_stored("FAQ", *hit)
+        self._tracker.mark("retrieval_start")
+        result = await self._retriever.retrieve(query)
+        self._tracker.mark("retrieval_end")
+        hit = self._retriever.match_faq(query, result.embedding)
+        if hit:
+            self._answer_stored("FAQ", *hit)
+        cache_answer = RESPONSE_CACHE_ENABLED and bool(result.nodes)
+        if cache_answer:
+            hit = await self._retriever.lookup_answer(result.embedding)
+            if hit:
+                self._answer_stored("Answer cache", *hit)
+        if cache_answer or QUESTION_LOG:
+            self._pending_answer = (query, result.embedding if cache_answer else None)
+        if result.nodes:
+            # Only this turn's context gets the retrieved text; it is not kept in the history
+            turn_ctx.add_message(
+                role="assistant",
+                content=f"Relevant information from the knowledge base:\n{result.context_text()}",
+            )
+
+    def _answer_stored(self, source: str, answer: str, similarity: float):
+        """Speak a stored answer (pre-synthesized when cached) instead of calling the LLM."""
+        logger.info(f"{source} hit (similarity {similarity:.3f}), skipping LLM")
+        say(self.session, answer, self._tts_cache)
+        raise StopResponse()
+
+    async def tts_node(self, text, model_settings):
+        """Send the reply to TTS one cleaned sentence or clause at a time.
+
+        Each segment is flushed as soon as it is complete, so synthesis of the
+        first clause starts while the LLM is still generating the rest.
+        """
+        segments = segment_speech(text, times=self._tracker)
+        tts = self.session.tts
+        if not tts.capabilities.streaming:
+            async for frame in VoiceAgent.default.tts_node(self, segments, model_settings):
+                self._tracker.mark("tts_first_audio")
+                yield frame
+        else:
+            async with tts.stream(conn_options=self.session.conn_options.tts_conn_options) as stream:
+
+                async def forward_segments():
+                    async for segment in segments:
+                        stream.push_text(segment)
+                        stream.flush()
+                    stream.end_input()
+
+                forward_task = asyncio.create_task(forward_segments())
+                try:
+                    async for ev in stream:
+                        self._tracker.mark("tts_first_audio")
+                        yield ev.frame
+                finally:
+                    await utils.aio.cancel_and_wait(forward_task)
+
+    def on_conversation_item(self, ev):
+        """Cache and log the reply to the last question the LLM answered (wire to conversation_item_added)."""
+        item = ev.item
+        if getattr(item, "role", None) != "assistant" or self._pending_answer is None:
+            return
+        question, embedding = self._pending_answer
+        self._pending_answer = None
+        if not item.interrupted and item.text_content:
+            asyncio.create_task(self._retriever.store_answer(question, embedding, item.text_content))
+            asyncio.create_task(self._retriever.log_answer(question, item.text_content))
+
+
+def say(session: AgentSession, text: str, tts_cache: TTSAudioCache = None, **kwargs):
+    """session.say(), playing pre-synthesized audio from tts_cache when available."""
+    if tts_cache is not None:
+        kwargs["audio"] = tts_cache.audio(session.tts, text)
+    return session.say(text, **kwargs)
 
 
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.vad.VAD.load()
+    # Provider connections open on the job's event loop, which starts after prewarm
+    proc.userdata["providers"] = ProviderPool(
+        LLM_MODEL, OPENROUTER_API_KEY, TTS_MODEL, CARTESIA_VOICE_ID, http_proxy=proc.http_proxy
+    )
+    if TTS_CACHE_ENABLED:
+        # Fixed utterances are in memory before the first participant joins
+        tts_cache = TTSAudioCache(TTS_MODEL, CARTESIA_VOICE_ID)
+        tts_cache.preload([GREETING])
+        proc.userdata["tts_cache"] = tts_cache
 
 
-async def entrypoint(ctx: JobContext):
-    logger.info(f"Entrypoint triggered for room {ctx.room.name}")
+def create_session(vad, providers: ProviderPool) -> AgentSession:
+    """AgentSession with the production STT, LLM and TTS providers, borrowed warm from the process's pool."""
+    # LLM: OpenAI plugin with OpenRouter as base URL
+    stt, llm, tts = providers.borrow()
+    return AgentSession(vad=vad, stt=stt, llm=llm, tts=tts)
 
+
+async def start_agent(
+    session: AgentSession,
+    retriever: TurnRetriever,
+    tracker: TurnTracker,
+    tts_cache: TTSAudioCache = None,
+    room=None,
+) -> RAGAgent:
+    """Wire the RAG agent's retrieval, caching and metrics hooks into session, start it and greet.
+
+    Shared by the LiveKit entrypoint and the offline benchmark (bench_e2e.py).
+    """
     # Create chat context and add system message
     chat_context = ChatContext()
     chat_context.add_message(
         role="system",
         content="You are a funny, witty assistant. Respond with short and concise answers. Avoid using unpronouncable punctuation or emojis."
     )
-    
-    chat_engine = index.as_chat_engine(chat_mode=ChatMode.CONTEXT)
 
-    logger.info(f"Connecting to room {ctx.room.name}")
-    await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
-
-    participant = await ctx.wait_for_participant()
-    logger.info(f"Starting voice assistant for participant {participant.identity}")
-
-    # LiveKit Agents 1.2+ uses Agent + AgentSession
-    from livekit.agents.voice import Agent as VoiceAgent, AgentSession
+    speculative = SpeculativeRetriever(retriever) if SPECULATIVE_RETRIEVAL else None
 
     # Agent has instructions and chat_ctx
-    agent = VoiceAgent(
+    agent = RAGAgent(
+        retriever=speculative or retriever,
+        tracker=tracker,
+        tts_cache=tts_cache,
         instructions="You are a funny, witty assistant. Respond with short and concise answers. Avoid using unpronouncable punctuation or emojis.",
         chat_ctx=chat_context,
     )
 
-    # AgentSession handles the audio components
-    # Use OpenAI plugin with OpenRouter as base URL
-    session = AgentSession(
-        vad=ctx.proc.userdata["vad"],
-        stt=deepgram.STT(),
-        llm=openai.LLM(
-            model="openai/gpt-4o-mini",
-            base_url="https://openrouter.ai/api/v1",
-            api_key=OPENROUTER_API_KEY,
-        ),
-        tts=cartesia.TTS(
-            model="sonic-2",
-            voice=CARTESIA_VOICE_ID,
-        ),
-    )
+    if speculative:
+        # Retrieve on stable interim transcripts while the user is still talking
+        session.on(
+            "user_input_transcribed",
+            lambda ev: speculative.on_transcript(ev.transcript, ev.is_final),
+        )
+
+    # Barge-in: LiveKit starts the next turn's on_user_turn_completed only once the previous
+    # one returns, so its lookups still running when the user speaks again would delay it
+    def on_barge_in(ev):
+        if ev.new_state == "speaking" and session.agent_state in ("thinking", "speaking"):
+            (speculative or retriever).cancel()
+
+    session.on("user_state_changed", on_barge_in)
+
+    if RESPONSE_CACHE_ENABLED or QUESTION_LOG:
+        session.on("conversation_item_added", agent.on_conversation_item)
+
+    # Per-turn latency: end of user speech -> ... -> first agent audio in the room
+    session.on("user_state_changed", tracker.on_user_state)
+    session.on("agent_state_changed", tracker.on_agent_state)
+    session.on("metrics_collected", lambda ev: tracker.on_provider_metrics(ev.metrics))
+    session.on("user_input_transcribed", lambda ev: ev.is_final and tracker.mark("stt_final"))
 
     # Start the session (returns RunResult or None)
-    await session.start(agent, room=ctx.room)
-    
+    if room is not None:
+        await session.start(agent, room=room)
+    else:
+        # Offline runs (bench_e2e.py) set session.input/output themselves
+        await session.start(agent)
+
     logger.info("Agent session started, sending greeting...")
-    await session.say(
-        "Hey there! How can I help you today?",
-        allow_interruptions=True,
-    )
+    await say(session, GREETING, tts_cache, allow_interruptions=True)
+    return agent
+
+
+async def entrypoint(ctx: JobContext):
+    logger.info(f"Entrypoint triggered for room {ctx.room.name}")
+
+    # CPU, in-flight retrieval and event-loop lag of this job, for the worker's load_fnc
+    load_reporter = SessionLoadReporter()
+    load_reporter.start()
+    ctx.add_shutdown_callback(load_reporter.aclose)
+
+    # Connect to STT, LLM and TTS while the room connects and the participant joins
+    providers = ctx.proc.userdata["providers"]
+    providers.start()
+    ctx.add_shutdown_callback(providers.aclose)
+
+    # Load the room's index off the event loop while we connect; a no-op if this
+    # process already holds it. Turns before it is ready go without context.
+    retriever = TurnRetriever(corpus=select_corpus(ctx.room.name))
+    tts_cache = ctx.proc.userdata.get("tts_cache")
+
+    async def load_retriever(corpus: str):
+        loaded = await asyncio.to_thread(retriever.load, corpus)
+        # Attached on the event loop, and only while corpus is still the session's, so
+        # a load for the room name's corpus never serves another tenant's FAQ answers
+        if not retriever.attach(corpus, loaded):
+            return
+        faq = loaded[0]
+        if tts_cache is not None and faq is not None:
+            # FAQ answers this host has already synthesized play from memory; half the
+            # in-memory entries, so replayed answers and the greeting still fit
+            await asyncio.to_thread(tts_cache.preload, faq.answers[:TTS_CACHE_MEMORY_ENTRIES // 2])
+
+    index_task = asyncio.create_task(load_retriever(retriever.corpus))
+    ctx.add_shutdown_callback(retriever.aclose)
+
+    logger.info(f"Connecting to room {ctx.room.name}")
+    await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
+
+    participant = await ctx.wait_for_participant()
+    logger.info(f"Starting voice assistant for participant {participant.identity}")
+    corpus = select_corpus(ctx.room.name, participant.metadata)
+    if corpus != retriever.corpus:
+        # The participant's metadata names another knowledge base than the room name. The
+        # first load's result is discarded; its index is evicted from the pool when memory runs short.
+        retriever.corpus = corpus
+        index_task.cancel()
+        index_task = asyncio.create_task(load_retriever(corpus))
+
+    tracker = TurnTracker(ctx.room.name, lag=load_reporter.lag)
+    ctx.add_shutdown_callback(tracker.aclose)
+    # Histograms go to the worker process, which serves every job's at one /metrics endpoint
+    metrics_publisher = MetricsPublisher()
+    metrics_publisher.start()
+    ctx.add_shutdown_callback(metrics_publisher.aclose)
+
+    # AgentSession handles the audio components
+    session = create_session(ctx.proc.userdata["vad"], providers)
+    await start_agent(session, retriever, tracker, tts_cache, room=ctx.room)
+    try:
+        await index_task
+    except Exception:
+        logger.exception("Failed to load RAG index, answering without retrieval")
 
 
 if __name__ == "__main__":
     logger.info("Starting voice agent...")
+    serve_metrics()
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
             prewarm_fnc=prewarm,
+            # Stop taking rooms before CPU, event-loop lag or RAG_MAX_SESSIONS degrade live calls
+            load_fnc=WorkerLoad(),
+            load_threshold=LOAD_THRESHOLD,
         ),
     )
\ No newline at end of file
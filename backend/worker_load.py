@@ -0,0 +1,257 @@
+"""
+Worker load reporting and admission control.
+
+LiveKit offers a room to a worker only while the load its load_fnc reports
+is below WorkerOptions.load_threshold. The default load is host CPU alone,
+which climbs only once the CPU is already saturated, and by then VAD and
+turn latency suffer in every call on the host. WorkerLoad reports the
+highest of four signals, each scaled so that reaching its limit equals the
+threshold:
+
+- CPU: host CPU use (cgroup aware), or the summed CPU of the sessions' job
+  processes if that is higher
+- sessions: active jobs against RAG_MAX_SESSIONS
+- event-loop lag: the worst session's p95 lag against RAG_LOAD_LAG_MS
+- in-flight retrieval (query embedding and search): mean concurrent
+  retrievals of all sessions against RAG_LOAD_INFLIGHT_PER_CORE per core
+
+Each job process runs a SessionLoadReporter that writes its CPU, in-flight
+retrieval and lag to a small JSON file in RAG_LOAD_DIR every
+RAG_LOAD_REPORT_INTERVAL_S; the worker process reads them in load_fnc.
+Find the limits for a host with `python bench_e2e.py --soak`.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger("worker-load")
+
+LOAD_THRESHOLD = float(os.getenv("RAG_LOAD_THRESHOLD", "0.7"))
+MAX_SESSIONS = int(os.getenv("RAG_MAX_SESSIONS", "0"))  # 0: no limit
+LOAD_LAG_MS = float(os.getenv("RAG_LOAD_LAG_MS", "50"))
+LOAD_INFLIGHT_PER_CORE = float(os.getenv("RAG_LOAD_INFLIGHT_PER_CORE", "2"))
+LOAD_REPORT_INTERVAL_S = float(os.getenv("RAG_LOAD_REPORT_INTERVAL_S", "1"))
+LAG_SAMPLE_INTERVAL_S = 0.1
+LAG_WINDOW = 50  # samples in the lag p95 (5s)
+STALE_REPORTS = 3  # report intervals after which a job process's report is ignored
+
+
+def load_dir() -> Path:
+    """Directory job processes report to (RAG_LOAD_DIR); WorkerLoad sets a per-worker one before they start."""
+    return Path(os.getenv("RAG_LOAD_DIR") or Path(tempfile.gettempdir()) / "voice-agent-load")
+
+
+# ============================================
+# Job process side
+# ============================================
+class InflightCounter:
+    """Counts work in progress and integrates it over time, for the mean concurrency of a window."""
+
+    def __init__(self):
+        self.active = 0
+        self._busy = 0.0
+        self._last = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _update(self, delta: int):
+        with self._lock:
+            now = time.perf_counter()
+            self._busy += self.active * (now - self._last)
+            self._last = now
+            self.active += delta
+
+    @contextmanager
+    def track(self):
+        self._update(1)
+        try:
+            yield
+        finally:
+            self._update(-1)
+
+    def busy_seconds(self) -> float:
+        """Sum over time of the work in progress: its delta over a window / the window = mean concurrency."""
+        with self._lock:
+            return self._busy + self.active * (time.perf_counter() - self._last)
+
+
+# Retrievals (embedding + search) in progress in this process
+INFLIGHT = InflightCounter()
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a sleeping task: a direct sign of CPU starvation."""
+
+    def __init__(self, interval_s: float = LAG_SAMPLE_INTERVAL_S, window: int = LAG_WINDOW):
+        self.interval_s = interval_s
+        self.samples = deque(maxlen=window)  # ms
+        self._times = deque(maxlen=window)  # perf_counter of each sample
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            now = time.perf_counter()
+            self.samples.append(max(0.0, (now - start - self.interval_s) * 1000))
+            self._times.append(now)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def p95(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def clear(self):
+        self.samples.clear()
+        self._times.clear()
+
+    def max_since(self, start: float) -> float:
+        """Worst lag (ms) of the samples taken since perf_counter() was start, e.g. during one turn."""
+        return max((lag for at, lag in zip(self._times, self.samples) if at >= start), default=0.0)
+
+
+class SessionLoadReporter:
+    """Publishes this job process's CPU, in-flight retrieval and event-loop lag for the worker's load_fnc."""
+
+    def __init__(self, directory: Path = None, interval_s: float = LOAD_REPORT_INTERVAL_S):
+        self.path = (directory or load_dir()) / f"{os.getpid()}.json"
+        self.interval_s = interval_s
+        self.lag = LoopLagMonitor()
+        self._task = None
+
+    async def _run(self):
+        last_wall, last_cpu, last_busy = time.perf_counter(), time.process_time(), INFLIGHT.busy_seconds()
+        while True:
+            await asyncio.sleep(self.interval_s)
+            wall, cpu, busy = time.perf_counter(), time.process_time(), INFLIGHT.busy_seconds()
+            elapsed = wall - last_wall
+            report = {
+                "pid": os.getpid(),
+                "time": time.time(),
+                "cpu": round((cpu - last_cpu) / elapsed, 3),  # cores
+                "inflight": round((busy - last_busy) / elapsed, 3),
+                "lag_ms": round(self.lag.p95(), 1),
+            }
+            last_wall, last_cpu, last_busy = wall, cpu, busy
+            try:
+                await asyncio.to_thread(self._write, report)
+            except OSError:
+                logger.exception("Failed to write load report")
+
+    def _write(self, report: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(report))
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        self.lag.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Stop reporting and remove the report (register as a shutdown callback)."""
+        self.lag.stop()
+        if self._task is not None:
+            self._task.cancel()
+        self.path.unlink(missing_ok=True)
+
+
+# ============================================
+# Worker process side
+# ============================================
+def combine_load(
+    sessions: int,
+    cpu: float,
+    reports: list,
+    cpu_count: float,
+    threshold: float = LOAD_THRESHOLD,
+    max_sessions: int = MAX_SESSIONS,
+    lag_ms: float = LOAD_LAG_MS,
+    inflight_per_core: float = LOAD_INFLIGHT_PER_CORE,
+) -> tuple:
+    """(load, {signal: load}) from the session count, host CPU use (0..1) and the sessions' reports."""
+    components = {
+        "cpu": max(cpu, sum(report["cpu"] for report in reports) / cpu_count),
+        "lag": max((report["lag_ms"] for report in reports), default=0.0) / lag_ms * threshold,
+        "inflight": sum(report["inflight"] for report in reports) / (cpu_count * inflight_per_core) * threshold,
+    }
+    if max_sessions > 0:
+        components["sessions"] = sessions / max_sessions * threshold
+    return min(1.0, max(components.values())), components
+
+
+class WorkerLoad:
+    """load_fnc for WorkerOptions: the highest of the CPU, session, lag and in-flight signals.
+
+    Called by the worker every half second and before accepting a job, so it
+    only reads state: host CPU is sampled by a background thread, and the
+    sessions' numbers come from their reports.
+    """
+
+    def __init__(self, directory: Path = None, threshold: float = LOAD_THRESHOLD, max_sessions: int = MAX_SESSIONS):
+        from livekit.agents.utils.hw import get_cpu_monitor
+
+        if directory is None and not os.getenv("RAG_LOAD_DIR"):
+            # One directory per worker on the host; job processes inherit the variable
+            os.environ["RAG_LOAD_DIR"] = str(Path(tempfile.gettempdir()) / f"voice-agent-load-{os.getpid()}")
+        self.directory = directory or load_dir()
+        self.threshold = threshold
+        self.max_sessions = max_sessions
+        self._cpu_monitor = get_cpu_monitor()
+        self._cpu_samples = deque(maxlen=5)  # 2.5s, as LiveKit's default load
+        self._full = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._sample_cpu, daemon=True, name="worker-load-cpu").start()
+
+    def _sample_cpu(self):
+        while True:
+            sample = self._cpu_monitor.cpu_percent(interval=0.5)
+            with self._lock:
+                self._cpu_samples.append(sample)
+
+    def reports(self) -> list:
+        """Fresh reports of the job processes; stale ones (of crashed processes) are removed."""
+        reports = []
+        now = time.time()
+        for path in self.directory.glob("*.json"):
+            try:
+                report = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # being replaced or removed
+            if now - report.get("time", 0) <= STALE_REPORTS * LOAD_REPORT_INTERVAL_S:
+                reports.append(report)
+            elif now - report.get("time", 0) > 60:
+                path.unlink(missing_ok=True)
+        return reports
+
+    def __call__(self, worker) -> float:
+        with self._lock:
+            cpu = sum(self._cpu_samples) / len(self._cpu_samples) if self._cpu_samples else 0.0
+        sessions = len(worker.active_jobs)
+        load, components = combine_load(
+            sessions, cpu, self.reports(), self._cpu_monitor.cpu_count(), self.threshold, self.max_sessions
+        )
+        full = load >= self.threshold
+        if full != self._full:
+            self._full = full
+            signals = ", ".join(f"{name} {value:.2f}" for name, value in components.items())
+            if full:
+                logger.warning(f"Worker full at {sessions} sessions, not accepting rooms (load {load:.2f}: {signals})")
+            else:
+                logger.info(f"Worker accepting rooms again at {sessions} sessions (load {load:.2f}: {signals})")
+        return load
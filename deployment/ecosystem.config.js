@@ -25,7 +25,10 @@ module.exports = {
       env: {
         ENV: "production",
         PYTHONUNBUFFERED: "1",
-        PYTHONDONTWRITEBYTECODE: "1"
+        PYTHONDONTWRITEBYTECODE: "1",
+        // Job processes query the shared voiceai-retrieval service below
+        // instead of each loading the embedding model and index
+        RAG_RETRIEVAL_SERVICE: "unix:///tmp/voice-rag-retrieval.sock"
       },
 
       // Process management
@@ -44,12 +47,48 @@ module.exports = {
       log_date_format: "YYYY-MM-DD HH:mm:ss Z",
       merge_logs: true,
 
-      // Startup
+      // Startup (the index is built offline by ingest.py, so the worker is ready fast)
       wait_ready: true,
-      listen_timeout: 60000,
       kill_timeout: 10000,
     },
 
+    // ==========================================
+    // Retrieval Service - shared embedding model + index (one per host)
+    // ==========================================
+    {
+      name: "voiceai-retrieval",
+      script: "python",
+      args: "retrieval_service.py",
+      cwd: path.join(__dirname, "..", "backend"),
+      interpreter: "none",
+
+      // Environment
+      env: {
+        ENV: "production",
+        PYTHONUNBUFFERED: "1",
+        PYTHONDONTWRITEBYTECODE: "1",
+        RAG_RETRIEVAL_SERVICE: "unix:///tmp/voice-rag-retrieval.sock"
+      },
+
+      // Process management
+      instances: 1,
+      autorestart: true,
+      watch: false,
+      max_restarts: 10,
+      restart_delay: 5000,
+
+      // Memory management
+      max_memory_restart: "2G",
+
+      // Logging
+      error_file: path.join(__dirname, "..", "logs", "retrieval-error.log"),
+      out_file: path.join(__dirname, "..", "logs", "retrieval-out.log"),
+      log_date_format: "YYYY-MM-DD HH:mm:ss Z",
+      merge_logs: true,
+
+      kill_timeout: 5000,
+    },
+
     // ==========================================
     // Frontend - Next.js Application (Standalone Mode)
     // ==========================================
@@ -100,7 +139,7 @@ module.exports = {
       repo: "git@github.com:your-repo/voice-rag-agent.git",
       path: "/opt/voice-rag-agent",
       "pre-deploy-local": "",
-      "post-deploy": "cd backend && pip install -r requirements.txt && cd ../frontend && npm install && npm run build && pm2 reload ecosystem.config.js --env production",
+      "post-deploy": "cd backend && pip install -r requirements.txt && python ingest.py && cd ../frontend && npm install && npm run build && pm2 reload ecosystem.config.js --env production",
       "pre-setup": ""
     }
   }
@@ -28,5 +28,7 @@ export $(cat "$APP_DIR/.env" | grep -v '^#' | xargs)
 
 # Change to backend directory and start
 cd "$BACKEND_DIR"
+echo "📚 Syncing knowledge base index..."
+python ingest.py
 echo "🎙️  Starting LiveKit Voice Agent..."
 python voice_agent_openai.py start